@@ -0,0 +1,233 @@
+# benchmarks/benchmark.py
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.generador_csv import generar_csv
+
+# Directorio raíz del proyecto, desde el que se lanzan los casos
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Combinaciones de opciones: una por comprobación y una con todas activas.
+# En 'todo' la cabecera esperada es la real del fichero (se lee en ejecutar_caso), para medir
+# la validación completa y no el caso de una cabecera que no coincide.
+COMBINACIONES = {
+    'solo_columnas': {'check_vacias': False, 'check_duplicadas': False},
+    'vacias': {'check_vacias': True, 'check_duplicadas': False},
+    'duplicadas': {'check_vacias': False, 'check_duplicadas': True},
+    'duplicadas_hash': {'check_vacias': False, 'check_duplicadas': True, 'indice_duplicados': 'hash'},
+    'duplicadas_disco': {'check_vacias': False, 'check_duplicadas': True, 'memoria_max_mb': 16},
+    'unicidad': {'check_vacias': False, 'check_duplicadas': False, 'check_uniqueness': True, 'unique_column_name': 'col_0'},
+    'ignore_case': {'check_vacias': True, 'check_duplicadas': True, 'ignore_case': True},
+    'todo': {'check_vacias': True, 'check_duplicadas': True, 'ignore_case': True, 'check_header': True,
+             'expected_headers': None, 'check_uniqueness': True, 'unique_column_name': 'col_0'},
+}
+
+# Operaciones medibles: validación con cada motor o modo, limpieza y previsualización
+OPERACIONES = ('validacion', 'validacion_pandas', 'validacion_bytes', 'bloques', 'limpieza', 'una_pasada', 'previsualizacion')
+
+def _memoria_pico_mb():
+    """Memoria residente máxima del proceso y de sus hijos, en MB (None si no se puede medir)."""
+    if resource is None:
+        return None
+    pico = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux devuelve KB y macOS bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+def ejecutar_caso(operacion, combinacion, ruta_csv, encoding='utf-8', workers=None):
+    """
+    Ejecuta una operación sobre el fichero y mide su tiempo. Se llama en un proceso nuevo por
+    caso (ver medir_caso) para que la memoria pico corresponda solo a esa operación.
+    """
+    import validators
+    import validacion_paralela
+
+    options = dict(COMBINACIONES[combinacion], encoding=encoding)
+    if options.get('check_header') and options.get('expected_headers') is None:
+        options['expected_headers'] = validators.leer_primeras_lineas(ruta_csv, 1, encoding).get('header', [])
+    directorio = tempfile.mkdtemp(prefix="validador_bench_")
+    ruta_destino = os.path.join(directorio, "limpio.csv")
+    if operacion == 'limpieza':
+        # Solo se mide la escritura del CSV limpio, no la validación previa
+        resultados = validators.realizar_validacion_completa(ruta_csv, options)
+
+    inicio = time.perf_counter()
+    if operacion == 'validacion':
+        resultados = validators.realizar_validacion_completa(ruta_csv, options)
+    elif operacion == 'validacion_pandas':
+        resultados = validators.realizar_validacion_completa(ruta_csv, dict(options, engine='pandas'))
+    elif operacion == 'validacion_bytes':
+        resultados = validators.realizar_validacion_completa(ruta_csv, dict(options, engine='bytes'))
+    elif operacion == 'bloques':
+        resultados = validacion_paralela.validar_archivo_por_bloques(ruta_csv, options, max_workers=workers, tam_bloque_minimo=1024 * 1024)
+    elif operacion == 'limpieza':
+        validators.crear_csv_limpio(ruta_csv, ruta_destino, resultados, options)
+    elif operacion == 'una_pasada':
+        resultados, _ = validators.validar_y_limpiar(ruta_csv, ruta_destino, options)
+    elif operacion == 'previsualizacion':
+        resultados = validators.leer_primeras_lineas(ruta_csv, 50, encoding)
+    else:
+        raise ValueError(f"Operación desconocida: '{operacion}'")
+    segundos = time.perf_counter() - inicio
+
+    if os.path.exists(ruta_destino):
+        os.remove(ruta_destino)
+    os.rmdir(directorio)
+    return {
+        'segundos': segundos,
+        'memoria_pico_mb': _memoria_pico_mb(),
+        'error': resultados.get('error_lectura') or resultados.get('error'),
+    }
+
+def medir_caso(operacion, combinacion, ruta_csv, filas, bytes_fichero, repeticiones=1, encoding='utf-8', workers=None):
+    """Ejecuta un caso en procesos independientes 'repeticiones' veces y se queda con la mejor medida."""
+    mejor = None
+    for _ in range(repeticiones):
+        orden = [sys.executable, '-m', 'benchmarks.benchmark', '--caso', operacion, combinacion, ruta_csv, '--encoding', encoding]
+        if workers:
+            orden += ['--workers', str(workers)]
+        proceso = subprocess.run(orden, cwd=RAIZ, capture_output=True, text=True)
+        if proceso.returncode != 0:
+            return {'operacion': operacion, 'combinacion': combinacion, 'error': proceso.stderr.strip().splitlines()[-1:]}
+        medida = json.loads(proceso.stdout.strip().splitlines()[-1])
+        if mejor is None or medida['segundos'] < mejor['segundos']:
+            mejor = medida
+
+    segundos = max(mejor['segundos'], 1e-9)
+    mejor.update({
+        'operacion': operacion,
+        'combinacion': combinacion,
+        'filas_por_segundo': filas / segundos if operacion != 'previsualizacion' else None,
+        'mb_por_segundo': bytes_fichero / (1024 * 1024) / segundos if operacion != 'previsualizacion' else None,
+    })
+    return mejor
+
+def _formatear(valor, formato):
+    return "n/d" if valor is None else format(valor, formato)
+
+def imprimir_tabla(medidas, referencia=None):
+    """Muestra las medidas y, si hay una ejecución de referencia, la variación de tiempo respecto a ella."""
+    anteriores = {(m['operacion'], m['combinacion']): m for m in (referencia or [])}
+    cabecera = f"{'operación':<20} {'combinación':<18} {'segundos':>9} {'filas/s':>12} {'MB/s':>8} {'RSS pico MB':>12}"
+    if referencia:
+        cabecera += f" {'vs. ref.':>9}"
+    print(cabecera)
+    print("-" * len(cabecera))
+    for m in medidas:
+        if m.get('error') and 'segundos' not in m:
+            print(f"{m['operacion']:<20} {m['combinacion']:<18} ERROR: {m['error']}")
+            continue
+        linea = (f"{m['operacion']:<20} {m['combinacion']:<18} {m['segundos']:>9.3f} "
+                 f"{_formatear(m['filas_por_segundo'], ',.0f'):>12} {_formatear(m['mb_por_segundo'], '.1f'):>8} "
+                 f"{_formatear(m['memoria_pico_mb'], '.1f'):>12}")
+        anterior = anteriores.get((m['operacion'], m['combinacion']))
+        if anterior and anterior.get('segundos'):
+            linea += f" {(m['segundos'] / anterior['segundos'] - 1) * 100:>+8.1f}%"
+        if m.get('error'):
+            linea += f"  (aviso: {m['error']})"
+        print(linea)
+
+def buscar_regresiones(medidas, referencia, umbral_pct):
+    """Devuelve las medidas cuyo tiempo empeora más de 'umbral_pct' % respecto a la referencia."""
+    anteriores = {(m['operacion'], m['combinacion']): m for m in referencia}
+    regresiones = []
+    for m in medidas:
+        anterior = anteriores.get((m['operacion'], m['combinacion']))
+        if anterior and anterior.get('segundos') and m.get('segundos'):
+            if m['segundos'] > anterior['segundos'] * (1 + umbral_pct / 100):
+                regresiones.append(m)
+    return regresiones
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.benchmark",
+        description="Mide el rendimiento de la validación, la limpieza y la previsualización sobre un CSV sintético."
+    )
+    parser.add_argument('--fichero', help="CSV a medir. Si no se indica, se genera uno sintético con las opciones de abajo.")
+    parser.add_argument('--filas', type=int, default=200000)
+    parser.add_argument('--columnas', type=int, default=8)
+    parser.add_argument('--ancho-celda', type=int, default=12)
+    parser.add_argument('--pct-columnas', type=float, default=1.0)
+    parser.add_argument('--pct-duplicadas', type=float, default=2.0)
+    parser.add_argument('--pct-vacias', type=float, default=1.0)
+    parser.add_argument('--pct-saltos', type=float, default=0.5)
+    parser.add_argument('--pct-no-utf8', type=float, default=0.0,
+                        help="Filas con bytes Latin-1. Con un valor > 0 conviene usar --encoding latin-1.")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--operaciones', nargs='+', choices=OPERACIONES, default=['validacion', 'validacion_pandas', 'validacion_bytes', 'limpieza', 'una_pasada', 'previsualizacion'])
+    parser.add_argument('--combinaciones', nargs='+', choices=list(COMBINACIONES), default=list(COMBINACIONES))
+    parser.add_argument('--workers', type=int, help="Procesos para la operación 'bloques' (por defecto, uno por núcleo).")
+    parser.add_argument('--repeticiones', type=int, default=3, help="Se ejecuta cada caso N veces y se usa la mejor.")
+    parser.add_argument('--guardar', metavar='JSON', help="Guarda las medidas en un fichero JSON.")
+    parser.add_argument('--comparar', metavar='JSON', help="Compara con unas medidas guardadas antes con --guardar.")
+    parser.add_argument('--umbral', type=float, default=10.0,
+                        help="Con --comparar, %% de empeoramiento a partir del cual se considera regresión (sale con código 1).")
+    parser.add_argument('--caso', nargs=3, metavar=('OPERACION', 'COMBINACION', 'RUTA'), help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    if args.caso:
+        operacion, combinacion, ruta = args.caso
+        print(json.dumps(ejecutar_caso(operacion, combinacion, ruta, args.encoding, args.workers)))
+        return 0
+
+    directorio_temporal = None
+    if args.fichero:
+        ruta_csv = args.fichero
+        bytes_fichero = os.path.getsize(ruta_csv)
+        with open(ruta_csv, 'rb') as f:
+            filas = sum(1 for _ in f)
+    else:
+        directorio_temporal = tempfile.mkdtemp(prefix="validador_bench_")
+        ruta_csv = os.path.join(directorio_temporal, "sintetico.csv")
+        resumen = generar_csv(ruta_csv, args.filas, args.columnas, args.ancho_celda, args.pct_columnas,
+                              args.pct_duplicadas, args.pct_vacias, args.pct_saltos, args.pct_no_utf8, args.semilla)
+        filas, bytes_fichero = resumen['filas'], resumen['bytes']
+        print(f"CSV sintético: {resumen}")
+    print(f"Fichero: {ruta_csv} ({filas:,} filas, {bytes_fichero / (1024 * 1024):.1f} MB)\n")
+
+    medidas = []
+    try:
+        for operacion in args.operaciones:
+            combinaciones = ['todo'] if operacion == 'previsualizacion' else args.combinaciones
+            for combinacion in combinaciones:
+                medidas.append(medir_caso(operacion, combinacion, ruta_csv, filas, bytes_fichero,
+                                          args.repeticiones, args.encoding, args.workers))
+    finally:
+        if directorio_temporal:
+            os.remove(ruta_csv)
+            os.rmdir(directorio_temporal)
+
+    referencia = None
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            referencia = json.load(f)['medidas']
+    imprimir_tabla(medidas, referencia)
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump({'fichero': ruta_csv, 'filas': filas, 'bytes': bytes_fichero, 'argumentos': vars(args), 'medidas': medidas},
+                      f, ensure_ascii=False, indent=2)
+
+    if referencia:
+        regresiones = buscar_regresiones(medidas, referencia, args.umbral)
+        if regresiones:
+            print(f"\n{len(regresiones)} caso(s) más de un {args.umbral:.0f}% más lentos que la referencia.")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
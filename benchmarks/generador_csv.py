@@ -0,0 +1,94 @@
+# benchmarks/generador_csv.py
+
+import argparse
+import csv
+import io
+import random
+import string
+
+def generar_csv(ruta_csv, filas=100000, columnas=8, ancho_celda=12, pct_columnas_erroneas=1.0,
+                pct_duplicadas=2.0, pct_vacias=1.0, pct_saltos=0.5, pct_no_utf8=0.0, semilla=42):
+    """
+    Genera un CSV sintético y reproducible (misma semilla => mismo fichero byte a byte).
+    Los porcentajes indican la proporción de filas de datos de cada tipo de error:
+    nº de columnas incorrecto, copia de una fila anterior, fila vacía, celda entre comillas
+    con salto de línea interno y celda con bytes que no son UTF-8 (se escribe en Latin-1).
+    La primera columna es un identificador, útil para probar la unicidad.
+    Devuelve un resumen con las filas de cada tipo y el tamaño en bytes.
+    """
+    aleatorio = random.Random(semilla)
+    alfabeto = string.ascii_letters + string.digits + '  '
+    umbrales = []
+    acumulado = 0.0
+    for tipo, pct in (('columnas', pct_columnas_erroneas), ('duplicada', pct_duplicadas), ('vacia', pct_vacias),
+                      ('salto', pct_saltos), ('no_utf8', pct_no_utf8)):
+        acumulado += pct / 100
+        umbrales.append((acumulado, tipo))
+    resumen = {tipo: 0 for _, tipo in umbrales}
+    resumen['correctas'] = 0
+    anteriores = []
+
+    def celda():
+        return ''.join(aleatorio.choices(alfabeto, k=ancho_celda))
+
+    with open(ruta_csv, 'wb') as f:
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer, lineterminator='\n')
+        escritor.writerow([f"col_{i}" for i in range(columnas)])
+        f.write(buffer.getvalue().encode('utf-8'))
+
+        for num in range(filas):
+            buffer.seek(0)
+            buffer.truncate()
+            sorteo = aleatorio.random()
+            tipo = next((t for umbral, t in umbrales if sorteo < umbral), 'correctas')
+            if tipo == 'duplicada' and not anteriores:
+                tipo = 'correctas'
+            codificacion = 'utf-8'
+
+            if tipo == 'duplicada':
+                fila = aleatorio.choice(anteriores)
+            elif tipo == 'columnas':
+                fila = [str(num)] + [celda() for _ in range(max(0, columnas - 1 + aleatorio.choice((-2, -1, 1, 2))))]
+            elif tipo == 'vacia':
+                fila = [''] * columnas
+            else:
+                fila = [str(num)] + [celda() for _ in range(columnas - 1)]
+                if tipo == 'salto' and columnas > 1:
+                    fila[1] = f'{fila[1][:ancho_celda // 2]}\n"{fila[1][ancho_celda // 2:]}"'
+                elif tipo == 'no_utf8' and columnas > 1:
+                    fila[1] = 'ñandú ' + fila[1]
+                    codificacion = 'latin-1'
+                if len(anteriores) < 1000:
+                    anteriores.append(fila)
+                elif aleatorio.random() < 0.01:
+                    anteriores[aleatorio.randrange(len(anteriores))] = fila
+            resumen[tipo] += 1
+
+            escritor.writerow(fila)
+            f.write(buffer.getvalue().encode(codificacion))
+        resumen['bytes'] = f.tell()
+
+    resumen['filas'] = filas + 1
+    return resumen
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un CSV sintético y reproducible para pruebas de rendimiento.")
+    parser.add_argument('ruta', help="Fichero CSV de salida.")
+    parser.add_argument('--filas', type=int, default=100000)
+    parser.add_argument('--columnas', type=int, default=8)
+    parser.add_argument('--ancho-celda', type=int, default=12)
+    parser.add_argument('--pct-columnas', type=float, default=1.0, help="%% de filas con nº de columnas incorrecto.")
+    parser.add_argument('--pct-duplicadas', type=float, default=2.0, help="%% de filas que repiten una anterior.")
+    parser.add_argument('--pct-vacias', type=float, default=1.0, help="%% de filas vacías.")
+    parser.add_argument('--pct-saltos', type=float, default=0.5, help="%% de filas con un salto de línea entre comillas.")
+    parser.add_argument('--pct-no-utf8', type=float, default=0.0, help="%% de filas con bytes que no son UTF-8.")
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    resumen = generar_csv(args.ruta, args.filas, args.columnas, args.ancho_celda, args.pct_columnas,
+                          args.pct_duplicadas, args.pct_vacias, args.pct_saltos, args.pct_no_utf8, args.semilla)
+    print(f"Generado {args.ruta}: {resumen}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# cache_resultados.py
+
+import copy
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import validators
+from claves import nombre_clave, normalizar_claves
+
+logger = logging.getLogger(__name__)
+
+# Cambiar si cambia la estructura de 'resultados', para no reutilizar entradas antiguas
+VERSION_CACHE = 2
+
+TAM_MAX_MB = 256
+# Bloques que se leen para la huella del contenido: el principio, el final y varios intermedios
+TAM_BLOQUE_HUELLA = 64 * 1024
+NUM_BLOQUES_HUELLA = 16
+
+# Opciones que no cambian los resultados (solo cómo se calculan o cómo se escribe el CSV limpio)
+OPCIONES_IGNORADAS = frozenset({'engine', 'indice_duplicados', 'memoria_max_mb', 'directorio_temporal', 'terminador_linea'})
+# Opciones cuyo efecto se puede deducir de unos resultados guardados con otras (ver _derivar).
+# Cualquier otra opción tiene que coincidir exactamente para reutilizar una entrada.
+OPCIONES_DERIVABLES = frozenset({
+    'check_header', 'expected_headers', 'check_vacias', 'check_duplicadas', 'check_uniqueness',
+    'unique_column_name', 'claves_unicas', 'ignore_case', 'max_contenido_por_categoria',
+})
+
+def directorio_por_defecto():
+    """Directorio de la caché: $VALIDADOR_CSV_CACHE o 'validador_csv' dentro de la caché del usuario."""
+    if os.environ.get('VALIDADOR_CSV_CACHE'):
+        return os.environ['VALIDADOR_CSV_CACHE']
+    base = os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'validador_csv')
+
+def huella_fichero(ruta_csv, tam_bloque=TAM_BLOQUE_HUELLA, num_bloques=NUM_BLOQUES_HUELLA):
+    """
+    Identifica el contenido de un fichero sin leerlo entero: ruta absoluta, tamaño, fecha de
+    modificación y un resumen del principio, el final y 'num_bloques' bloques repartidos.
+    Devuelve un hexadecimal; cambia si cambia cualquiera de esos datos.
+    """
+    estado = os.stat(ruta_csv)
+    resumen = hashlib.blake2b(digest_size=16)
+    resumen.update(f"{os.path.abspath(ruta_csv)}\0{estado.st_size}\0{estado.st_mtime_ns}".encode('utf-8'))
+    with open(ruta_csv, 'rb') as f:
+        paso = max(estado.st_size // (num_bloques + 1), tam_bloque)
+        posiciones = list(range(0, estado.st_size, paso)) + [max(0, estado.st_size - tam_bloque)]
+        for posicion in posiciones:
+            f.seek(posicion)
+            resumen.update(f.read(tam_bloque))
+    return resumen.hexdigest()
+
+def _unicidad(options):
+    """Columna de unicidad que se comprueba con estas opciones, o None."""
+    return options.get('unique_column_name') if options.get('check_uniqueness') else None
+
+def _derivar(guardado, guardadas, pedidas):
+    """
+    Adapta unos resultados calculados con las opciones 'guardadas' a las 'pedidas', o devuelve
+    None si hace falta volver a leer el fichero. Se puede reutilizar lo que no requiere más datos:
+    - la cabecera se vuelve a validar con la guardada, así que su comprobación siempre se deriva;
+    - duplicados, unicidad o claves únicas calculados sirven para una petición que no los pide,
+      o que pide solo algunas de las claves (con el mismo criterio de mayúsculas si sí los pide);
+    - si se buscaron filas vacías y no había ninguna, el resultado es el mismo sin buscarlas;
+    - con el contenido de todas las filas guardado se puede aplicar cualquier límite más estricto.
+    """
+    for clave in (set(guardadas) | set(pedidas)) - OPCIONES_IGNORADAS - OPCIONES_DERIVABLES:
+        if guardadas.get(clave) != pedidas.get(clave):
+            return None
+
+    if bool(pedidas.get('check_vacias')) != bool(guardadas.get('check_vacias')):
+        if not (guardadas.get('check_vacias') and not guardado['filas_vacias']):
+            return None
+    mayusculas_iguales = bool(pedidas.get('ignore_case')) == bool(guardadas.get('ignore_case'))
+    if pedidas.get('check_duplicadas') and not (guardadas.get('check_duplicadas') and mayusculas_iguales):
+        return None
+    if _unicidad(pedidas) and not (_unicidad(pedidas) == _unicidad(guardadas) and mayusculas_iguales):
+        return None
+    claves_pedidas = {nombre_clave(clave) for clave in normalizar_claves(pedidas.get('claves_unicas'))}
+    claves_guardadas = {nombre_clave(clave) for clave in normalizar_claves(guardadas.get('claves_unicas'))}
+    if claves_pedidas and not (claves_pedidas <= claves_guardadas and mayusculas_iguales):
+        return None
+    limite_pedido = pedidas.get('max_contenido_por_categoria')
+    limite_guardado = guardadas.get('max_contenido_por_categoria')
+    if limite_guardado is not None and (limite_pedido is None or limite_pedido > limite_guardado):
+        return None
+
+    resultados = copy.deepcopy(guardado)
+    if not pedidas.get('check_vacias'):
+        resultados['filas_vacias'] = []
+    if not pedidas.get('check_duplicadas'):
+        resultados['filas_duplicadas'] = {}
+    if not _unicidad(pedidas):
+        resultados['errores_de_unicidad'] = {}
+    resultados['claves_repetidas'] = [repetida for repetida in resultados['claves_repetidas'] if repetida[0] in claves_pedidas]
+    validators._aplicar_limite_contenido(resultados, pedidas)
+    if resultados['cabecera']:
+        resultados['error_header'] = validators.validar_cabecera(resultados['cabecera'], pedidas)
+    return resultados
+
+class CacheResultados:
+    """
+    Caché en disco de resultados de validación. Cada entrada es un fichero con la huella del CSV,
+    las opciones usadas y los resultados; se busca por huella y después por opciones compatibles.
+    Cuando el total supera 'tam_max_mb' se eliminan las entradas usadas hace más tiempo (la fecha
+    de modificación de cada entrada se actualiza al reutilizarla).
+    Las entradas se guardan con pickle: el directorio debe ser solo del usuario.
+    """
+    def __init__(self, directorio=None, tam_max_mb=TAM_MAX_MB):
+        self.directorio = directorio or directorio_por_defecto()
+        self.tam_max_bytes = int(tam_max_mb * 1024 * 1024)
+
+    def _entradas(self, prefijo=''):
+        try:
+            nombres = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directorio, nombre) for nombre in nombres
+                if nombre.startswith(prefijo) and nombre.endswith('.pickle')]
+
+    def buscar(self, ruta_csv, options, huella=None):
+        """Devuelve los resultados guardados (adaptados a 'options') o None si no hay ninguno aprovechable."""
+        try:
+            huella = huella or huella_fichero(ruta_csv)
+        except OSError:
+            return None
+        # Primero la entrada con las mismas opciones, si existe
+        exacta = os.path.join(self.directorio, f"{huella}_{_resumen_opciones(options)}.pickle")
+        candidatas = sorted(self._entradas(huella), key=lambda ruta: ruta != exacta)
+        for ruta_entrada in candidatas:
+            try:
+                with open(ruta_entrada, 'rb') as f:
+                    entrada = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                logger.warning(f"Se descarta la entrada de caché ilegible {ruta_entrada}.", exc_info=True)
+                _eliminar(ruta_entrada)
+                continue
+            if entrada.get('version') != VERSION_CACHE:
+                continue
+            resultados = _derivar(entrada['resultados'], entrada['opciones'], options)
+            if resultados is not None:
+                try:
+                    os.utime(ruta_entrada)
+                except OSError:
+                    pass
+                resultados['ruta_archivo'] = ruta_csv
+                logger.info(f"Resultados de {ruta_csv} recuperados de la caché ({ruta_entrada}).")
+                return resultados
+        return None
+
+    def guardar(self, ruta_csv, options, resultados, huella=None):
+        """Guarda unos resultados completos. Los cancelados o con error de lectura no se guardan."""
+        if resultados.get('cancelado') or resultados.get('error_lectura'):
+            return
+        try:
+            huella = huella or huella_fichero(ruta_csv)
+            datos = pickle.dumps({'version': VERSION_CACHE, 'opciones': dict(options), 'resultados': resultados},
+                                 protocol=pickle.HIGHEST_PROTOCOL)
+            if len(datos) > self.tam_max_bytes:
+                logger.info(f"Los resultados de {ruta_csv} ocupan más que la caché completa; no se guardan.")
+                return
+            os.makedirs(self.directorio, exist_ok=True)
+            destino = os.path.join(self.directorio, f"{huella}_{_resumen_opciones(options)}.pickle")
+            descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, destino)
+        except OSError:
+            logger.warning(f"No se pudieron guardar en caché los resultados de {ruta_csv}.", exc_info=True)
+            return
+        self.recortar()
+
+    def recortar(self):
+        """Elimina las entradas menos usadas hasta que la caché quepa en 'tam_max_mb'."""
+        entradas = []
+        for ruta_entrada in self._entradas():
+            try:
+                estado = os.stat(ruta_entrada)
+            except OSError:
+                continue
+            entradas.append((estado.st_mtime_ns, estado.st_size, ruta_entrada))
+        total = sum(tam for _, tam, _ in entradas)
+        for _, tam, ruta_entrada in sorted(entradas):
+            if total <= self.tam_max_bytes:
+                break
+            _eliminar(ruta_entrada)
+            total -= tam
+
+    def vaciar(self):
+        for ruta_entrada in self._entradas():
+            _eliminar(ruta_entrada)
+
+def _resumen_opciones(options):
+    relevantes = {clave: valor for clave, valor in options.items() if clave not in OPCIONES_IGNORADAS}
+    return hashlib.blake2b(repr(sorted(relevantes.items())).encode('utf-8'), digest_size=8).hexdigest()
+
+def _eliminar(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
+
+def validar_con_cache(ruta_csv, options, progreso=None, cancelacion=None, cache=None):
+    """
+    Igual que validators.realizar_validacion_completa, pero reutiliza los resultados de una
+    validación anterior del mismo fichero sin cambios si las opciones lo permiten (los resultados
+    recuperados llevan 'desde_cache' a True) y guarda los nuevos. Con options['instrumentar']
+    siempre se valida, porque lo que se quiere medir es la lectura.
+    """
+    if options.get('instrumentar'):
+        return validators.realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+    cache = cache or CacheResultados()
+    try:
+        huella = huella_fichero(ruta_csv)
+    except OSError:
+        return validators.realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+
+    resultados = cache.buscar(ruta_csv, options, huella)
+    if resultados is not None:
+        resultados['desde_cache'] = True
+        return resultados
+    resultados = validators.realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+    cache.guardar(ruta_csv, options, resultados, huella)
+    return resultados
+
+def validar_archivos_con_cache(rutas_csv, options, validar, cache=None):
+    """
+    Variante de validar_con_cache para varios ficheros: devuelve primero los que están en la
+    caché y pasa el resto, de una vez, a 'validar' (una función que recibe una lista de rutas y
+    devuelve un iterable de resultados, como validators.validar_archivos), guardando lo que genere.
+    """
+    if options.get('instrumentar'):
+        yield from validar(rutas_csv)
+        return
+    cache = cache or CacheResultados()
+    huellas = {}
+    for ruta_csv in rutas_csv:
+        try:
+            huellas[ruta_csv] = huella_fichero(ruta_csv)
+        except OSError:
+            huellas[ruta_csv] = None
+            continue
+        resultados = cache.buscar(ruta_csv, options, huellas[ruta_csv])
+        if resultados is not None:
+            resultados['desde_cache'] = True
+            yield resultados
+            del huellas[ruta_csv]
+
+    for resultados in validar(list(huellas)):
+        huella = huellas.get(resultados['ruta_archivo'])
+        if huella is not None:
+            cache.guardar(resultados['ruta_archivo'], options, resultados, huella)
+        yield resultados
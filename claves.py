@@ -0,0 +1,77 @@
+# claves.py
+
+import logging
+from collections import namedtuple
+from operator import itemgetter
+
+from reglas import registrar_regla
+
+logger = logging.getLogger(__name__)
+
+# Une los nombres de las columnas de una clave compuesta en su nombre ('pais+id')
+SEPARADOR_NOMBRE = '+'
+
+# Una clave única ya resuelta contra la cabecera: su nombre, los índices de sus columnas y el
+# índice (indices.IndiceClaves o compatible) donde se registran sus valores.
+ClaveUnica = namedtuple('ClaveUnica', ['nombre', 'columnas', 'indice'])
+
+def normalizar_claves(claves_unicas):
+    """
+    Convierte options['claves_unicas'] en una lista de tuplas de nombres de columna.
+    Cada clave es una lista de columnas; un nombre suelto es una clave de una sola columna.
+    """
+    return [(clave,) if isinstance(clave, str) else tuple(clave) for clave in claves_unicas or ()]
+
+def nombre_clave(columnas):
+    return SEPARADOR_NOMBRE.join(columnas)
+
+def preparar_claves(cabecera, options, crear_indice):
+    """
+    Resuelve las claves de options['claves_unicas'] contra la cabecera y crea un índice vacío
+    (con 'crear_indice()') para cada una. Las claves con alguna columna que no está en la
+    cabecera no se comprueban.
+    """
+    claves = []
+    for columnas in normalizar_claves(options.get('claves_unicas')):
+        ausentes = [columna for columna in columnas if columna not in cabecera]
+        if ausentes:
+            logger.warning(f"La clave única '{nombre_clave(columnas)}' no se comprobará: faltan las columnas {ausentes} en la cabecera.")
+            continue
+        indices = tuple(cabecera.index(columna) for columna in columnas)
+        logger.info(f"Se comprobará la clave única '{nombre_clave(columnas)}' (columnas {list(indices)}).")
+        claves.append(ClaveUnica(nombre_clave(columnas), indices, crear_indice()))
+    return claves
+
+def extractor_de_clave(columnas, ignore_case):
+    """
+    Función (fila) -> tupla con los valores de la clave sin espacios (y en minúsculas con
+    'ignore_case'), o None si alguno está vacío: como en SQL, una clave incompleta no se compara.
+    """
+    if len(columnas) == 1:
+        seleccionar = lambda fila, indice=columnas[0]: (fila[indice],)
+    else:
+        seleccionar = itemgetter(*columnas)
+    strip, lower = str.strip, str.lower
+    if ignore_case:
+        def clave_de_fila(fila):
+            clave = tuple(map(lower, map(strip, seleccionar(fila))))
+            return clave if all(clave) else None
+    else:
+        def clave_de_fila(fila):
+            clave = tuple(map(strip, seleccionar(fila)))
+            return clave if all(clave) else None
+    return clave_de_fila
+
+@registrar_regla('claves_unicas', 45)
+def _regla_claves_unicas(contexto):
+    if not contexto.claves_unicas:
+        return None
+    ignore_case = contexto.options.get('ignore_case')
+    registros = [(extractor_de_clave(clave.columnas, ignore_case), clave.indice.registrar) for clave in contexto.claves_unicas]
+    # Las filas llegan aquí con el nº de columnas de la cabecera, así que los índices son válidos.
+    def regla(fila, num_fila):
+        for clave_de_fila, registrar in registros:
+            clave = clave_de_fila(fila)
+            if clave is not None:
+                registrar(clave, num_fila)
+    return regla
@@ -0,0 +1,333 @@
+# cli.py
+
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+
+from validators import validar_archivos, validar_y_limpiar, serializar_resultados, tiene_errores, iterar_hallazgos, hallazgo_a_dict, HALLAZGO_LECTURA
+from compresion import nombre_limpio
+from esquema import cargar_esquema
+from cache_resultados import CacheResultados, validar_archivos_con_cache
+from incremental import validar_incremental
+from escaneo_rapido import escanear_muestra, serializar_escaneo
+from parada import normalizar_parada
+from validacion_paralela import validar_archivos_en_paralelo, validar_archivo_por_bloques
+
+logger = logging.getLogger(__name__)
+
+# Códigos de salida del modo sin interfaz
+EXIT_OK = 0
+EXIT_ERRORES_VALIDACION = 1
+EXIT_ERROR_LECTURA = 3
+
+def _caracter_csv(valor):
+    """Convierte el valor de --delimitador, --comilla o --escape en el carácter que espera el módulo csv."""
+    if valor.lower() in ('tab', '\\t'):
+        return '\t'
+    if len(valor) == 1:
+        return valor
+    raise argparse.ArgumentTypeError(f"se esperaba un único carácter y se recibió '{valor}'")
+
+def _delimitador_csv(valor):
+    return valor if valor == 'auto' else _caracter_csv(valor)
+
+def _esquema(ruta):
+    """Carga el esquema de --esquema, o explica por qué no es válido."""
+    try:
+        return cargar_esquema(ruta)
+    except OSError as error:
+        raise argparse.ArgumentTypeError(f"no se pudo leer '{ruta}': {error.strerror}")
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"esquema no válido en '{ruta}': {error}")
+
+def crear_parser():
+    """Define los argumentos de la línea de comandos."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Valida uno o varios ficheros CSV sin abrir la interfaz gráfica."
+    )
+    parser.add_argument('rutas', nargs='+', help="Ficheros CSV a validar (también comprimidos: .gz, .bz2, .xz o .zip), o directorios con --vigilar.")
+    parser.add_argument('--opciones', help="Fichero JSON con el diccionario de opciones de validación.")
+    parser.add_argument('--encoding', help="Codificación de los ficheros (por defecto 'utf-8'; 'auto' la detecta en cada fichero).")
+    parser.add_argument('--delimitador', type=_delimitador_csv,
+                        help="Separador de campos (',' por defecto; 'tab' para tabuladores; 'auto' lo detecta en cada fichero).")
+    parser.add_argument('--comilla', type=_caracter_csv, help="Carácter de comillas (por defecto '\"').")
+    parser.add_argument('--escape', type=_caracter_csv, help="Carácter de escape dentro de campos (por defecto, ninguno).")
+    parser.add_argument('--sin-vacias', action='store_true', help="No detectar filas vacías.")
+    parser.add_argument('--sin-duplicadas', action='store_true', help="No detectar filas duplicadas.")
+    parser.add_argument('--ignore-case', action='store_true', help="Ignorar mayúsculas/minúsculas en duplicados, cabecera y unicidad.")
+    parser.add_argument('--cabecera', help="Cabecera esperada, separada por comas.")
+    parser.add_argument('--unicidad', metavar='COLUMNA', help="Columna cuyos valores deben ser únicos.")
+    parser.add_argument('--clave-unica', action='append', metavar='COLUMNAS',
+                        help="Columnas (separadas por comas) cuya combinación no se puede repetir. Se puede indicar varias veces.")
+    parser.add_argument('--esquema', type=_esquema, metavar='FICHERO',
+                        help="Esquema JSON con el tipo y las restricciones de cada columna (ver README).")
+    parser.add_argument('--engine', choices=['python', 'pandas', 'bytes'],
+                        help="Motor de validación: 'python' (por defecto), 'pandas' (vectorizado con NumPy/pandas) o "
+                             "'bytes' (análisis de bytes para las comprobaciones estructurales).")
+    parser.add_argument('--indice-hash', action='store_true',
+                        help="Detecta duplicados guardando solo un resumen de cada fila (mucha menos memoria en ficheros grandes).")
+    parser.add_argument('--memoria-max-mb', type=float,
+                        help="Presupuesto de memoria de los índices de duplicados y unicidad; al superarlo se vuelcan a disco.")
+    parser.add_argument('--dir-temporal', help="Directorio para los ficheros temporales de --memoria-max-mb.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Número de procesos para validar varios ficheros en paralelo (0 = uno por núcleo).")
+    parser.add_argument('--bloques', action='store_true',
+                        help="Divide cada fichero en bloques y los reparte entre los procesos de --workers (para ficheros muy grandes).")
+    parser.add_argument('--limpiar-en', metavar='DIRECTORIO',
+                        help="Escribe además el CSV limpio de cada fichero ('<nombre>_limpio.csv', comprimido igual que el original) en DIRECTORIO, en la misma lectura que la validación. "
+                             "El índice de duplicados es entonces exacto y en memoria (sin --indice-hash ni --memoria-max-mb).")
+    parser.add_argument('--instrumentar', action='store_true',
+                        help="Añade a cada resultado la clave 'instrumentacion' con el tiempo por regla, lectura, bytes leídos y tamaño de los índices.")
+    parser.add_argument('--cache', nargs='?', const='', metavar='DIRECTORIO',
+                        help="Reutiliza los resultados de validaciones anteriores de ficheros sin cambios (y guarda los nuevos) "
+                             "en DIRECTORIO o, si no se indica, en la caché del usuario. No se aplica con --limpiar-en ni --hallazgos.")
+    parser.add_argument('--cache-max-mb', type=float, default=256,
+                        help="Tamaño máximo de la caché de --cache; al superarlo se eliminan los resultados usados hace más tiempo.")
+    parser.add_argument('--incremental', nargs='?', const='', metavar='DIRECTORIO',
+                        help="Para ficheros a los que solo se añaden filas: valida únicamente lo añadido desde la ejecución anterior "
+                             "y guarda el estado en DIRECTORIO (por defecto, en la caché del usuario). Ignora --workers y --bloques.")
+    parser.add_argument('--vigilar', action='store_true',
+                        help="Modo servicio: vigila los directorios indicados y valida cada CSV nuevo o modificado cuando termina "
+                             "de escribirse, dejando el resultado en '<fichero>.validacion.json'. Usa --workers y --limpiar-en.")
+    parser.add_argument('--cola', type=int, default=100,
+                        help="Con --vigilar, máximo de ficheros en cola; el resto espera sin consumir workers.")
+    parser.add_argument('--espera', type=float, default=2.0,
+                        help="Con --vigilar, segundos que un fichero debe pasar sin cambios para darlo por terminado de escribir.")
+    parser.add_argument('--recursivo', action='store_true', help="Con --vigilar, vigila también los subdirectorios.")
+    parser.add_argument('--parar-en-primer-error', action='store_true',
+                        help="Deja de leer cada fichero en su primer error (como puerta de ingesta que solo necesita aceptar o rechazar).")
+    parser.add_argument('--parar-en-cabecera', action='store_true',
+                        help="No lee las filas si la cabecera no coincide con --cabecera.")
+    parser.add_argument('--max-errores', type=int, metavar='N', help="Deja de leer al llegar a N errores en total.")
+    parser.add_argument('--max-por-categoria', type=int, metavar='N',
+                        help="Deja de leer al llegar a N errores de una misma categoría (columnas, vacías, saltos o esquema).")
+    parser.add_argument('--tasa-maxima', type=float, metavar='TASA',
+                        help="Deja de leer si los errores superan esa proporción de las filas leídas (p. ej. 0.05) tras --filas-minimas filas.")
+    parser.add_argument('--filas-minimas', type=int, metavar='M', help="Filas que se leen antes de aplicar --tasa-maxima (1000 por defecto).")
+    parser.add_argument('--rapido', action='store_true',
+                        help="Escaneo rápido: comprueba la estructura solo en muestras repartidas por el fichero y estima "
+                             "la tasa de cada error con su intervalo de confianza.")
+    parser.add_argument('--umbral', type=float, default=0, metavar='TASA',
+                        help="Con --rapido, tasa de errores admitida (p. ej. 0.001); por encima se notifica en 'superan_umbral'.")
+    parser.add_argument('--escalar', action='store_true',
+                        help="Con --rapido, valida el fichero completo si alguna categoría supera --umbral.")
+    parser.add_argument('--hallazgos', action='store_true',
+                        help="Emite cada hallazgo como una línea JSON en cuanto se detecta, en lugar de un resultado por fichero.")
+    parser.add_argument('--max-contenido', type=int, metavar='N',
+                        help="Guarda el contenido de las filas solo para los N primeros errores de cada categoría.")
+    parser.add_argument('--formato', choices=['jsonl', 'json'], default='jsonl',
+                        help="'jsonl' emite un resultado por línea según termina cada fichero; 'json' emite una lista al final.")
+    parser.add_argument('--log', help="Fichero de log. Si no se indica, solo se muestran avisos por stderr.")
+    return parser
+
+def construir_opciones(args):
+    """Construye el diccionario de opciones a partir del JSON indicado y de los argumentos."""
+    options = {'encoding': 'utf-8', 'check_vacias': True, 'check_duplicadas': True}
+    if args.opciones:
+        with open(args.opciones, 'r', encoding='utf-8') as f:
+            options.update(json.load(f))
+
+    if args.encoding:
+        options['encoding'] = args.encoding
+    if args.delimitador:
+        options['delimitador'] = args.delimitador
+    if args.comilla:
+        options['comilla'] = args.comilla
+    if args.escape:
+        options['escape'] = args.escape
+    if args.sin_vacias:
+        options['check_vacias'] = False
+    if args.sin_duplicadas:
+        options['check_duplicadas'] = False
+    if args.ignore_case:
+        options['ignore_case'] = True
+    if args.cabecera:
+        options['check_header'] = True
+        options['expected_headers'] = [h for h in (h.strip() for h in args.cabecera.split(',')) if h]
+    if args.engine:
+        options['engine'] = args.engine
+    if args.indice_hash:
+        options['indice_duplicados'] = 'hash'
+    if args.memoria_max_mb:
+        options['memoria_max_mb'] = args.memoria_max_mb
+    if args.dir_temporal:
+        options['directorio_temporal'] = args.dir_temporal
+    if args.instrumentar:
+        options['instrumentar'] = True
+    if args.max_contenido is not None:
+        options['max_contenido_por_categoria'] = args.max_contenido
+    if args.unicidad:
+        options['check_uniqueness'] = True
+        options['unique_column_name'] = args.unicidad
+    if args.clave_unica:
+        options['claves_unicas'] = [[c.strip() for c in clave.split(',')] for clave in args.clave_unica]
+    if args.esquema:
+        options['esquema'] = args.esquema
+    parada = dict(options.get('parada') or {})
+    if args.parar_en_primer_error:
+        parada['primer_error'] = True
+    if args.parar_en_cabecera:
+        parada['cabecera'] = True
+    for clave in ('max_errores', 'max_por_categoria', 'tasa_maxima', 'filas_minimas'):
+        if getattr(args, clave) is not None:
+            parada[clave] = getattr(args, clave)
+    if parada:
+        options['parada'] = parada
+    return options
+
+def emitir_hallazgos(rutas, options):
+    """Emite por la salida estándar una línea JSON por hallazgo. Devuelve el código de salida."""
+    codigo_salida = EXIT_OK
+    limite = options.get('max_contenido_por_categoria')
+    for ruta in rutas:
+        for hallazgo in iterar_hallazgos(ruta, options, max_contenido_por_categoria=limite):
+            if hallazgo.tipo == HALLAZGO_LECTURA:
+                codigo_salida = EXIT_ERROR_LECTURA
+            elif codigo_salida == EXIT_OK:
+                codigo_salida = EXIT_ERRORES_VALIDACION
+            datos = hallazgo_a_dict(hallazgo)
+            datos['ruta_archivo'] = ruta
+            sys.stdout.write(json.dumps(datos, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+    return codigo_salida
+
+def emitir_escaneos_rapidos(args, options):
+    """Emite una línea JSON por fichero con el escaneo rápido (--rapido). Devuelve el código de salida."""
+    codigo_salida = EXIT_OK
+    for ruta in args.rutas:
+        escaneo = escanear_muestra(ruta, options, umbrales=args.umbral, escalar=args.escalar)
+        serializable = serializar_escaneo(escaneo)
+        if escaneo.get('error_lectura'):
+            codigo_salida = EXIT_ERROR_LECTURA
+        elif serializable['tiene_errores'] and codigo_salida == EXIT_OK:
+            codigo_salida = EXIT_ERRORES_VALIDACION
+        sys.stdout.write(json.dumps(serializable, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+    return codigo_salida
+
+def validar_y_limpiar_archivos(rutas, options, directorio_destino):
+    """Valida y limpia cada fichero en una sola lectura. Añade el resumen de limpieza en la clave 'limpieza'."""
+    os.makedirs(directorio_destino, exist_ok=True)
+    for ruta in rutas:
+        ruta_destino = os.path.join(directorio_destino, nombre_limpio(ruta))
+        resultados, resumen_limpieza = validar_y_limpiar(ruta, ruta_destino, options)
+        resumen_limpieza['ruta_destino'] = ruta_destino
+        resultados['limpieza'] = resumen_limpieza
+        yield resultados
+
+def vigilar_directorios(args, options):
+    """Ejecuta el modo --vigilar hasta Ctrl+C o SIGTERM, emitiendo una línea JSON por fichero validado."""
+    from vigilante import Vigilante
+
+    cerrojo_salida = threading.Lock()
+    def emitir(serializable):
+        with cerrojo_salida:
+            sys.stdout.write(json.dumps(serializable, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+
+    vigilante = Vigilante(args.rutas, options, workers=args.workers, tam_cola=args.cola, espera=args.espera,
+                          directorio_limpios=args.limpiar_en, recursivo=args.recursivo, al_procesar=emitir)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    vigilante.iniciar()
+    try:
+        # Espera por intervalos para que Ctrl+C llegue también en Windows
+        while not vigilante.esperar(1):
+            pass
+    except KeyboardInterrupt:
+        logger.info("Señal de parada recibida.")
+    finally:
+        vigilante.detener()
+    return EXIT_OK
+
+def _validador_de_lista(args, options):
+    """Función que valida una lista de rutas según --incremental, --bloques y --workers."""
+    if args.incremental is not None:
+        return lambda rutas: (validar_incremental(ruta, options, directorio=args.incremental or None) for ruta in rutas)
+    if args.bloques:
+        return lambda rutas: (validar_archivo_por_bloques(ruta, options, max_workers=args.workers or None) for ruta in rutas)
+    if args.workers == 1:
+        return lambda rutas: validar_archivos(rutas, options)
+    return lambda rutas: validar_archivos_en_paralelo(rutas, options, max_workers=args.workers or None)
+
+def ordenar_como_entrada(resultados, rutas):
+    """
+    Ordena los resultados (que pueden llegar en cualquier orden) como las rutas de entrada.
+    Una ruta repetida recibe sus posiciones en orden, y los resultados cuya ruta no está entre
+    las de entrada van al final, en el orden en que llegaron.
+    """
+    posiciones = {}
+    for posicion, ruta in enumerate(rutas):
+        posiciones.setdefault(ruta, []).append(posicion)
+    ordenados = []
+    for llegada, resultado in enumerate(resultados):
+        pendientes = posiciones.get(resultado['ruta_archivo'])
+        posicion = pendientes.pop(0) if pendientes else len(rutas) + llegada
+        ordenados.append((posicion, resultado))
+    return [resultado for _, resultado in sorted(ordenados, key=lambda par: par[0])]
+
+def main(argv=None):
+    """Punto de entrada del modo sin interfaz. Devuelve el código de salida."""
+    parser = crear_parser()
+    args = parser.parse_args(argv)
+
+    if args.log:
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+            filename=args.log,
+            filemode='w'
+        )
+    else:
+        logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s', stream=sys.stderr)
+
+    options = construir_opciones(args)
+    try:
+        normalizar_parada(options.get('parada'))
+    except ValueError as error:
+        parser.error(f"política de parada no válida: {error}")
+    logger.info(f"Validación sin interfaz de {len(args.rutas)} fichero(s) con opciones: {options}")
+
+    if args.hallazgos:
+        return emitir_hallazgos(args.rutas, options)
+    if args.vigilar:
+        return vigilar_directorios(args, options)
+    if args.rapido:
+        return emitir_escaneos_rapidos(args, options)
+
+    codigo_salida = EXIT_OK
+    todos = []
+    if args.limpiar_en:
+        iterador = validar_y_limpiar_archivos(args.rutas, options, args.limpiar_en)
+    elif args.cache is not None:
+        cache = CacheResultados(args.cache or None, tam_max_mb=args.cache_max_mb)
+        iterador = validar_archivos_con_cache(args.rutas, options, _validador_de_lista(args, options), cache)
+    else:
+        iterador = _validador_de_lista(args, options)(args.rutas)
+
+    for resultados in iterador:
+        if resultados.get('error_lectura'):
+            codigo_salida = EXIT_ERROR_LECTURA
+        elif tiene_errores(resultados) and codigo_salida == EXIT_OK:
+            codigo_salida = EXIT_ERRORES_VALIDACION
+
+        serializable = serializar_resultados(resultados)
+        if args.formato == 'jsonl':
+            sys.stdout.write(json.dumps(serializable, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+        else:
+            todos.append(serializable)
+
+    if args.formato == 'json':
+        todos = ordenar_como_entrada(todos, args.rutas)
+        json.dump(todos, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+
+    return codigo_salida
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# compresion.py
+
+import bz2
+import gzip
+import io
+import logging
+import lzma
+import os
+import zipfile
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Firmas de los formatos comprimidos admitidos, que se reconocen por contenido y no por extensión
+FIRMAS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+)
+# Extensiones que deciden si el CSV limpio se escribe comprimido
+EXTENSIONES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zip': 'zip'}
+
+class TextoComprimido(io.TextIOWrapper):
+    """
+    Fichero de texto sobre un flujo comprimido. 'origen' es el fichero comprimido en disco, que
+    permite informar del progreso en bytes comprimidos; al cerrarlo se cierran también los
+    objetos intermedios de 'recursos' (el fichero de disco y, en un zip, el propio archivo).
+    """
+    def __init__(self, binario, origen=None, recursos=(), **kwargs):
+        super().__init__(binario, **kwargs)
+        self.origen = origen
+        self._recursos = recursos
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            for recurso in reversed(self._recursos):
+                recurso.close()
+
+def detectar_compresion(ruta):
+    """Devuelve 'gzip', 'bz2', 'xz' o 'zip' según la firma del fichero, o None si no está comprimido."""
+    try:
+        with open(ruta, 'rb') as f:
+            cabecera = f.read(6)
+    except OSError:
+        # Que el error lo notifique la lectura normal
+        return None
+    for firma, compresion in FIRMAS:
+        if cabecera.startswith(firma):
+            return compresion
+    return None
+
+def compresion_por_extension(ruta):
+    """Formato de compresión que corresponde a la extensión de 'ruta', o None."""
+    return EXTENSIONES.get(os.path.splitext(ruta)[1].lower())
+
+def _miembro_zip(archivo, ruta):
+    """Elige el CSV dentro de un zip: el único fichero que contiene o el primero con extensión .csv."""
+    ficheros = [info for info in archivo.infolist() if not info.is_dir()]
+    csvs = [info for info in ficheros if info.filename.lower().endswith('.csv')]
+    if len(ficheros) == 1:
+        return ficheros[0]
+    if csvs:
+        if len(csvs) > 1:
+            logger.warning(f"{ruta} contiene {len(csvs)} CSV; se usa el primero: {csvs[0].filename}")
+        return csvs[0]
+    raise ValueError(f"El archivo zip {ruta} no contiene ningún fichero CSV.")
+
+def _abrir_descompresor(ruta, compresion):
+    """Devuelve (flujo binario descomprimido, fichero comprimido, objetos que hay que cerrar)."""
+    origen = open(ruta, 'rb')
+    try:
+        if compresion == 'gzip':
+            binario = gzip.GzipFile(fileobj=origen, mode='rb')
+        elif compresion == 'bz2':
+            binario = bz2.BZ2File(origen, 'rb')
+        elif compresion == 'xz':
+            binario = lzma.LZMAFile(origen, 'rb')
+        else:
+            archivo = zipfile.ZipFile(origen)
+            binario = archivo.open(_miembro_zip(archivo, ruta))
+            return binario, origen, (origen, archivo)
+    except BaseException:
+        origen.close()
+        raise
+    return binario, origen, (origen,)
+
+def abrir_texto(ruta, encoding='utf-8', errors='strict'):
+    """
+    Abre un CSV para leerlo en modo texto, descomprimiéndolo sobre la marcha si está comprimido
+    con gzip, bzip2, xz o zip. Sin compresión equivale a open(ruta, 'r', newline='', ...).
+    """
+    compresion = detectar_compresion(ruta)
+    if compresion is None:
+        return open(ruta, 'r', newline='', encoding=encoding, errors=errors)
+    binario, origen, recursos = _abrir_descompresor(ruta, compresion)
+    return TextoComprimido(binario, origen, recursos, encoding=encoding, errors=errors, newline='')
+
+@contextmanager
+def abrir_binario(ruta):
+    """Como abrir_texto, pero devuelve el contenido descomprimido en binario (sin posibilidad de seek)."""
+    compresion = detectar_compresion(ruta)
+    if compresion is None:
+        with open(ruta, 'rb') as f:
+            yield f
+        return
+    binario, _, recursos = _abrir_descompresor(ruta, compresion)
+    try:
+        yield binario
+    finally:
+        binario.close()
+        for recurso in reversed(recursos):
+            recurso.close()
+
+def abrir_destino(ruta, encoding='utf-8', errors='strict'):
+    """
+    Abre un CSV para escribirlo en modo texto, comprimido si la extensión de 'ruta' es .gz, .bz2,
+    .xz o .zip. En un zip el CSV se guarda con el nombre del archivo sin la extensión .zip.
+    """
+    compresion = compresion_por_extension(ruta)
+    if compresion == 'gzip':
+        return gzip.open(ruta, 'wt', encoding=encoding, errors=errors, newline='')
+    if compresion == 'bz2':
+        return bz2.open(ruta, 'wt', encoding=encoding, errors=errors, newline='')
+    if compresion == 'xz':
+        return lzma.open(ruta, 'wt', encoding=encoding, errors=errors, newline='')
+    if compresion == 'zip':
+        miembro = os.path.splitext(os.path.basename(ruta))[0]
+        if not miembro.lower().endswith('.csv'):
+            miembro += '.csv'
+        archivo = zipfile.ZipFile(ruta, 'w', compression=zipfile.ZIP_DEFLATED)
+        try:
+            binario = archivo.open(miembro, 'w', force_zip64=True)
+        except BaseException:
+            archivo.close()
+            raise
+        return TextoComprimido(binario, None, (archivo,), encoding=encoding, errors=errors, newline='')
+    return open(ruta, 'w', newline='', encoding=encoding, errors=errors)
+
+def nombre_limpio(ruta):
+    """Nombre del CSV limpio de 'ruta': '<nombre>_limpio.csv', con la misma compresión que el original."""
+    nombre = os.path.basename(ruta)
+    extension_compresion = ''
+    if compresion_por_extension(nombre):
+        nombre, extension_compresion = os.path.splitext(nombre)
+    return f"{os.path.splitext(nombre)[0]}_limpio.csv{extension_compresion}"
+
+def posicion_en_origen(f):
+    """Bytes leídos del fichero en disco (comprimidos, si lo está) por un fichero de abrir_texto."""
+    origen = getattr(f, 'origen', None)
+    return origen.tell() if origen is not None else f.buffer.tell()
@@ -0,0 +1,272 @@
+# deteccion.py
+
+import codecs
+import csv
+import io
+import logging
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from compresion import abrir_binario, abrir_texto, detectar_compresion
+
+logger = logging.getLogger(__name__)
+
+# Valor de options['encoding'] que pide detectar la codificación antes de leer
+ENCODING_AUTO = 'auto'
+# Manejador de errores de decodificación del modo automático: sustituye el byte por U+FFFD
+# y lo cuenta, para que la validación siga y se informe después de dónde estaba.
+ERRORES_REEMPLAZAR_Y_CONTAR = 'validador_reemplazar'
+
+TAM_PREFIJO = 64 * 1024
+TAM_MUESTRA = 16 * 1024
+NUM_MUESTRAS = 16
+
+# El orden importa: el BOM de UTF-32-LE empieza igual que el de UTF-16-LE
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# Bytes 0x80-0x9F que cp1252 no define; si aparecen, el fichero no es cp1252
+NO_DEFINIDOS_CP1252 = frozenset(b'\x81\x8d\x8f\x90\x9d')
+
+# Resultado de detectar_codificacion. 'motivo' explica en qué se basa la elección.
+DeteccionCodificacion = namedtuple('DeteccionCodificacion', ['encoding', 'motivo'])
+
+_estado_hilo = threading.local()
+
+def _reemplazar_y_contar(error):
+    contador = getattr(_estado_hilo, 'contador', None)
+    if contador is not None:
+        contador['errores'] += 1
+    return '\ufffd', error.end
+
+codecs.register_error(ERRORES_REEMPLAZAR_Y_CONTAR, _reemplazar_y_contar)
+
+@contextmanager
+def contar_errores_de_decodificacion():
+    """
+    Cuenta los bytes sustituidos por el manejador ERRORES_REEMPLAZAR_Y_CONTAR en este hilo
+    mientras dure el bloque. Devuelve un diccionario cuya clave 'errores' se va actualizando.
+    """
+    contador = {'errores': 0}
+    anterior = getattr(_estado_hilo, 'contador', None)
+    _estado_hilo.contador = contador
+    try:
+        yield contador
+    finally:
+        _estado_hilo.contador = anterior
+
+def _leer_muestras(ruta_csv, tam_prefijo, tam_muestra, num_muestras):
+    """
+    Devuelve el prefijo del fichero y una lista de bloques repartidos por el resto.
+    En un fichero comprimido no se puede saltar a otra posición sin descomprimir todo lo
+    anterior, así que solo se usa el prefijo.
+    """
+    if detectar_compresion(ruta_csv):
+        with abrir_binario(ruta_csv) as f:
+            return f.read(tam_prefijo), []
+    tam_fichero = os.path.getsize(ruta_csv)
+    with open(ruta_csv, 'rb') as f:
+        prefijo = f.read(tam_prefijo)
+        muestras = []
+        resto = tam_fichero - len(prefijo)
+        if resto > 0 and num_muestras:
+            paso = max(resto // num_muestras, tam_muestra)
+            for posicion in range(len(prefijo), tam_fichero, paso):
+                f.seek(posicion)
+                muestras.append(f.read(tam_muestra))
+    return prefijo, muestras
+
+def _recortar_utf8(bloque):
+    """Quita los bytes de continuación del principio de un bloque cortado a mitad de un carácter."""
+    inicio = 0
+    while inicio < min(3, len(bloque)) and 0x80 <= bloque[inicio] <= 0xBF:
+        inicio += 1
+    return bloque[inicio:]
+
+def _es_utf8(bloque, es_final):
+    decodificador = codecs.getincrementaldecoder('utf-8')('strict')
+    try:
+        decodificador.decode(bloque, es_final)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def _parece_utf16_sin_bom(prefijo):
+    """Un texto latino en UTF-16 tiene un byte nulo en casi todas las posiciones pares o impares."""
+    muestra = prefijo[:4096]
+    if len(muestra) < 4:
+        return None
+    pares = muestra[0::2].count(0) / (len(muestra) // 2)
+    impares = muestra[1::2].count(0) / (len(muestra) // 2)
+    if impares > 0.3 and pares < 0.05:
+        return 'utf-16-le'
+    if pares > 0.3 and impares < 0.05:
+        return 'utf-16-be'
+    return None
+
+def detectar_codificacion(ruta_csv, tam_prefijo=TAM_PREFIJO, tam_muestra=TAM_MUESTRA, num_muestras=NUM_MUESTRAS):
+    """
+    Elige la codificación de un fichero leyendo solo un prefijo y 'num_muestras' bloques
+    repartidos por el resto, así que el coste no depende del tamaño del fichero.
+    Orden de decisión: BOM; UTF-16 sin BOM (bytes nulos alternos); ASCII o UTF-8 válido en
+    todas las muestras => 'utf-8'; si no, una codificación de un byte: 'cp1252' si aparecen
+    caracteres propios de cp1252 (0x80-0x9F) y todos están definidos, 'latin-1' en otro caso
+    (latin-1 puede decodificar cualquier byte).
+    """
+    prefijo, muestras = _leer_muestras(ruta_csv, tam_prefijo, tam_muestra, num_muestras)
+
+    for bom, encoding in BOMS:
+        if prefijo.startswith(bom):
+            return DeteccionCodificacion(encoding, f"BOM de {encoding}")
+
+    utf16 = _parece_utf16_sin_bom(prefijo)
+    if utf16:
+        return DeteccionCodificacion(utf16, "bytes nulos alternos (UTF-16 sin BOM)")
+
+    bloques = [(prefijo, len(muestras) == 0)] + [(_recortar_utf8(m), False) for m in muestras]
+    if all(b.isascii() for b, _ in bloques):
+        return DeteccionCodificacion('utf-8', "solo caracteres ASCII en las muestras")
+    if all(_es_utf8(b, es_final) for b, es_final in bloques):
+        return DeteccionCodificacion('utf-8', "secuencias UTF-8 válidas en todas las muestras")
+
+    altos = set()
+    for bloque, _ in bloques:
+        altos.update(byte for byte in bloque if 0x80 <= byte <= 0x9F)
+    if altos and not altos & NO_DEFINIDOS_CP1252:
+        return DeteccionCodificacion('cp1252', "bytes 0x80-0x9F definidos en cp1252 (comillas tipográficas, €...)")
+    return DeteccionCodificacion('latin-1', "bytes no UTF-8 de un solo byte")
+
+def compatible_con_ascii(encoding):
+    """Indica si los bytes ASCII representan los mismos caracteres en 'encoding' (no así UTF-16)."""
+    try:
+        return bytes(range(128)).decode(encoding) == ''.join(map(chr, range(128)))
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+def localizar_error_codificacion(ruta_csv, encoding, tam_bloque=1024 * 1024):
+    """
+    Busca el primer byte que no se puede decodificar con 'encoding' leyendo el fichero en binario.
+    Devuelve {'encoding', 'byte', 'linea', 'bytes'} con el offset exacto (desde 0), la línea física
+    (desde 1) y los bytes problemáticos en hexadecimal, o None si todo el fichero es válido.
+    En un fichero comprimido el offset se refiere al contenido descomprimido.
+    """
+    decodificador = codecs.getincrementaldecoder(encoding)('strict')
+    posicion = 0
+    saltos = 0
+    with abrir_binario(ruta_csv) as f:
+        while True:
+            bloque = f.read(tam_bloque)
+            pendientes = len(decodificador.getstate()[0])
+            try:
+                decodificador.decode(bloque, not bloque)
+            except UnicodeDecodeError as e:
+                offset = posicion - pendientes + e.start
+                saltos += bloque[:max(0, offset - posicion)].count(b'\n')
+                return {
+                    'encoding': encoding,
+                    'byte': offset,
+                    'linea': saltos + 1,
+                    'bytes': e.object[e.start:e.end].hex(' '),
+                }
+            if not bloque:
+                return None
+            saltos += bloque.count(b'\n')
+            posicion += len(bloque)
+
+def resolver_codificacion(ruta_csv, options):
+    """
+    Si options['encoding'] es 'auto', devuelve una copia de las opciones con la codificación detectada
+    ('encoding_detectado' guarda el motivo) y con los errores de decodificación sustituidos y contados
+    en lugar de interrumpir la lectura. Con cualquier otra codificación devuelve las mismas opciones.
+    """
+    if options.get('encoding') != ENCODING_AUTO:
+        return options
+    try:
+        deteccion = detectar_codificacion(ruta_csv)
+    except OSError:
+        # Que el error de apertura lo notifique la lectura normal
+        return dict(options, encoding='utf-8')
+    logger.info(f"Codificación detectada para {ruta_csv}: {deteccion.encoding} ({deteccion.motivo}).")
+    return dict(options, encoding=deteccion.encoding, errores_codificacion=ERRORES_REEMPLAZAR_Y_CONTAR,
+                encoding_detectado={'encoding': deteccion.encoding, 'motivo': deteccion.motivo})
+
+# Valor de options['delimitador'] que pide detectar el dialecto antes de leer
+DELIMITADOR_AUTO = 'auto'
+# Candidatos en orden de preferencia en caso de empate
+DELIMITADORES_CANDIDATOS = (',', ';', '\t', '|', ':')
+COMILLAS_CANDIDATAS = ('"', "'")
+
+# Resultado de detectar_dialecto, con los mismos nombres que las opciones de validación
+DialectoDetectado = namedtuple('DialectoDetectado', ['delimitador', 'comilla', 'escape', 'terminador_linea'])
+
+def _leer_muestra_texto(ruta_csv, encoding, tam_muestra):
+    with abrir_texto(ruta_csv, encoding, 'replace') as f:
+        muestra = f.read(tam_muestra)
+        if f.read(1):
+            # Se descarta la última línea, que puede estar cortada
+            muestra = muestra[:muestra.rfind('\n') + 1] or muestra
+    return muestra
+
+def _consistencia(muestra, delimitador, comilla):
+    """Proporción de filas con el nº de columnas más frecuente (0 si ese nº es 1)."""
+    conteos = {}
+    for fila in csv.reader(io.StringIO(muestra, newline=''), delimiter=delimitador, quotechar=comilla):
+        if fila:
+            conteos[len(fila)] = conteos.get(len(fila), 0) + 1
+    if not conteos:
+        return 0.0
+    columnas, veces = max(conteos.items(), key=lambda par: (par[1], par[0]))
+    return veces / sum(conteos.values()) if columnas > 1 else 0.0
+
+def detectar_dialecto(ruta_csv, encoding='utf-8', tam_muestra=TAM_PREFIJO):
+    """
+    Deduce el dialecto de un CSV a partir de su inicio: el delimitador y la comilla son los
+    que dan a más filas el mismo nº de columnas (más de una); el escape es '\\' si aparece
+    delante de la comilla; el terminador de línea es el más frecuente. Si nada encaja se usa
+    el dialecto por defecto (coma y comilla doble).
+    """
+    muestra = _leer_muestra_texto(ruta_csv, encoding, tam_muestra)
+    mejor = (0.0, ',', '"')
+    for comilla in COMILLAS_CANDIDATAS:
+        if comilla != '"' and comilla not in muestra:
+            continue
+        for delimitador in DELIMITADORES_CANDIDATOS:
+            puntuacion = _consistencia(muestra, delimitador, comilla)
+            if puntuacion > mejor[0]:
+                mejor = (puntuacion, delimitador, comilla)
+    _, delimitador, comilla = mejor
+
+    escape = '\\' if '\\' + comilla in muestra else None
+    crlf = muestra.count('\r\n')
+    terminadores = {'\r\n': crlf, '\n': muestra.count('\n') - crlf, '\r': muestra.count('\r') - crlf}
+    terminador = max(terminadores, key=terminadores.get) if any(terminadores.values()) else '\r\n'
+    return DialectoDetectado(delimitador, comilla, escape, terminador)
+
+def resolver_dialecto(ruta_csv, options):
+    """
+    Si options['delimitador'] es 'auto', devuelve una copia de las opciones con el dialecto
+    detectado ('dialecto_detectado' lo resume). Los valores indicados explícitamente para
+    'comilla', 'escape' o 'terminador_linea' se respetan. Debe llamarse con la codificación ya resuelta.
+    """
+    if options.get('delimitador') != DELIMITADOR_AUTO:
+        return options
+    try:
+        dialecto = detectar_dialecto(ruta_csv, options.get('encoding', 'utf-8'))
+    except (OSError, LookupError):
+        return dict(options, delimitador=',')
+    logger.info(f"Dialecto detectado para {ruta_csv}: {dialecto}.")
+    resueltas = dict(options, delimitador=dialecto.delimitador, dialecto_detectado=dialecto._asdict())
+    for clave in ('comilla', 'escape', 'terminador_linea'):
+        if resueltas.get(clave) is None:
+            resueltas[clave] = getattr(dialecto, clave)
+    return resueltas
+
+def resolver_formato(ruta_csv, options):
+    """Resuelve la codificación y el dialecto 'auto' (en ese orden) antes de leer un fichero."""
+    return resolver_dialecto(ruta_csv, resolver_codificacion(ruta_csv, options))
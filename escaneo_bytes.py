@@ -0,0 +1,296 @@
+# escaneo_bytes.py
+
+import codecs
+import csv
+import io
+import logging
+import mmap
+import os
+from collections import namedtuple
+
+import numpy as np
+
+import validators
+from deteccion import contar_errores_de_decodificacion, resolver_formato
+from progreso import ValidacionCancelada
+from reglas import ContextoReglas, PipelineReglas
+from validacion_paralela import motivo_sin_paridad_de_comillas
+
+logger = logging.getLogger(__name__)
+
+# Bytes que se analizan de una vez; si un registro no cabe, la ventana crece
+TAM_VENTANA = 4 * 1024 * 1024
+# Reglas que este motor sabe aplicar a partir de la estructura de bytes
+REGLAS_ESTRUCTURALES = frozenset({'columnas', 'fila_vacia', 'saltos_de_linea'})
+
+LF = 0x0A
+CR = 0x0D
+
+# Registros completos de una ventana. 'inicios' son offsets dentro de la ventana; 'campos' el nº
+# de campos de cada registro; 'con_saltos' si tiene saltos de línea entre comillas; 'con_contenido'
+# si tiene algún byte que no puede ser espacio en blanco (los demás son candidatos a fila vacía).
+Registros = namedtuple('Registros', ['corte', 'inicios', 'finales', 'campos', 'con_saltos', 'con_contenido'])
+
+class _FormatoNoSoportado(Exception):
+    """El fichero tiene algo que el análisis por bytes no reproduce exactamente; se usa el motor de Python."""
+
+def validar_por_bytes(ruta_csv, options, progreso=None, cancelacion=None):
+    """
+    Motor para las comprobaciones estructurales (nº de columnas, filas vacías y saltos de línea
+    dentro de celdas) que analiza el fichero proyectado en memoria sin decodificarlo fila a fila:
+    localiza delimitadores, comillas y saltos de línea en los bytes con NumPy y solo decodifica
+    y analiza con csv las filas que hay que notificar. La codificación se comprueba por bloques.
+    Devuelve los mismos 'resultados' que realizar_validacion_completa. Si se piden duplicados,
+    unicidad o claves únicas, el fichero está comprimido, el dialecto usa escape, la codificación no es compatible
+    con ASCII o las comillas no siguen RFC 4180 (p. ej. una comilla en mitad de un campo), se usa
+    el motor de Python.
+    """
+    options = resolver_formato(ruta_csv, options)
+    motivo = _motivo_no_aplicable(ruta_csv, options)
+    if motivo is None:
+        try:
+            return _escanear(ruta_csv, options, progreso, cancelacion)
+        except _FormatoNoSoportado as e:
+            motivo = str(e)
+        except UnicodeDecodeError:
+            motivo = "Hay bytes no válidos en la codificación indicada"
+    logger.info(f"{motivo}; {ruta_csv} se valida con el motor de Python.")
+    return validators._validar_secuencial(ruta_csv, options, progreso, cancelacion)
+
+def _motivo_no_aplicable(ruta_csv, options):
+    """Devuelve por qué el fichero no se puede validar por bytes, o None si se puede."""
+    if options.get('check_duplicadas'):
+        return "La detección de duplicados necesita el contenido de cada fila"
+    if options.get('check_uniqueness') and options.get('unique_column_name'):
+        return "La comprobación de unicidad necesita el contenido de cada fila"
+    if options.get('claves_unicas'):
+        return "La comprobación de claves únicas necesita el contenido de cada fila"
+    motivo = motivo_sin_paridad_de_comillas(ruta_csv, options)
+    if motivo is not None:
+        return motivo
+    if not validators._formato_csv(options)['delimiter'].isascii():
+        return "El delimitador no es un carácter ASCII"
+    try:
+        if not os.path.getsize(ruta_csv):
+            return "El fichero está vacío"
+    except OSError:
+        return "No se puede acceder al fichero"
+    return None
+
+def _tabla_sin_contenido(encoding, delimitador, comilla):
+    """
+    Tabla de 256 posiciones que marca los bytes que pueden no aportar contenido a una fila:
+    delimitador, comilla y espacios en blanco. Los bytes de caracteres multibyte se marcan
+    salvo los que inician una secuencia UTF-8 sin ningún espacio Unicode, así que solo
+    descartan filas con certeza; las candidatas se confirman decodificándolas.
+    """
+    es_utf8 = codecs.lookup(encoding).name in ('utf-8', 'utf-8-sig')
+    tabla = np.zeros(256, dtype=bool)
+    for byte in range(256):
+        try:
+            tabla[byte] = not bytes([byte]).decode(encoding).strip()
+        except UnicodeDecodeError:
+            tabla[byte] = not (es_utf8 and byte >= 0xC3 and byte not in (0xE1, 0xE2, 0xE3))
+    tabla[[delimitador, comilla]] = True
+    return tabla
+
+def _separar_registros(ventana, es_final, delimitador, comilla, sin_contenido):
+    """
+    Divide una ventana que empieza al principio de un registro en registros completos siguiendo
+    las reglas de csv: los saltos de línea (LF, CRLF o CR) y los delimitadores solo cuentan fuera
+    de comillas. Devuelve Registros, o None si la ventana no contiene ningún registro completo.
+    """
+    a = np.frombuffer(ventana, dtype=np.uint8)
+    hay_comillas = ventana.find(bytes([comilla])) != -1
+    if hay_comillas:
+        # Paridad de comillas: False desde una comilla de apertura hasta la de cierre (incluida la de apertura)
+        es_comilla = a == comilla
+        fuera = np.bitwise_xor.accumulate(es_comilla.view(np.uint8)) == 0
+
+    es_lf = a == LF
+    terminadores = es_lf & fuera if hay_comillas else es_lf
+    hay_cr = ventana.find(b'\r') != -1
+    if hay_cr:
+        es_cr = a == CR
+        cr_suelto = es_cr & fuera if hay_comillas else es_cr.copy()
+        cr_suelto[:-1] &= ~es_lf[1:]
+        if not es_final:
+            # No se sabe si el último CR va seguido de LF
+            cr_suelto[-1] = False
+        terminadores |= cr_suelto
+
+    posiciones = np.flatnonzero(terminadores)
+    if es_final:
+        corte = len(a)
+        if hay_comillas and not fuera[-1]:
+            raise _FormatoNoSoportado("El fichero termina dentro de un campo entre comillas")
+        finales = posiciones if len(posiciones) and posiciones[-1] == corte - 1 else np.append(posiciones, corte)
+    else:
+        if not len(posiciones):
+            return None
+        corte = int(posiciones[-1]) + 1
+        finales = posiciones
+
+    if hay_comillas:
+        _comprobar_comillas(a, corte, es_comilla, fuera, delimitador, comilla)
+
+    inicios = np.empty(len(finales), dtype=np.int64)
+    inicios[0] = 0
+    inicios[1:] = finales[:-1] + 1
+    if hay_cr:
+        # El CR de un CRLF no forma parte del registro
+        terminados_en_lf = (finales < len(a)) & es_lf[np.minimum(finales, len(a) - 1)]
+        finales = finales - (terminados_en_lf & (finales > inicios) & (a[np.maximum(finales - 1, 0)] == CR))
+
+    a = a[:corte]
+    es_delimitador = a == delimitador
+    if hay_comillas:
+        es_delimitador &= fuera[:corte]
+    campos = np.where(finales > inicios, _contar_por_registro(es_delimitador, inicios) + 1, 0)
+
+    if hay_comillas:
+        saltos = (es_lf | es_cr) if hay_cr else es_lf
+        con_saltos = _contar_por_registro(saltos[:corte] & ~fuera[:corte], inicios) > 0
+    else:
+        con_saltos = np.zeros(len(inicios), dtype=bool)
+
+    con_contenido = _registros_con_contenido(ventana, a, inicios, finales, sin_contenido)
+    return Registros(corte, inicios, finales, campos, con_saltos, con_contenido)
+
+def _registros_con_contenido(ventana, a, inicios, finales, sin_contenido, pasos=4):
+    """
+    Marca los registros con algún byte de texto. Casi todos lo tienen en sus primeros bytes,
+    así que se miran solo los 'pasos' primeros de cada registro a la vez y el resto de los
+    que quedan en duda se comprueba borrando de sus bytes los que no son texto.
+    """
+    con_contenido = np.zeros(len(inicios), dtype=bool)
+    pendientes = np.flatnonzero(finales > inicios)
+    for paso in range(pasos):
+        posiciones = inicios[pendientes] + paso
+        quedan = posiciones < finales[pendientes]
+        pendientes, posiciones = pendientes[quedan], posiciones[quedan]
+        if not len(pendientes):
+            return con_contenido
+        texto = ~sin_contenido[a[posiciones]]
+        con_contenido[pendientes[texto]] = True
+        pendientes = pendientes[~texto]
+    bytes_sin_texto = bytes(np.flatnonzero(sin_contenido).tolist())
+    for r in pendientes.tolist():
+        con_contenido[r] = bool(ventana[inicios[r] + pasos:finales[r]].translate(None, bytes_sin_texto))
+    return con_contenido
+
+def _contar_por_registro(mascara, inicios):
+    """Cuenta los True de 'mascara' dentro de cada registro (de un inicio al siguiente)."""
+    acumulados = np.searchsorted(np.flatnonzero(mascara), inicios)
+    return np.diff(np.append(acumulados, np.count_nonzero(mascara)))
+
+def _comprobar_comillas(a, corte, es_comilla, fuera, delimitador, comilla):
+    """
+    Lanza _FormatoNoSoportado si alguna comilla no delimita un campo: csv la trataría como texto
+    y la paridad de comillas dejaría de coincidir con lo que lee csv.
+    """
+    posiciones = np.flatnonzero(es_comilla[:corte])
+    separadores = np.array([delimitador, LF, CR, comilla], dtype=np.uint8)
+    abre = ~fuera[posiciones]
+    previo = a[np.maximum(posiciones - 1, 0)]
+    abre_bien = (posiciones == 0) | np.isin(previo, separadores)
+    siguiente = a[np.minimum(posiciones + 1, len(a) - 1)]
+    cierra_bien = (posiciones + 1 >= len(a)) | np.isin(siguiente, separadores)
+    if np.any(np.where(abre, ~abre_bien, ~cierra_bien)):
+        raise _FormatoNoSoportado("Hay comillas que no delimitan campos completos")
+
+def _leer_registro(ventana, inicio, fin, encoding, errores, formato):
+    """Decodifica y analiza con csv un único registro de la ventana."""
+    texto = ventana[inicio:fin].decode(encoding, errores)
+    return next(csv.reader(io.StringIO(texto, newline=''), **formato), [])
+
+def _escanear(ruta_csv, options, progreso, cancelacion):
+    logger.info(f"Iniciando validación por bytes para el fichero: {ruta_csv}")
+    resultados = validators.crear_resultados_vacios(ruta_csv)
+    encoding = options.get('encoding', 'utf-8')
+    errores = options.get('errores_codificacion', 'strict')
+    formato = validators._formato_csv(options)
+    delimitador, comilla = ord(formato['delimiter']), ord(formato['quotechar'])
+    sin_contenido = _tabla_sin_contenido(encoding, delimitador, comilla)
+    limite = options.get('max_contenido_por_categoria')
+    filas_invalidas = resultados['filas_invalidas']
+    check_vacias = options.get('check_vacias')
+    validar_fila = None
+    bytes_sustituidos = 0
+
+    try:
+        reportador = validators._crear_reportador(ruta_csv, progreso, cancelacion)
+        with open(ruta_csv, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            tam = len(mm)
+            inicio = 0
+            if codecs.lookup(encoding).name == 'utf-8-sig' and mm[:3] == codecs.BOM_UTF8:
+                # Se salta el BOM para que una comilla al principio de la cabecera abra el campo
+                inicio, encoding = 3, 'utf-8'
+            decodificador = codecs.getincrementaldecoder(encoding)(errores)
+            tam_ventana = TAM_VENTANA
+            num_filas = 0
+
+            while inicio < tam:
+                fin = min(inicio + tam_ventana, tam)
+                ventana = mm[inicio:fin]
+                registros = _separar_registros(ventana, fin == tam, delimitador, comilla, sin_contenido)
+                if registros is None:
+                    tam_ventana *= 2
+                    continue
+                tam_ventana = TAM_VENTANA
+                if registros.corte < len(ventana):
+                    ventana = ventana[:registros.corte]
+
+                # Comprobación de la codificación sin crear filas; lo ASCII siempre es válido
+                if decodificador.getstate()[0] or not ventana.isascii():
+                    with contar_errores_de_decodificacion() as errores_decodificacion:
+                        decodificador.decode(ventana, inicio + registros.corte == tam)
+                    bytes_sustituidos += errores_decodificacion['errores']
+
+                revisar = registros.con_saltos.copy()
+                primero = 0
+                if validar_fila is None:
+                    cabecera = _leer_registro(ventana, 0, registros.finales[0], encoding, errores, formato)
+                    validators._procesar_cabecera(cabecera, resultados, options, None)
+                    pipeline = PipelineReglas(ContextoReglas(options, resultados))
+                    if not set(pipeline.nombres) <= REGLAS_ESTRUCTURALES:
+                        raise _FormatoNoSoportado("Hay reglas registradas que necesitan el contenido de cada fila")
+                    validar_fila = pipeline.validar_fila
+                    esperadas = resultados['num_columnas_esperadas']
+                    primero = 1
+
+                invalidas = registros.campos != esperadas
+                revisar |= invalidas
+                if check_vacias:
+                    revisar |= ~registros.con_contenido
+                revisar[:primero] = False
+
+                for r in np.flatnonzero(revisar).tolist():
+                    linea = num_filas + r + 1
+                    if invalidas[r] and limite is not None and len(filas_invalidas) >= limite:
+                        filas_invalidas.append((linea, int(registros.campos[r]), None))
+                        continue
+                    fila = _leer_registro(ventana, registros.inicios[r], registros.finales[r], encoding, errores, formato)
+                    validar_fila(fila, linea)
+
+                num_filas += len(registros.inicios)
+                inicio += registros.corte
+                resultados['total_filas'] = num_filas
+                if reportador is not None:
+                    reportador.comprobar(num_filas, inicio)
+
+            if reportador is not None:
+                reportador.finalizar(num_filas, tam)
+
+    except ValidacionCancelada:
+        logger.warning(f"Validación por bytes de {ruta_csv} cancelada por el usuario en la fila {resultados['total_filas']}.")
+        resultados['cancelado'] = True
+    except (_FormatoNoSoportado, UnicodeDecodeError):
+        raise
+    except Exception:
+        logger.critical("Ha ocurrido una excepción no controlada durante la validación por bytes.", exc_info=True)
+        resultados['error_lectura'] = validators.MENSAJE_ERROR_CRITICO
+    validators._anotar_formato(resultados, ruta_csv, options, bytes_sustituidos)
+
+    logger.info("Validación por bytes finalizada. Devolviendo resultados.")
+    return resultados
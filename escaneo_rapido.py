@@ -0,0 +1,255 @@
+# escaneo_rapido.py
+
+import csv
+import io
+import logging
+import math
+import os
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+import validators
+from deteccion import ERRORES_REEMPLAZAR_Y_CONTAR, contar_errores_de_decodificacion, resolver_formato
+from escaneo_bytes import REGLAS_ESTRUCTURALES
+from reglas import REGLAS, ContextoReglas, PipelineReglas
+from validacion_paralela import _leer_cabecera, buscar_limites_de_registro, motivo_sin_paridad_de_comillas
+
+logger = logging.getLogger(__name__)
+
+NUM_MUESTRAS = 64
+TAM_MUESTRA = 256 * 1024
+CONFIANZA = 0.95
+# Registros de ejemplo (por su offset en bytes) que se guardan de cada categoría
+EJEMPLOS_POR_CATEGORIA = 10
+
+# Categorías que se estiman, como proporción de registros afectados
+CATEGORIAS = ('filas_invalidas', 'filas_vacias', 'celdas_con_saltos')
+
+def escanear_muestra(ruta_csv, options, num_muestras=NUM_MUESTRAS, tam_muestra=TAM_MUESTRA, confianza=CONFIANZA,
+                     umbrales=None, escalar=False, progreso=None, cancelacion=None):
+    """
+    Escaneo rápido para decidir si un fichero está roto sin leerlo entero: lee 'num_muestras'
+    rangos de 'tam_muestra' bytes repartidos por igual, se sitúa en el primer registro completo
+    de cada uno y aplica las comprobaciones estructurales (nº de columnas, filas vacías y saltos
+    de línea dentro de celdas). Para cada categoría devuelve la tasa de registros afectados con
+    su intervalo de confianza de Wilson y una estimación del total en el fichero.
+    'umbrales' es la tasa máxima admitida, un número para todas las categorías o un diccionario
+    por categoría (0 por defecto): las que la superan se devuelven en 'superan_umbral' y, con
+    'escalar', se hace además la validación completa (en 'validacion_completa', con 'progreso'
+    y 'cancelacion').
+    Si las muestras cubren todo el fichero, el resultado es exacto. Los ficheros comprimidos o
+    cuyo dialecto no permite localizar los registros por paridad de comillas (ver
+    validacion_paralela.buscar_limites_de_registro) se validan enteros y las tasas son exactas.
+    """
+    inicio_escaneo = time.perf_counter()
+    options = resolver_formato(ruta_csv, options)
+    escaneo = {
+        'ruta_archivo': ruta_csv, 'cabecera': None, 'num_columnas_esperadas': None, 'error_header': None,
+        'error_lectura': None, 'muestreo': None, 'estimaciones': {}, 'ejemplos': {},
+        'superan_umbral': [], 'validacion_completa': None,
+    }
+
+    motivo = motivo_sin_paridad_de_comillas(ruta_csv, options)
+    if motivo is not None:
+        logger.info(f"{motivo}; {ruta_csv} se valida entero en lugar de por muestras.")
+        completa = validators.realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+        _anotar_desde_validacion(escaneo, completa, options, confianza)
+        escaneo['muestreo']['motivo_completo'] = motivo
+    else:
+        try:
+            _muestrear(escaneo, ruta_csv, options, num_muestras, tam_muestra, confianza)
+        except FileNotFoundError:
+            logger.error(f"Error: Fichero no encontrado en la ruta {ruta_csv}")
+            escaneo['error_lectura'] = f"Fichero no encontrado: {ruta_csv}"
+            return escaneo
+        except Exception:
+            logger.critical("Ha ocurrido una excepción no controlada durante el escaneo rápido.", exc_info=True)
+            escaneo['error_lectura'] = validators.MENSAJE_ERROR_CRITICO
+            return escaneo
+
+    escaneo['superan_umbral'] = [categoria for categoria, estimacion in escaneo['estimaciones'].items()
+                                 if estimacion['tasa'] > _umbral(umbrales, categoria)]
+    if escalar and escaneo['superan_umbral'] and escaneo['validacion_completa'] is None:
+        logger.info(f"Las categorías {escaneo['superan_umbral']} superan el umbral en {ruta_csv}; se valida el fichero completo.")
+        escaneo['validacion_completa'] = validators.realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+    escaneo['muestreo']['segundos'] = round(time.perf_counter() - inicio_escaneo, 3)
+    return escaneo
+
+def tiene_errores_estimados(escaneo):
+    """Indica si un escaneo rápido encontró algún error, en las muestras o en la validación completa."""
+    if escaneo.get('error_header') or any(e['encontrados'] for e in escaneo['estimaciones'].values()):
+        return True
+    completa = escaneo.get('validacion_completa')
+    return bool(completa) and validators.tiene_errores(completa)
+
+def serializar_escaneo(escaneo):
+    """Convierte un escaneo rápido en una estructura serializable en JSON."""
+    serializable = dict(escaneo)
+    if escaneo.get('validacion_completa'):
+        serializable['validacion_completa'] = validators.serializar_resultados(escaneo['validacion_completa'])
+    serializable['tiene_errores'] = tiene_errores_estimados(escaneo)
+    return serializable
+
+def intervalo_wilson(exitos, total, confianza=CONFIANZA):
+    """Intervalo de confianza de Wilson para una proporción; se comporta bien con tasas cercanas a 0."""
+    if not total:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confianza / 2)
+    p = exitos / total
+    denominador = 1 + z * z / total
+    centro = (p + z * z / (2 * total)) / denominador
+    margen = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominador
+    inferior = 0.0 if not exitos else max(0.0, centro - margen)
+    return inferior, min(1.0, centro + margen)
+
+def _umbral(umbrales, categoria):
+    if isinstance(umbrales, dict):
+        return umbrales.get(categoria, 0)
+    return umbrales or 0
+
+def _categorias_activas(options):
+    return [categoria for categoria in CATEGORIAS if categoria != 'filas_vacias' or options.get('check_vacias')]
+
+def _muestrear(escaneo, ruta_csv, options, num_muestras, tam_muestra, confianza):
+    tam_fichero = os.path.getsize(ruta_csv)
+    encoding = options.get('encoding', 'utf-8')
+    formato = validators._formato_csv(options)
+    comilla = formato['quotechar'].encode(encoding)
+
+    primera_fila, fin_cabecera = None, 0
+    if tam_fichero:
+        primera_fila, fin_cabecera = _leer_cabecera(ruta_csv, dict(options, errores_codificacion=ERRORES_REEMPLAZAR_Y_CONTAR), comilla)
+    if primera_fila is None:
+        logger.warning(f"El fichero {ruta_csv} está vacío o no tiene contenido.")
+        primera_fila = []
+    escaneo['cabecera'] = primera_fila
+    escaneo['num_columnas_esperadas'] = len(primera_fila)
+    escaneo['error_header'] = validators.validar_cabecera(primera_fila, options) if primera_fila else None
+
+    cuerpo = tam_fichero - fin_cabecera
+    exacto = num_muestras * tam_muestra >= cuerpo
+    if exacto:
+        # Las muestras cubrirían todo el fichero: se lee entero en trozos que empiezan y acaban en un registro
+        limites = buscar_limites_de_registro(ruta_csv, fin_cabecera, tam_muestra, comilla) if cuerpo > 0 else [fin_cabecera]
+        rangos = [(inicio, fin, True) for inicio, fin in zip(limites, limites[1:])]
+    else:
+        paso = cuerpo / num_muestras
+        rangos = [(fin_cabecera + int(i * paso), fin_cabecera + int(i * paso) + tam_muestra, i == 0) for i in range(num_muestras)]
+
+    resultados = validators.crear_resultados_vacios(ruta_csv)
+    resultados['cabecera'] = primera_fila
+    resultados['num_columnas_esperadas'] = len(primera_fila)
+    reglas = {nombre: regla for nombre, regla in REGLAS.items() if nombre in REGLAS_ESTRUCTURALES}
+    validar_fila = PipelineReglas(ContextoReglas(options, resultados), reglas=reglas).validar_fila
+
+    afectados = {categoria: [] for categoria in CATEGORIAS}
+    registros = bytes_analizados = bytes_leidos = 0
+    with open(ruta_csv, 'rb') as f, contar_errores_de_decodificacion() as errores_decodificacion:
+        for inicio, fin, alineado in rangos:
+            f.seek(inicio)
+            datos = f.read(fin - inicio)
+            bytes_leidos += len(datos)
+            filas, offsets = _registros_de_muestra(datos, alineado, exacto or inicio + len(datos) >= tam_fichero,
+                                                   comilla, encoding, formato, len(primera_fila))
+            if not filas:
+                continue
+            bytes_analizados += offsets[-1] - offsets[0]
+            for categoria in CATEGORIAS:
+                resultados[categoria].clear()
+            for num, fila in enumerate(filas):
+                validar_fila(fila, num)
+            filas_afectadas = {
+                'filas_invalidas': [num for num, _, _ in resultados['filas_invalidas']],
+                'filas_vacias': resultados['filas_vacias'],
+                'celdas_con_saltos': sorted({num for num, _, _ in resultados['celdas_con_saltos']}),
+            }
+            for categoria, nums in filas_afectadas.items():
+                afectados[categoria].extend(inicio + offsets[num] for num in nums)
+            registros += len(filas)
+
+    registros_estimados = registros if exacto else round(registros / bytes_analizados * cuerpo) if bytes_analizados else 0
+    escaneo['muestreo'] = {
+        'exacto': exacto, 'muestras': len(rangos), 'tam_muestra': tam_muestra, 'confianza': confianza,
+        'tam_fichero': tam_fichero, 'bytes_leidos': bytes_leidos,
+        'registros_muestreados': registros, 'registros_estimados': registros_estimados,
+        'bytes_no_decodificables': errores_decodificacion['errores'],
+    }
+    for categoria in _categorias_activas(options):
+        escaneo['estimaciones'][categoria] = _estimacion(len(afectados[categoria]), registros, registros_estimados, confianza, exacto)
+        escaneo['ejemplos'][categoria] = afectados[categoria][:EJEMPLOS_POR_CATEGORIA]
+    logger.info(f"Escaneo rápido de {ruta_csv}: {registros} registros en {len(rangos)} muestras "
+                f"({bytes_leidos:,} de {tam_fichero:,} bytes).")
+
+def _registros_de_muestra(datos, empieza_en_registro, llega_al_final, comilla, encoding, formato, esperadas):
+    """
+    Devuelve las filas completas de una muestra y el offset (relativo a la muestra) donde empieza
+    cada una, más el final de la última. Si la muestra no empieza en un registro no se sabe si su
+    primer byte está dentro de unas comillas, así que se prueban las dos posibilidades y se elige
+    la que da menos filas con un número de columnas distinto al de la cabecera.
+    """
+    mejor = None
+    for paridad_inicial in ((0,) if empieza_en_registro else (0, 1)):
+        offsets = _limites_en_muestra(datos, paridad_inicial, comilla, empieza_en_registro, llega_al_final)
+        if len(offsets) < 2:
+            continue
+        texto = datos[offsets[0]:offsets[-1]].decode(encoding, ERRORES_REEMPLAZAR_Y_CONTAR)
+        filas = list(csv.reader(io.StringIO(texto, newline=''), **formato))
+        if len(filas) != len(offsets) - 1:
+            # Un registro que el módulo csv separa de otra forma (p. ej. por un '\r' suelto):
+            # las filas se validan igual, pero todas se sitúan al principio de la muestra.
+            offsets = [offsets[0]] * len(filas) + [offsets[-1]]
+        erroneas = sum(len(fila) != esperadas for fila in filas)
+        if mejor is None or erroneas < mejor[0]:
+            mejor = (erroneas, filas, offsets)
+        if not erroneas:
+            break
+    if mejor is None:
+        return [], []
+    return mejor[1], mejor[2]
+
+def _limites_en_muestra(datos, paridad, comilla, empieza_en_registro, llega_al_final):
+    """
+    Offsets de la muestra justo después de cada salto de línea fuera de comillas, suponiendo
+    que su primer byte tiene la 'paridad' de comillas indicada. El primero es el inicio del primer
+    registro completo y el último, el final del último (el final de la muestra si llega al del fichero).
+    """
+    a = np.frombuffer(datos, dtype=np.uint8)
+    saltos = np.flatnonzero(a == ord('\n'))
+    # Paridad de las comillas vistas hasta cada salto de línea
+    paridades = np.bitwise_xor.accumulate((a == comilla[0]).view(np.uint8))[saltos] ^ paridad
+    limites = (saltos[paridades == 0] + 1).tolist()
+    if empieza_en_registro:
+        limites.insert(0, 0)
+    if llega_al_final and limites and limites[-1] < len(datos):
+        limites.append(len(datos))
+    return limites
+
+def _estimacion(encontrados, registros, registros_estimados, confianza, exacto):
+    tasa = encontrados / registros if registros else 0.0
+    intervalo = (tasa, tasa) if exacto else intervalo_wilson(encontrados, registros, confianza)
+    return {
+        'encontrados': encontrados,
+        'tasa': tasa,
+        'intervalo': [intervalo[0], intervalo[1]],
+        'estimados_en_fichero': encontrados if exacto else round(tasa * registros_estimados),
+    }
+
+def _anotar_desde_validacion(escaneo, completa, options, confianza):
+    """Rellena un escaneo con las tasas exactas de una validación completa."""
+    escaneo['validacion_completa'] = completa
+    escaneo['cabecera'] = completa['cabecera']
+    escaneo['num_columnas_esperadas'] = completa['num_columnas_esperadas']
+    escaneo['error_header'] = completa['error_header']
+    escaneo['error_lectura'] = completa['error_lectura']
+    registros = max(completa['total_filas'] - 1, 0)
+    escaneo['muestreo'] = {'exacto': True, 'muestras': 1, 'confianza': confianza,
+                           'registros_muestreados': registros, 'registros_estimados': registros}
+    conteos = {
+        'filas_invalidas': len(completa['filas_invalidas']),
+        'filas_vacias': len(completa['filas_vacias']),
+        'celdas_con_saltos': len({num for num, _, _ in completa['celdas_con_saltos']}),
+    }
+    for categoria in _categorias_activas(options):
+        escaneo['estimaciones'][categoria] = _estimacion(conteos[categoria], registros, registros, confianza, True)
@@ -0,0 +1,293 @@
+# esquema.py
+
+import json
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter, le
+
+from reglas import registrar_regla
+
+# Separador con el que se unen las celdas para comprobar una fila con una sola expresión regular.
+# No es un espacio para \s ni para str.strip(), así que no altera las comprobaciones de cada celda.
+SEPARADOR = '\x00'
+_CELDA_LIBRE = '[^\x00]*'
+
+TIPOS = ('texto', 'entero', 'decimal', 'fecha')
+CLAVES_COLUMNA = frozenset({'tipo', 'obligatorio', 'patron', 'valores', 'longitud_min', 'longitud_max',
+                            'min', 'max', 'formato', 'separador_decimal'})
+FORMATO_FECHA = '%Y-%m-%d'
+
+_ENTERO = '[+-]?[0-9]+'
+# Construcciones de un patrón que miran fuera de la celda: unido a las demás columnas podría
+# aceptar lo que por separado rechaza, así que esos patrones se comprueban celda a celda
+_MIRA_FUERA = re.compile(r'\(\?<?[=!]|\\[bBAZ]|[$^]')
+
+# Fechas distintas que se recuerdan por columna: suelen repetirse mucho y strptime es lento
+FECHAS_EN_CACHE = 4096
+
+# Una columna del esquema ya compilada. 'comprobar(valor)' devuelve el motivo del error o None.
+# 'patron_rapido' es una expresión equivalente a 'comprobar' (solo si la hay, si no None), con la
+# que se comprueban muchas celdas a la vez; las columnas sin ella se comprueban siempre una a una.
+# En columnas numéricas con mínimo o máximo, el patrón solo cubre la sintaxis y 'limites'
+# (tipo, separador decimal, mínimo, máximo) el rango; en el resto, 'limites' es None.
+ColumnaEsquema = namedtuple('ColumnaEsquema', ['indice', 'nombre', 'comprobar', 'patron_rapido', 'limites', 'definicion'])
+
+def _patron_decimal(separador):
+    separador = re.escape(separador)
+    return f'[+-]?(?:[0-9]+(?:{separador}[0-9]*)?|{separador}[0-9]+)'
+
+def _crear_conversor(definicion):
+    """Devuelve (conversor, motivo si falla) del tipo de la columna, o (None, None) para texto."""
+    tipo = definicion.get('tipo', 'texto')
+    if tipo == 'entero':
+        entero = re.compile(_ENTERO)
+        def convertir(valor):
+            if not entero.fullmatch(valor):
+                raise ValueError(valor)
+            return int(valor)
+        return convertir, "No es un número entero"
+    if tipo == 'decimal':
+        separador = definicion.get('separador_decimal', '.')
+        decimal = re.compile(_patron_decimal(separador))
+        def convertir(valor):
+            if not decimal.fullmatch(valor):
+                raise ValueError(valor)
+            return float(valor.replace(separador, '.'))
+        return convertir, "No es un número decimal"
+    if tipo == 'fecha':
+        formato = definicion.get('formato', FORMATO_FECHA)
+        @lru_cache(maxsize=FECHAS_EN_CACHE)
+        def convertir(valor):
+            return datetime.strptime(valor, formato)
+        return convertir, f"No es una fecha con formato '{formato}'"
+    return None, None
+
+def _crear_comprobador(definicion):
+    """
+    Construye la función que valida una celda de la columna. Todo se prepara aquí (expresiones,
+    conjunto de valores, límites ya convertidos), así que por celda solo queda comparar.
+    Las celdas vacías o con solo espacios son nulas: fallan si la columna es obligatoria y en
+    otro caso no se comprueban. El patrón se aplica al valor tal cual; el resto, sin espacios
+    al principio y al final.
+    """
+    obligatorio = bool(definicion.get('obligatorio'))
+    patron = re.compile(definicion['patron']) if definicion.get('patron') is not None else None
+    valores = frozenset(str(v).strip() for v in definicion['valores']) if definicion.get('valores') is not None else None
+    longitud_min = definicion.get('longitud_min')
+    longitud_max = definicion.get('longitud_max')
+    convertir, motivo_tipo = _crear_conversor(definicion)
+    limites = _limites(definicion)
+    minimo = maximo = None
+    if limites is not None:
+        minimo, maximo = limites[2:]
+    elif convertir is not None:
+        minimo = convertir(str(definicion['min'])) if definicion.get('min') is not None else None
+        maximo = convertir(str(definicion['max'])) if definicion.get('max') is not None else None
+
+    def comprobar(valor):
+        recortado = valor.strip()
+        if not recortado:
+            return "Valor obligatorio vacío" if obligatorio else None
+        if patron is not None and not patron.fullmatch(valor):
+            return f"No cumple el patrón '{patron.pattern}'"
+        if valores is not None and recortado not in valores:
+            return "No es uno de los valores permitidos"
+        if longitud_min is not None and len(recortado) < longitud_min:
+            return f"Tiene menos de {longitud_min} caracteres"
+        if longitud_max is not None and len(recortado) > longitud_max:
+            return f"Tiene más de {longitud_max} caracteres"
+        if convertir is not None:
+            try:
+                dato = convertir(recortado)
+            except ValueError:
+                return motivo_tipo
+            if minimo is not None and dato < minimo:
+                return f"Es menor que el mínimo ({definicion['min']})"
+            if maximo is not None and dato > maximo:
+                return f"Es mayor que el máximo ({definicion['max']})"
+        return None
+    return comprobar
+
+def _patron_rapido(definicion):
+    """
+    Expresión regular que acepta exactamente las celdas válidas de la columna, o None si sus
+    restricciones no se pueden expresar así (longitudes, fechas o varias restricciones a la vez).
+    Nunca puede aceptar algo que comprobar() rechace, salvo números fuera de rango: el rango se
+    comprueba aparte (ver _crear_en_rango).
+    """
+    tipo = definicion.get('tipo', 'texto')
+    claves = ('patron', 'valores', 'longitud_min', 'longitud_max')
+    if tipo not in ('entero', 'decimal'):
+        claves += ('min', 'max')
+    restricciones = [clave for clave in claves if definicion.get(clave) is not None]
+    if tipo == 'fecha' or len(restricciones) + (tipo != 'texto') > 1:
+        return None
+
+    if tipo == 'entero':
+        nucleo = rf'\s*{_ENTERO}\s*'
+    elif tipo == 'decimal':
+        nucleo = rf"\s*{_patron_decimal(definicion.get('separador_decimal', '.'))}\s*"
+    elif not restricciones:
+        nucleo = rf'\s*[^\s\x00]{_CELDA_LIBRE}'
+    elif restricciones == ['patron']:
+        # Con grupos, sus números cambiarían al unir las columnas en una sola expresión
+        if re.compile(definicion['patron']).groups or _MIRA_FUERA.search(definicion['patron']):
+            return None
+        nucleo = f"(?:{definicion['patron']})"
+    elif restricciones == ['valores']:
+        valores = sorted({str(v).strip() for v in definicion['valores']}, key=len, reverse=True)
+        if '' in valores:
+            return None
+        nucleo = rf"\s*(?:{'|'.join(map(re.escape, valores))})\s*"
+    else:
+        return None
+
+    if definicion.get('obligatorio'):
+        # Un patrón podría aceptar una celda en blanco que comprobar() rechaza por vacía
+        patron = rf'(?=\s*[^\s\x00])(?:{nucleo})' if restricciones == ['patron'] else nucleo
+    else:
+        patron = rf'(?:\s*|{nucleo})'
+    try:
+        re.compile(patron)
+    except re.error:
+        # P. ej. un patrón con opciones globales como (?i), que solo se admiten al principio
+        return None
+    return patron
+
+def _limites(definicion):
+    """(tipo, separador decimal, mínimo, máximo) de una columna numérica con rango, o None."""
+    if definicion.get('tipo') not in ('entero', 'decimal') or (definicion.get('min') is None and definicion.get('max') is None):
+        return None
+    separador = definicion.get('separador_decimal', '.')
+    convertir = int if definicion['tipo'] == 'entero' else (lambda valor: float(valor.replace(separador, '.')))
+    # Los límites pueden venir como números del JSON o como texto con el separador de la columna
+    minimo = convertir(str(definicion['min'])) if definicion.get('min') is not None else None
+    maximo = convertir(str(definicion['max'])) if definicion.get('max') is not None else None
+    return definicion['tipo'], separador, minimo, maximo
+
+def _selector(indices):
+    """Función (fila) -> tupla con las celdas de esos índices."""
+    if len(indices) == 1:
+        return lambda fila, indice=indices[0]: (fila[indice],)
+    return itemgetter(*indices)
+
+def _crear_en_rango(columnas):
+    """
+    Función (fila) -> bool que indica si todas las celdas con rango de una fila que ya cumple
+    el patrón rápido están dentro de él, o None si ninguna columna tiene rango. Las columnas se
+    agrupan por conversión, y cada grupo se convierte y compara con map, sin código Python
+    por celda. Una celda en blanco no se puede convertir y hace que la fila se compruebe entera.
+    """
+    grupos = {}
+    for columna in columnas:
+        if columna.limites is None:
+            continue
+        tipo, separador, minimo, maximo = columna.limites
+        if tipo == 'entero':
+            convertir = int
+        elif separador == '.':
+            convertir = float
+        else:
+            convertir = lambda valor, separador=separador: float(valor.replace(separador, '.'))
+        indices, bajos, altos = grupos.setdefault(convertir, ([], [], []))
+        indices.append(columna.indice)
+        bajos.append(minimo if minimo is not None else float('-inf'))
+        altos.append(maximo if maximo is not None else float('inf'))
+    if not grupos:
+        return None
+    comprobaciones = [(_selector(indices), convertir, bajos, altos) for convertir, (indices, bajos, altos) in grupos.items()]
+
+    def en_rango(fila):
+        try:
+            for seleccionar, convertir, bajos, altos in comprobaciones:
+                datos = list(map(convertir, seleccionar(fila)))
+                if not (all(map(le, bajos, datos)) and all(map(le, datos, altos))):
+                    return False
+        except ValueError:
+            return False
+        return True
+    return en_rango
+
+def validar_definicion(esquema):
+    """Comprueba que el esquema está bien formado. Lanza ValueError con el motivo si no lo está."""
+    if not isinstance(esquema, dict) or not isinstance(esquema.get('columnas'), dict) or not esquema['columnas']:
+        raise ValueError("El esquema debe ser un objeto con 'columnas': {nombre de columna: definición}.")
+    for nombre, definicion in esquema['columnas'].items():
+        if not isinstance(definicion, dict):
+            raise ValueError(f"La definición de la columna '{nombre}' debe ser un objeto.")
+        desconocidas = set(definicion) - CLAVES_COLUMNA
+        if desconocidas:
+            raise ValueError(f"Claves desconocidas en la columna '{nombre}': {', '.join(sorted(desconocidas))}.")
+        if definicion.get('tipo', 'texto') not in TIPOS:
+            raise ValueError(f"Tipo desconocido en la columna '{nombre}': '{definicion['tipo']}'. Opciones: {', '.join(TIPOS)}.")
+        try:
+            _crear_comprobador(definicion)
+        except re.error as error:
+            raise ValueError(f"Patrón no válido en la columna '{nombre}': {error}") from None
+        except (ValueError, TypeError) as error:
+            raise ValueError(f"Mínimo o máximo no válido en la columna '{nombre}': {error}") from None
+
+def cargar_esquema(ruta):
+    """Lee un esquema JSON y lo valida. Lanza ValueError si no es correcto."""
+    with open(ruta, 'r', encoding='utf-8') as f:
+        esquema = json.load(f)
+    validar_definicion(esquema)
+    return esquema
+
+def columnas_ausentes(esquema, cabecera):
+    """Errores de esquema (en la línea 1) de las columnas del esquema que no están en la cabecera."""
+    presentes = set(cabecera)
+    return [(1, nombre, None, "La columna no existe en la cabecera")
+            for nombre in esquema['columnas'] if nombre not in presentes]
+
+def compilar_esquema(esquema, cabecera):
+    """Devuelve las ColumnaEsquema de las columnas presentes en la cabecera, en el orden de la cabecera."""
+    columnas = []
+    for nombre, definicion in esquema['columnas'].items():
+        if nombre in cabecera:
+            patron_rapido = _patron_rapido(definicion)
+            columnas.append(ColumnaEsquema(cabecera.index(nombre), nombre, _crear_comprobador(definicion), patron_rapido,
+                                           _limites(definicion) if patron_rapido is not None else None, definicion))
+    return sorted(columnas, key=lambda columna: columna.indice)
+
+def compilar_patron_fila(columnas):
+    """Une los patrones rápidos de las columnas en uno solo para la fila, o None si no se puede."""
+    if all(columna.patron_rapido is None for columna in columnas):
+        return None
+    return re.compile(SEPARADOR.join(columna.patron_rapido or _CELDA_LIBRE for columna in columnas))
+
+@registrar_regla('esquema', 50, en_cabecera=False)
+def _regla_esquema(contexto):
+    esquema = contexto.options.get('esquema')
+    if not esquema:
+        return None
+    columnas = compilar_esquema(esquema, contexto.resultados['cabecera'])
+    if not columnas:
+        return None
+    errores = contexto.resultados['errores_de_esquema']
+    limite = contexto.options.get('max_contenido_por_categoria')
+    patron_fila = compilar_patron_fila(columnas)
+    en_rango = _crear_en_rango(columnas)
+    # Las columnas que el patrón de la fila no cubre se comprueban siempre; las que tienen
+    # rango, también si alguna celda de la fila puede estar fuera de él
+    lentas = [columna for columna in columnas if columna.patron_rapido is None]
+    lentas_y_con_rango = [columna for columna in columnas if columna.patron_rapido is None or columna.limites is not None]
+    num_separadores = len(columnas) - 1
+    seleccionar = _selector([columna.indice for columna in columnas])
+
+    def regla(fila, num_fila):
+        # Las filas llegan aquí con el nº de columnas de la cabecera, así que los índices son válidos.
+        pendientes = columnas
+        if patron_fila is not None:
+            texto = SEPARADOR.join(seleccionar(fila))
+            # Si alguna celda contiene el separador no se puede saber dónde acaba cada una
+            if texto.count(SEPARADOR) == num_separadores and patron_fila.fullmatch(texto):
+                pendientes = lentas if en_rango is None or en_rango(fila) else lentas_y_con_rango
+        for columna in pendientes:
+            motivo = columna.comprobar(fila[columna.indice])
+            if motivo is not None:
+                valor = fila[columna.indice] if limite is None or len(errores) < limite else None
+                errores.append((num_fila, columna.nombre, valor, motivo))
+    return regla
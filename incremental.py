@@ -0,0 +1,264 @@
+# incremental.py
+
+import csv
+import hashlib
+import logging
+import os
+import pickle
+import re
+import tempfile
+
+import validators
+from cache_resultados import OPCIONES_IGNORADAS, _resumen_opciones, directorio_por_defecto
+from claves import preparar_claves
+from compresion import detectar_compresion
+from deteccion import compatible_con_ascii, contar_errores_de_decodificacion, resolver_formato
+from indices import IndiceResumen
+from progreso import ReportadorProgreso, ValidacionCancelada, MASCARA_FILAS
+from reglas import ContextoReglas, PipelineReglas
+
+logger = logging.getLogger(__name__)
+
+VERSION_ESTADO = 1
+# Bytes del principio del fichero y de justo antes del punto de reanudación que se comparan
+# para comprobar que lo ya validado no ha cambiado
+TAM_HUELLA_PREFIJO = 64 * 1024
+
+# Un retorno de carro que no va seguido de salto de línea también termina una línea
+_RETORNO_AISLADO = re.compile(rb'(?<=\r)(?!\n)')
+
+class _LineasConPosicion:
+    """
+    Recorre un fichero binario por líneas decodificadas, como haría un fichero de texto con
+    newline='', llevando la cuenta de los bytes consumidos. csv.reader solo pide una línea más
+    cuando la necesita, así que tras cada registro 'posicion' es el byte donde termina.
+    'comillas' cuenta los bytes de comilla desde la última vez que se puso a cero, para saber si
+    el último registro quedó con unas comillas abiertas.
+    """
+    def __init__(self, f, posicion, encoding, errores, comilla):
+        self.f = f
+        self.posicion = posicion
+        self.encoding = encoding
+        self.errores = errores
+        self.comilla = comilla
+        self.comillas = 0
+        self.terminada = True
+
+    def __iter__(self):
+        for linea in self.f:
+            trozos = _RETORNO_AISLADO.split(linea) if b'\r' in linea else (linea,)
+            for trozo in trozos:
+                if not trozo:
+                    continue
+                self.posicion += len(trozo)
+                self.comillas += trozo.count(self.comilla)
+                self.terminada = trozo.endswith((b'\n', b'\r'))
+                yield trozo.decode(self.encoding, self.errores)
+
+def directorio_estado_por_defecto():
+    return os.path.join(directorio_por_defecto(), 'incremental')
+
+def ruta_estado(ruta_csv, options, directorio=None):
+    """Fichero donde se guarda el estado de la validación incremental de 'ruta_csv' con esas opciones."""
+    nombre = hashlib.blake2b(os.path.abspath(ruta_csv).encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(directorio or directorio_estado_por_defecto(), f"{nombre}_{_resumen_opciones(options)}.estado")
+
+def _huella_prefijo(ruta_csv, offset, tam=TAM_HUELLA_PREFIJO):
+    """Resumen del principio del fichero y de los bytes justo anteriores a 'offset'."""
+    resumen = hashlib.blake2b(str(offset).encode('ascii'), digest_size=16)
+    with open(ruta_csv, 'rb') as f:
+        resumen.update(f.read(min(tam, offset)))
+        f.seek(max(0, offset - tam))
+        resumen.update(f.read(offset - f.tell()))
+    return resumen.hexdigest()
+
+def _opciones_comparables(options):
+    return {clave: valor for clave, valor in options.items() if clave not in OPCIONES_IGNORADAS}
+
+def _cargar_estado(ruta, ruta_csv, options):
+    """Devuelve el estado guardado si sigue siendo válido para el fichero actual, o None."""
+    try:
+        with open(ruta, 'rb') as f:
+            estado = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        logger.warning(f"No se pudo leer el estado incremental {ruta}; se valida el fichero completo.", exc_info=True)
+        return None
+
+    if estado.get('version') != VERSION_ESTADO or estado['ruta'] != os.path.abspath(ruta_csv) \
+            or estado['opciones'] != _opciones_comparables(options):
+        return None
+    try:
+        if os.path.getsize(ruta_csv) < estado['offset'] or _huella_prefijo(ruta_csv, estado['offset']) != estado['huella_prefijo']:
+            logger.info(f"{ruta_csv} ha cambiado antes del byte {estado['offset']}; se valida completo de nuevo.")
+            return None
+    except OSError:
+        return None
+    return estado
+
+def _guardar_estado(ruta, datos):
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+    except OSError:
+        logger.warning(f"No se pudo guardar el estado incremental en {ruta}.", exc_info=True)
+
+def _motivo_no_aplicable(ruta_csv, options):
+    """Devuelve por qué el fichero no admite validación incremental, o None si la admite."""
+    if options.get('instrumentar'):
+        return "La instrumentación mide una lectura completa"
+    if detectar_compresion(ruta_csv):
+        return "El fichero está comprimido y no se puede leer a partir de una posición"
+    if options.get('parada'):
+        return "Una parada anticipada dejaría sin validar filas que no se volverían a leer"
+    return None
+
+def _anotar_sustituciones(resultados, ruta_csv, options, sustituidos):
+    """Como validators._anotar_formato, pero suma los bytes sustituidos a los de ejecuciones anteriores."""
+    if sustituidos and resultados.get('error_codificacion'):
+        resultados['error_codificacion']['bytes_sustituidos'] = resultados['error_codificacion'].get('bytes_sustituidos', 0) + sustituidos
+    else:
+        validators._anotar_formato(resultados, ruta_csv, options, sustituidos)
+
+def validar_incremental(ruta_csv, options, progreso=None, cancelacion=None, directorio=None):
+    """
+    Valida un fichero al que solo se le añaden filas al final (p. ej. un log) leyendo únicamente
+    lo añadido desde la ejecución anterior. Tras cada validación se guarda en 'directorio' (por
+    defecto, dentro de la caché del usuario) el byte donde termina el último registro completo,
+    los resultados hasta ahí y los índices de duplicados, unicidad y claves únicas en forma de
+    resúmenes de 128 bits (ver indices.IndiceResumen). La siguiente ejecución con las mismas opciones continúa
+    desde ese byte y devuelve los resultados del fichero completo, igual que
+    realizar_validacion_completa.
+    Si el principio del fichero o lo anterior al punto de reanudación ha cambiado, o cambian las
+    opciones, se valida el fichero completo de nuevo. Un último registro sin terminar (sin salto
+    de línea o con unas comillas abiertas) se valida, pero no se da por visto: se vuelve a leer la
+    próxima vez por si el proceso que escribe aún no lo había completado.
+    Los resultados incluyen 'incremental' con el byte inicial, los bytes y filas leídos y si se
+    ha reanudado un estado anterior.
+    """
+    motivo = _motivo_no_aplicable(ruta_csv, options)
+    if motivo is not None:
+        logger.info(f"Validación incremental no aplicable a {ruta_csv} ({motivo}); se valida completo.")
+        return validators.realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+
+    ruta = ruta_estado(ruta_csv, options, directorio)
+    estado = _cargar_estado(ruta, ruta_csv, options)
+    if estado is None:
+        opciones_resueltas = resolver_formato(ruta_csv, options)
+        if not compatible_con_ascii(opciones_resueltas.get('encoding', 'utf-8')):
+            logger.info(f"Validación incremental no aplicable a {ruta_csv} (la codificación "
+                        f"{opciones_resueltas.get('encoding')} no es compatible con ASCII); se valida completo.")
+            return validators.realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+        seen_rows_and_lines, unique_column_values = IndiceResumen(), IndiceResumen()
+        estado = {
+            'version': VERSION_ESTADO, 'ruta': os.path.abspath(ruta_csv), 'opciones': _opciones_comparables(options),
+            # La codificación y el dialecto detectados se conservan para no volver a detectarlos
+            'opciones_resueltas': opciones_resueltas, 'offset': 0, 'huella_prefijo': None,
+            'resultados': validators.crear_resultados_vacios(ruta_csv), 'unique_col_index': -1,
+            'indices': (seen_rows_and_lines, unique_column_values), 'claves_unicas': [],
+        }
+        reanudada = False
+    else:
+        reanudada = True
+        logger.info(f"Reanudando la validación de {ruta_csv} desde el byte {estado['offset']}.")
+
+    options = estado['opciones_resueltas']
+    resultados = estado['resultados']
+    # El estado guarda la ruta tal como se escribió la primera vez; se devuelve la de esta llamada
+    resultados['ruta_archivo'] = ruta_csv
+    # Los estados anteriores a las claves únicas y a las paradas anticipadas no las tienen
+    resultados.setdefault('claves_repetidas', [])
+    resultados.setdefault('parada_anticipada', None)
+    claves_unicas = estado.setdefault('claves_unicas', [])
+    seen_rows_and_lines, unique_column_values = estado['indices']
+    offset_inicial = estado['offset']
+    encoding = options.get('encoding', 'utf-8')
+    comilla = validators._formato_csv(options)['quotechar'].encode(encoding)
+    con_escape = bool(validators._formato_csv(options)['escapechar'])
+    filas_iniciales = resultados['total_filas']
+    datos_estado = None
+    lineas = None
+    errores_decodificacion = {'errores': 0}
+    sustituidos_anotados = 0
+
+    try:
+        reportador = None
+        if progreso is not None or cancelacion is not None:
+            reportador = ReportadorProgreso(progreso, cancelacion, os.path.getsize(ruta_csv) - offset_inicial)
+        with contar_errores_de_decodificacion() as errores_decodificacion, open(ruta_csv, 'rb') as f:
+            f.seek(offset_inicial)
+            lineas = _LineasConPosicion(f, offset_inicial, encoding, options.get('errores_codificacion', 'strict'), comilla)
+            validar_fila = None
+            if resultados['total_filas']:
+                contexto = ContextoReglas(options, resultados, seen_rows_and_lines, estado['unique_col_index'], unique_column_values, claves_unicas)
+                validar_fila = PipelineReglas(contexto).validar_fila
+
+            def procesar(fila):
+                nonlocal validar_fila
+                if not resultados['total_filas']:
+                    estado['unique_col_index'] = validators._procesar_cabecera(fila, resultados, options, seen_rows_and_lines)
+                    claves_unicas.extend(preparar_claves(fila, options, IndiceResumen))
+                    contexto = ContextoReglas(options, resultados, seen_rows_and_lines, estado['unique_col_index'], unique_column_values, claves_unicas)
+                    validar_fila = PipelineReglas(contexto).validar_fila
+                    return
+                resultados['total_filas'] += 1
+                validar_fila(fila, resultados['total_filas'])
+
+            # Cada registro se procesa al leer el siguiente, para saber si el último está completo
+            pendiente = None
+            for fila in csv.reader(lineas, **validators._formato_csv(options)):
+                if pendiente is not None:
+                    procesar(pendiente[0])
+                    estado['offset'] = pendiente[1]
+                pendiente = (fila, lineas.posicion, lineas.comillas % 2 == 0 or con_escape)
+                lineas.comillas = 0
+                if reportador is not None and not resultados['total_filas'] & MASCARA_FILAS:
+                    reportador.comprobar(resultados['total_filas'], lineas.posicion - offset_inicial)
+
+            if pendiente is not None:
+                completo = lineas.terminada and pendiente[2]
+                if completo:
+                    procesar(pendiente[0])
+                    estado['offset'] = pendiente[1]
+                if estado['offset']:
+                    sustituidos_anotados = errores_decodificacion['errores']
+                    _anotar_sustituciones(resultados, ruta_csv, options, sustituidos_anotados)
+                    estado['huella_prefijo'] = _huella_prefijo(ruta_csv, estado['offset'])
+                    datos_estado = pickle.dumps(estado, protocol=pickle.HIGHEST_PROTOCOL)
+                if not completo:
+                    logger.info(f"El último registro de {ruta_csv} no está terminado; se volverá a leer la próxima vez.")
+                    procesar(pendiente[0])
+            if reportador is not None:
+                reportador.finalizar(resultados['total_filas'], lineas.posicion - offset_inicial)
+
+    except ValidacionCancelada:
+        logger.warning(f"Validación incremental de {ruta_csv} cancelada en la fila {resultados['total_filas']}.")
+        resultados['cancelado'] = True
+    except FileNotFoundError:
+        logger.error(f"Error: Fichero no encontrado en la ruta {ruta_csv}")
+        resultados['error_lectura'] = f"Fichero no encontrado: {ruta_csv}"
+    except UnicodeDecodeError:
+        logger.error(f"UnicodeDecodeError para el fichero {ruta_csv} con la codificación {encoding}.")
+        validators._anotar_error_codificacion(resultados, ruta_csv, encoding)
+    except Exception:
+        logger.critical("Ha ocurrido una excepción no controlada durante la validación incremental.", exc_info=True)
+        resultados['error_lectura'] = validators.MENSAJE_ERROR_CRITICO
+
+    # Un estado a medias no se guarda: la próxima vez se continúa desde el anterior
+    if datos_estado is not None and not resultados.get('cancelado') and not resultados.get('error_lectura'):
+        _guardar_estado(ruta, datos_estado)
+
+    _anotar_sustituciones(resultados, ruta_csv, options, errores_decodificacion['errores'] - sustituidos_anotados)
+    validators._consolidar_indices(resultados, options, seen_rows_and_lines, estado['unique_col_index'], unique_column_values, claves_unicas)
+    resultados['incremental'] = {
+        'reanudada': reanudada,
+        'byte_inicial': offset_inicial,
+        'bytes_leidos': lineas.posicion - offset_inicial if lineas is not None else 0,
+        'filas_nuevas': resultados['total_filas'] - filas_iniciales,
+    }
+    logger.info(f"Validación incremental de {ruta_csv} finalizada: {resultados['incremental']}")
+    return resultados
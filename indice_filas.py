@@ -0,0 +1,106 @@
+# indice_filas.py
+
+import csv
+import io
+import logging
+import os
+from array import array
+from itertools import islice
+
+import numpy as np
+
+import validators
+from deteccion import resolver_formato
+from progreso import ReportadorProgreso
+from validacion_paralela import motivo_sin_paridad_de_comillas
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántas líneas se guarda un punto de control (8 bytes cada uno)
+PASO_INDICE = 1024
+TAM_LECTURA = 4 * 1024 * 1024
+
+class IndiceFilas:
+    """
+    Índice disperso para leer cualquier zona de un CSV sin recorrerlo desde el principio:
+    guarda el offset en bytes de una de cada 'paso' líneas (la línea 1 es la cabecera), así que
+    llegar a una línea cuesta leer como mucho 'paso' registros desde el punto de control anterior.
+    Se construye con construir(), normalmente en un hilo aparte, y se puede consultar mientras
+    tanto: las líneas que aún no se han indexado se leen desde el último punto de control guardado.
+    Los registros se separan por paridad de comillas, como en validacion_paralela; si el fichero
+    no lo permite (ver validacion_paralela.motivo_sin_paridad_de_comillas), no se indexa y se lee siempre desde el principio.
+    """
+    def __init__(self, ruta_csv, options, paso=PASO_INDICE):
+        self.ruta_csv = ruta_csv
+        # La previsualización no debe fallar por un byte no válido: se sustituye
+        self.options = resolver_formato(ruta_csv, dict(options, errores_codificacion='replace'))
+        self.paso = paso
+        self.offsets = array('Q', [0])
+        self.lineas_indexadas = 0
+        self.total_lineas = None
+        self.motivo_no_indexable = motivo_sin_paridad_de_comillas(ruta_csv, self.options)
+
+    @property
+    def completo(self):
+        return self.total_lineas is not None
+
+    def construir(self, progreso=None, cancelacion=None):
+        """
+        Recorre el fichero una vez guardando los puntos de control. Lanza ValidacionCancelada si
+        se cancela; lo indexado hasta entonces se sigue pudiendo usar.
+        """
+        if self.motivo_no_indexable is not None:
+            logger.info(f"{self.motivo_no_indexable}; {self.ruta_csv} se leerá desde el principio en cada salto.")
+            return
+        tam_fichero = os.path.getsize(self.ruta_csv)
+        comilla = validators._formato_csv(self.options)['quotechar'].encode(self.options.get('encoding', 'utf-8'))[0]
+        reportador = ReportadorProgreso(progreso, cancelacion, tam_fichero)
+        paridad = 0
+        registros = 0
+        pos = 0
+        ultimo_inicio = None
+        with open(self.ruta_csv, 'rb') as f:
+            while True:
+                reportador.comprobar(registros, pos)
+                bloque = f.read(TAM_LECTURA)
+                if not bloque:
+                    break
+                a = np.frombuffer(bloque, dtype=np.uint8)
+                saltos = np.flatnonzero(a == ord('\n'))
+                paridades = np.bitwise_xor.accumulate((a == comilla).view(np.uint8))
+                # Cada salto de línea fuera de comillas es el inicio de la línea siguiente
+                inicios = saltos[(paridades[saltos] ^ paridad) == 0] + pos + 1
+                paridad ^= int(paridades[-1])
+                # inicios[j] es la línea registros + 2 + j; se guardan las que cumplen (línea - 1) % paso == 0
+                primero = -(registros + 1) % self.paso
+                puntos = inicios[primero::self.paso]
+                self.offsets.extend(int(offset) for offset in puntos if offset < tam_fichero)
+                registros += len(inicios)
+                if len(inicios):
+                    ultimo_inicio = int(inicios[-1])
+                pos += len(bloque)
+                self.lineas_indexadas = registros
+        # Un salto de línea al final del fichero no abre una línea nueva
+        self.total_lineas = registros + 1 - (ultimo_inicio == tam_fichero) if tam_fichero else 0
+        self.lineas_indexadas = self.total_lineas
+        reportador.finalizar(self.total_lineas, pos)
+        logger.info(f"Índice de {self.ruta_csv}: {self.total_lineas:,} líneas, {len(self.offsets):,} puntos de control.")
+
+    def leer_filas(self, linea, num_filas):
+        """
+        Devuelve hasta 'num_filas' pares (nº de línea, fila) a partir de la línea 'linea',
+        empezando a leer desde el punto de control anterior más cercano.
+        """
+        linea = max(1, linea)
+        punto = min((linea - 1) // self.paso, len(self.offsets) - 1)
+        linea_control, offset = punto * self.paso + 1, self.offsets[punto]
+        with self._abrir_desde(offset) as f:
+            lector = enumerate(csv.reader(f, **validators._formato_csv(self.options)), start=linea_control)
+            return list(islice(lector, linea - linea_control, linea - linea_control + num_filas))
+
+    def _abrir_desde(self, offset):
+        if not offset:
+            return validators._abrir_csv(self.ruta_csv, self.options)
+        f = open(self.ruta_csv, 'rb')
+        f.seek(offset)
+        return io.TextIOWrapper(f, encoding=self.options.get('encoding', 'utf-8'), errors='replace', newline='')
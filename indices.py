@@ -0,0 +1,407 @@
+# indices.py
+
+import hashlib
+import itertools
+import logging
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import weakref
+from array import array
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+# Separador entre celdas al calcular el resumen de una fila.
+# Si una celda lo contiene, dos filas distintas pueden compartir resumen, pero la
+# pasada de confirmación las separa igualmente.
+SEPARADOR_CELDAS = '\x1f'
+
+class IndiceExacto:
+    """
+    Índice en memoria de clave -> líneas donde aparece.
+    Guarda la clave completa (la tupla de la fila o el valor de la celda), por lo que
+    no necesita confirmación, pero su memoria crece con el tamaño del fichero.
+    """
+    requiere_confirmacion = False
+
+    def __init__(self):
+        self.lineas = {}
+
+    def __len__(self):
+        return len(self.lineas)
+
+    def registrar(self, clave, num_fila):
+        """Anota la clave en la línea indicada. Devuelve True si es su primera aparición."""
+        lineas = self.lineas.get(clave)
+        if lineas is None:
+            self.lineas[clave] = [num_fila]
+            return True
+        lineas.append(num_fila)
+        return False
+
+    def repetidos(self):
+        """Devuelve (clave, líneas ordenadas) de las claves que aparecen más de una vez."""
+        for clave, lineas in self.lineas.items():
+            if len(lineas) > 1:
+                yield clave, sorted(lineas)
+
+    def fusionar(self, otro, desplazamiento):
+        """Añade otro índice de un bloque posterior, desplazando sus números de línea."""
+        for clave, lineas in otro.lineas.items():
+            self.lineas.setdefault(clave, []).extend(num + desplazamiento for num in lineas)
+
+class IndiceHash:
+    """
+    Índice de duplicados que solo guarda un resumen de 128 bits de cada clave.
+    Por cada clave distinta se almacena el resumen y la línea de su primera aparición;
+    las repeticiones se guardan en un array compacto. Como dos claves distintas podrían
+    compartir resumen, los grupos repetidos son candidatos que hay que confirmar
+    releyendo solo esas líneas (ver validators._confirmar_candidatos).
+    """
+    requiere_confirmacion = True
+
+    def __init__(self):
+        self.primeras = {}
+        self.repeticiones = {}
+
+    def __len__(self):
+        return len(self.primeras)
+
+    @staticmethod
+    def resumir(clave):
+        """Calcula el resumen de una clave (tupla de celdas o valor de texto)."""
+        if isinstance(clave, tuple):
+            clave = SEPARADOR_CELDAS.join(clave)
+        return hashlib.blake2b(clave.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def registrar(self, clave, num_fila):
+        """Anota la clave en la línea indicada. Devuelve True si su resumen no se había visto."""
+        return self._registrar_resumen(self.resumir(clave), num_fila)
+
+    def _registrar_resumen(self, resumen, num_fila):
+        primera = self.primeras.setdefault(resumen, num_fila)
+        if primera == num_fila:
+            return True
+        lineas = self.repeticiones.get(resumen)
+        if lineas is None:
+            self.repeticiones[resumen] = array('Q', (num_fila,))
+        else:
+            lineas.append(num_fila)
+        return False
+
+    def repetidos(self):
+        """Devuelve (resumen, líneas ordenadas) de los resúmenes vistos más de una vez (candidatos)."""
+        for resumen, lineas in self.repeticiones.items():
+            yield resumen, sorted([self.primeras[resumen], *lineas])
+
+    def fusionar(self, otro, desplazamiento):
+        """Añade otro índice de un bloque posterior, desplazando sus números de línea."""
+        for resumen, primera in otro.primeras.items():
+            self._registrar_resumen(resumen, primera + desplazamiento)
+        for resumen, lineas in otro.repeticiones.items():
+            for num in lineas:
+                self._registrar_resumen(resumen, num + desplazamiento)
+
+class IndiceResumen(IndiceHash):
+    """
+    IndiceHash que además guarda la clave completa de los resúmenes repetidos, tomada de la
+    segunda aparición, así que no necesita una segunda lectura del fichero. Solo ocupa más
+    memoria que IndiceHash en las claves repetidas. Lo usa la validación incremental
+    (incremental.py), que no puede releer el fichero entero en cada ejecución; se asume que
+    dos claves distintas no comparten un resumen de 128 bits.
+    """
+    requiere_confirmacion = False
+
+    def __init__(self):
+        super().__init__()
+        self.claves = {}
+
+    def registrar(self, clave, num_fila):
+        resumen = self.resumir(clave)
+        if self._registrar_resumen(resumen, num_fila):
+            return True
+        self.claves.setdefault(resumen, clave)
+        return False
+
+    def repetidos(self):
+        """Devuelve (clave, líneas ordenadas) de las claves que aparecen más de una vez."""
+        for resumen, lineas in super().repetidos():
+            yield self.claves[resumen], lineas
+
+# Enteros que se pueden guardar tal cual en un int64 sin que dos textos distintos ('7' y '07')
+# acaben siendo la misma clave
+_ENTERO_CANONICO = re.compile(r'0|-?[1-9][0-9]{0,17}')
+
+class IndiceClaves:
+    """
+    Índice compacto para claves únicas de una o varias columnas (ver claves.py), pensado para
+    ficheros de cientos de millones de filas. No guarda ningún objeto por clave, solo arrays:
+    - una clave de una sola celda que es un entero canónico se guarda tal cual como int64,
+      junto a su línea (16 bytes por fila) y es exacta;
+    - el resto se guarda como resumen de 64 bits y línea, también 16 bytes por fila.
+    Los repetidos no se buscan al registrar sino al final, ordenando los arrays con NumPy.
+    NumPy se importa en cada método que lo usa para no cargarlo al importar validators.
+    Los grupos de enteros son definitivos; los de resúmenes son candidatos que hay que
+    confirmar releyendo esas líneas, porque dos claves distintas podrían compartir resumen.
+    """
+    requiere_confirmacion = True
+
+    def __init__(self):
+        self.enteros = array('q')
+        self.lineas_enteros = array('Q')
+        self.resumenes = bytearray()
+        self.lineas_resumenes = array('Q')
+
+    def __len__(self):
+        return len(self.lineas_enteros) + len(self.lineas_resumenes)
+
+    def registrar(self, clave, num_fila):
+        """Anota la clave (tupla de celdas) en la línea indicada. Los repetidos solo se conocen al final."""
+        if len(clave) == 1 and _ENTERO_CANONICO.fullmatch(clave[0]):
+            self.enteros.append(int(clave[0]))
+            self.lineas_enteros.append(num_fila)
+        else:
+            self.resumenes += hashlib.blake2b(SEPARADOR_CELDAS.join(clave).encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+            self.lineas_resumenes.append(num_fila)
+
+    def registrar_resumenes(self, resumenes, lineas):
+        """Anota de una vez resúmenes de 64 bits ya calculados (p. ej. con pandas) y sus líneas."""
+        import numpy as np
+        self.resumenes += np.asarray(resumenes, dtype=np.uint64).tobytes()
+        self.lineas_resumenes.frombytes(np.asarray(lineas, dtype=np.uint64).tobytes())
+
+    def repetidos(self):
+        """Devuelve (clave, líneas ordenadas) de las claves enteras repetidas, ya confirmadas."""
+        import numpy as np
+        for entero, lineas in _grupos_repetidos(np.frombuffer(self.enteros, dtype=np.int64),
+                                                np.frombuffer(self.lineas_enteros, dtype=np.uint64)):
+            yield (str(entero),), lineas
+
+    def candidatos(self):
+        """Devuelve {resumen: líneas ordenadas} de los resúmenes repetidos, pendientes de confirmar."""
+        import numpy as np
+        return dict(_grupos_repetidos(np.frombuffer(self.resumenes, dtype=np.uint64),
+                                      np.frombuffer(self.lineas_resumenes, dtype=np.uint64)))
+
+    def fusionar(self, otro, desplazamiento):
+        """Añade otro índice de un bloque posterior, desplazando sus números de línea."""
+        import numpy as np
+        self.enteros.extend(otro.enteros)
+        self.lineas_enteros.frombytes((np.frombuffer(otro.lineas_enteros, dtype=np.uint64) + desplazamiento).tobytes())
+        self.resumenes += otro.resumenes
+        self.lineas_resumenes.frombytes((np.frombuffer(otro.lineas_resumenes, dtype=np.uint64) + desplazamiento).tobytes())
+
+def _grupos_repetidos(claves, lineas):
+    """
+    (clave, líneas ordenadas) de los valores de 'claves' que aparecen más de una vez, en el
+    orden de su primera línea. Solo los elementos repetidos salen de NumPy a Python.
+    """
+    import numpy as np
+
+    if len(claves) < 2:
+        return []
+    orden = np.argsort(claves, kind='stable')
+    ordenadas = claves[orden]
+    iguales = ordenadas[1:] == ordenadas[:-1]
+    if not iguales.any():
+        return []
+    en_grupo = np.zeros(len(claves), dtype=bool)
+    en_grupo[1:] |= iguales
+    en_grupo[:-1] |= iguales
+    repetidos = orden[en_grupo]
+    grupos = [(clave, sorted(num for _, num in grupo))
+              for clave, grupo in itertools.groupby(zip(claves[repetidos].tolist(), lineas[repetidos].tolist()), key=itemgetter(0))]
+    grupos.sort(key=lambda grupo: grupo[1][0])
+    return grupos
+
+class IndiceEnDisco:
+    """
+    Índice clave -> líneas con un presupuesto de memoria.
+    Mientras el tamaño estimado cabe en 'memoria_max_bytes' funciona como IndiceExacto;
+    al superarlo vuelca las claves a ficheros temporales repartidos por hash en
+    'num_particiones' particiones. Al final cada partición se resuelve por separado
+    (y se vuelve a dividir si sigue sin caber), así que la memoria usada depende del
+    presupuesto y no del tamaño del fichero.
+    """
+    requiere_confirmacion = False
+    # Relación aproximada entre la memoria de una partición cargada y su tamaño en disco
+    FACTOR_EXPANSION = 4
+    MAX_NIVELES = 4
+    REGISTROS_POR_ESCRITURA = 10000
+
+    def __init__(self, memoria_max_bytes, num_particiones=64, directorio=None):
+        self.memoria_max_bytes = memoria_max_bytes
+        self.num_particiones = num_particiones
+        self.directorio_base = directorio
+        self.lineas = {}
+        self.bytes_estimados = 0
+        self.num_claves_en_memoria_max = 0
+        self.directorio = None
+        self._finalizador = None
+        self.volcados = 0
+
+    def __len__(self):
+        return len(self.lineas)
+
+    def __getstate__(self):
+        # Al enviarse a otro proceso, los ficheros temporales pasan a ser responsabilidad del receptor.
+        estado = self.__dict__.copy()
+        if self._finalizador is not None:
+            self._finalizador.detach()
+        estado['_finalizador'] = None
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        if self.directorio is not None:
+            self._finalizador = weakref.finalize(self, shutil.rmtree, self.directorio, True)
+
+    @staticmethod
+    def _estimar_bytes(clave):
+        if isinstance(clave, tuple):
+            return 120 + 57 * len(clave) + sum(map(len, clave))
+        return 120 + len(clave)
+
+    @staticmethod
+    def _particion(clave, nivel, num_particiones):
+        # Cada nivel usa un resumen independiente ('person' distinto): con una semilla de CRC las
+        # claves de igual longitud caerían juntas en todos los niveles y la partición no se dividiría.
+        if isinstance(clave, tuple):
+            clave = SEPARADOR_CELDAS.join(clave)
+        resumen = hashlib.blake2b(clave.encode('utf-8', 'surrogatepass'), digest_size=8, person=bytes([nivel])).digest()
+        return int.from_bytes(resumen, 'little') % num_particiones
+
+    def registrar(self, clave, num_fila):
+        """
+        Anota la clave en la línea indicada. Devuelve True si no estaba en la parte en memoria;
+        tras un volcado a disco eso no garantiza que sea su primera aparición.
+        """
+        lineas = self.lineas.get(clave)
+        if lineas is None:
+            self.lineas[clave] = [num_fila]
+            self.bytes_estimados += self._estimar_bytes(clave)
+            if self.bytes_estimados > self.memoria_max_bytes:
+                self._volcar()
+            return True
+        lineas.append(num_fila)
+        self.bytes_estimados += 8
+        return False
+
+    def _ruta_particion(self, nivel, indice):
+        return os.path.join(self.directorio, f"n{nivel}_p{indice}.pkl")
+
+    def _volcar(self):
+        """Escribe las claves en memoria en sus particiones de disco y libera la memoria."""
+        if self.directorio is None:
+            self.directorio = tempfile.mkdtemp(prefix="validador_indice_", dir=self.directorio_base)
+            self._finalizador = weakref.finalize(self, shutil.rmtree, self.directorio, True)
+        self.num_claves_en_memoria_max = max(self.num_claves_en_memoria_max, len(self.lineas))
+
+        particiones = [[] for _ in range(self.num_particiones)]
+        for clave, lineas in self.lineas.items():
+            particiones[self._particion(clave, 0, self.num_particiones)].append((clave, lineas))
+        for indice, registros in enumerate(particiones):
+            if registros:
+                with open(self._ruta_particion(0, indice), 'ab') as f:
+                    pickle.dump(registros, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.volcados += 1
+        logger.info(f"Índice volcado a disco ({len(self.lineas)} claves, volcado nº {self.volcados}).")
+        self.lineas = {}
+        self.bytes_estimados = 0
+
+    @staticmethod
+    def _leer_registros(ruta):
+        with open(ruta, 'rb') as f:
+            while True:
+                try:
+                    yield from pickle.load(f)
+                except EOFError:
+                    return
+
+    def _resolver_particion(self, ruta, nivel):
+        """Devuelve los grupos repetidos de una partición, subdividiéndola si no cabe en memoria."""
+        if os.path.getsize(ruta) * self.FACTOR_EXPANSION > self.memoria_max_bytes and nivel < self.MAX_NIVELES:
+            subparticiones = {}
+            for num_registros, (clave, lineas) in enumerate(self._leer_registros(ruta), start=1):
+                subparticiones.setdefault(self._particion(clave, nivel + 1, self.num_particiones), []).append((clave, lineas))
+                if num_registros % self.REGISTROS_POR_ESCRITURA == 0:
+                    self._escribir_subparticiones(subparticiones, nivel + 1, ruta)
+                    subparticiones = {}
+            self._escribir_subparticiones(subparticiones, nivel + 1, ruta)
+            os.remove(ruta)
+            for indice in range(self.num_particiones):
+                ruta_sub = f"{ruta}.{nivel + 1}_{indice}"
+                if os.path.exists(ruta_sub):
+                    yield from self._resolver_particion(ruta_sub, nivel + 1)
+            return
+
+        agrupadas = {}
+        for clave, lineas in self._leer_registros(ruta):
+            agrupadas.setdefault(clave, []).extend(lineas)
+        os.remove(ruta)
+        for clave, lineas in agrupadas.items():
+            if len(lineas) > 1:
+                yield clave, sorted(lineas)
+
+    def _escribir_subparticiones(self, subparticiones, nivel, ruta):
+        for indice, registros in subparticiones.items():
+            with open(f"{ruta}.{nivel}_{indice}", 'ab') as f:
+                pickle.dump(registros, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _todos_los_registros(self):
+        """Recorre (clave, líneas) de la parte en memoria y de todas las particiones en disco."""
+        yield from self.lineas.items()
+        if self.directorio is not None:
+            for indice in range(self.num_particiones):
+                ruta = self._ruta_particion(0, indice)
+                if os.path.exists(ruta):
+                    yield from self._leer_registros(ruta)
+
+    def repetidos(self):
+        """
+        Devuelve (clave, líneas ordenadas) de las claves que aparecen más de una vez,
+        en el orden de su primera aparición. Consume el índice y borra sus ficheros temporales.
+        """
+        if self.directorio is None:
+            for clave, lineas in self.lineas.items():
+                if len(lineas) > 1:
+                    yield clave, sorted(lineas)
+            return
+
+        if self.lineas:
+            self._volcar()
+        grupos = []
+        for indice in range(self.num_particiones):
+            ruta = self._ruta_particion(0, indice)
+            if os.path.exists(ruta):
+                grupos.extend(self._resolver_particion(ruta, 0))
+        grupos.sort(key=lambda grupo: grupo[1][0])
+        self._finalizador()
+        self.directorio = None
+        yield from grupos
+
+    def fusionar(self, otro, desplazamiento):
+        """Añade otro índice de un bloque posterior, desplazando sus números de línea."""
+        for clave, lineas in otro._todos_los_registros():
+            for num in lineas:
+                self.registrar(clave, num + desplazamiento)
+        if otro._finalizador is not None:
+            otro._finalizador()
+
+TIPOS_DE_INDICE = {'exacto': IndiceExacto, 'hash': IndiceHash}
+
+def crear_indice(tipo, memoria_max_mb=None, directorio=None):
+    """
+    Crea un índice vacío del tipo indicado ('exacto' o 'hash').
+    Si se indica 'memoria_max_mb', los índices exactos pasan a volcarse a disco al superar ese presupuesto.
+    """
+    tipo = tipo or 'exacto'
+    if tipo not in TIPOS_DE_INDICE:
+        raise ValueError(f"Tipo de índice desconocido: '{tipo}'. Opciones: {', '.join(TIPOS_DE_INDICE)}")
+    if tipo == 'exacto' and memoria_max_mb:
+        return IndiceEnDisco(int(memoria_max_mb * 1024 * 1024), directorio=directorio)
+    return TIPOS_DE_INDICE[tipo]()
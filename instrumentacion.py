@@ -0,0 +1,97 @@
+# instrumentacion.py
+
+import time
+from contextlib import contextmanager
+
+class Instrumentacion:
+    """
+    Mide dónde se va el tiempo de una validación: lectura y análisis del CSV, cada regla
+    aplicada a las filas y las fases finales, además de los bytes leídos y el tamaño máximo
+    que alcanzan los índices de duplicados y unicidad.
+    Solo se crea si options['instrumentar'] es True; sin ella el bucle de validación no
+    paga ningún coste adicional.
+    """
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.reglas = {}
+        self.fases = {}
+        self.segundos_lectura = 0.0
+        self.filas_leidas = 0
+        self.bytes_leidos = 0
+        self.max_indices = {'duplicados': 0, 'unicidad': 0}
+
+    def medir_regla(self, nombre, regla):
+        """Devuelve la regla envuelta para acumular sus llamadas y su tiempo bajo 'nombre'."""
+        contador = self.reglas.setdefault(nombre, [0, 0.0])
+        reloj = time.perf_counter
+        def regla_medida(*args):
+            t0 = reloj()
+            try:
+                return regla(*args)
+            finally:
+                contador[0] += 1
+                contador[1] += reloj() - t0
+        return regla_medida
+
+    def medir_lectura(self, filas):
+        """Recorre un lector de CSV acumulando el tiempo que tarda en producir cada fila."""
+        reloj = time.perf_counter
+        iterador = iter(filas)
+        while True:
+            t0 = reloj()
+            try:
+                fila = next(iterador)
+            except StopIteration:
+                self.segundos_lectura += reloj() - t0
+                return
+            self.segundos_lectura += reloj() - t0
+            self.filas_leidas += 1
+            yield fila
+
+    @contextmanager
+    def medir_fase(self, nombre):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fases[nombre] = self.fases.get(nombre, 0.0) + time.perf_counter() - t0
+
+    def muestrear_indices(self, seen_rows_and_lines, unique_column_values):
+        """Anota el tamaño actual de los índices si supera el máximo visto."""
+        self.max_indices['duplicados'] = max(self.max_indices['duplicados'], len(seen_rows_and_lines))
+        self.max_indices['unicidad'] = max(self.max_indices['unicidad'], len(unique_column_values))
+
+    def resumen(self):
+        """Devuelve las medidas como un diccionario serializable en JSON."""
+        segundos_totales = time.perf_counter() - self.inicio
+        reglas = {
+            nombre: {
+                'llamadas': llamadas,
+                'segundos': segundos,
+                'microsegundos_por_llamada': segundos / llamadas * 1e6 if llamadas else 0.0,
+            }
+            for nombre, (llamadas, segundos) in self.reglas.items()
+        }
+        return {
+            'segundos_totales': segundos_totales,
+            'segundos_lectura_csv': self.segundos_lectura,
+            'segundos_reglas': sum(llamadas_y_segundos[1] for llamadas_y_segundos in self.reglas.values()),
+            'filas_leidas': self.filas_leidas,
+            'bytes_leidos': self.bytes_leidos,
+            'mb_por_segundo': self.bytes_leidos / (1024 * 1024) / segundos_totales if segundos_totales else 0.0,
+            'reglas': reglas,
+            'fases': dict(self.fases),
+            'tamano_max_indices': dict(self.max_indices),
+        }
+
+    def registrar_en_log(self, logger, ruta_csv, resumen=None):
+        resumen = resumen or self.resumen()
+        logger.info(f"Instrumentación de {ruta_csv}: {resumen['segundos_totales']:.3f} s en total, "
+                    f"{resumen['segundos_lectura_csv']:.3f} s leyendo el CSV, {resumen['segundos_reglas']:.3f} s en reglas, "
+                    f"{resumen['filas_leidas']} filas, {resumen['bytes_leidos']} bytes ({resumen['mb_por_segundo']:.1f} MB/s).")
+        for nombre, medida in resumen['reglas'].items():
+            logger.info(f"  Regla '{nombre}': {medida['llamadas']} llamadas, {medida['segundos']:.3f} s "
+                        f"({medida['microsegundos_por_llamada']:.2f} µs/llamada).")
+        for nombre, segundos in resumen['fases'].items():
+            logger.info(f"  Fase '{nombre}': {segundos:.3f} s.")
+        logger.info(f"  Tamaño máximo de los índices: {resumen['tamano_max_indices']}.")
@@ -0,0 +1,272 @@
+# motor_vectorizado.py
+
+import csv
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+
+import compresion
+import validators
+from deteccion import contar_errores_de_decodificacion, resolver_formato
+import esquema
+from claves import preparar_claves
+from indices import IndiceClaves, IndiceExacto
+from progreso import ValidacionCancelada
+
+logger = logging.getLogger(__name__)
+
+# Número de filas que se cargan en cada lote columnar
+FILAS_POR_LOTE = 50000
+# Texto de longitud variable de NumPy 2, con operaciones de cadena vectorizadas en C
+TIPO_TEXTO = np.dtypes.StringDType()
+
+class _TextoConNulos(Exception):
+    """
+    Un lote tiene celdas con el carácter NUL: las operaciones de cadena de NumPy lo tratan como
+    fin de texto o espacio (y a veces fallan), así que esos ficheros se validan con el motor de Python.
+    """
+
+def validar_vectorizado(ruta_csv, options, progreso=None, cancelacion=None):
+    """
+    Motor alternativo a realizar_validacion_completa que valida el fichero por lotes de filas
+    cargados en matrices de texto de NumPy. Las comprobaciones de filas vacías, saltos de línea,
+    duplicados, unicidad, claves únicas y esquema se hacen sobre columnas completas; los duplicados y valores repetidos
+    se localizan por hash de 64 bits y se confirman releyendo solo las líneas candidatas.
+    Devuelve la misma estructura de 'resultados' que el motor de Python. Si aparece algún
+    carácter NUL, la validación vuelve a empezar con el motor de Python (ver _TextoConNulos).
+    """
+    logger.info(f"Iniciando validación vectorizada para el fichero: {ruta_csv}")
+    options = resolver_formato(ruta_csv, options)
+    resultados = validators.crear_resultados_vacios(ruta_csv)
+    encoding = options.get('encoding', 'utf-8')
+    unique_col_index = -1
+    acumulados = {'hashes_filas': [], 'lineas_filas': [], 'hashes_unicos': [], 'lineas_unicos': [], 'claves_unicas': []}
+    errores_decodificacion = {'errores': 0}
+
+    try:
+        reportador = validators._crear_reportador(ruta_csv, progreso, cancelacion)
+        with contar_errores_de_decodificacion() as errores_decodificacion, validators._abrir_csv(ruta_csv, options) as f:
+            lector = csv.reader(f, **validators._formato_csv(options))
+            try:
+                primera_fila = next(lector)
+            except StopIteration:
+                logger.warning(f"El fichero {ruta_csv} está vacío o no tiene contenido.")
+                return resultados
+
+            if not primera_fila:
+                logger.info("La cabecera no tiene columnas; se usa el motor de Python.")
+                return validators.realizar_validacion_completa(ruta_csv, dict(options, engine='python'), progreso, cancelacion)
+
+            unique_col_index = validators._procesar_cabecera(primera_fila, resultados, options, IndiceExacto())
+            # La cabecera ya se ha validado; solo falta tenerla en cuenta como posible duplicado.
+            cabecera_en_duplicados = bool(options.get('check_duplicadas')) and not resultados['filas_vacias']
+            acumulados['claves_unicas'] = preparar_claves(primera_fila, options, IndiceClaves)
+            acumulados['columnas_esquema'] = esquema.compilar_esquema(options['esquema'], primera_fila) if options.get('esquema') else []
+
+            linea_inicial = 1
+            lote = [primera_fila, *itertools.islice(lector, FILAS_POR_LOTE - 1)]
+            while lote:
+                _procesar_lote(lote, linea_inicial, resultados, options, unique_col_index, cabecera_en_duplicados, acumulados)
+                linea_inicial += len(lote)
+                resultados['total_filas'] = linea_inicial - 1
+                if reportador is not None:
+                    reportador.comprobar(resultados['total_filas'], compresion.posicion_en_origen(f))
+                lote = list(itertools.islice(lector, FILAS_POR_LOTE))
+
+            if reportador is not None:
+                reportador.finalizar(resultados['total_filas'], compresion.posicion_en_origen(f))
+
+    except _TextoConNulos:
+        logger.info(f"{ruta_csv} contiene caracteres NUL; se valida con el motor de Python.")
+        return validators.realizar_validacion_completa(ruta_csv, dict(options, engine='python'), progreso, cancelacion)
+    except ValidacionCancelada:
+        logger.warning(f"Validación vectorizada de {ruta_csv} cancelada por el usuario en la fila {resultados['total_filas']}.")
+        resultados['cancelado'] = True
+    except FileNotFoundError:
+        logger.error(f"Error: Fichero no encontrado en la ruta {ruta_csv}")
+        resultados['error_lectura'] = f"Fichero no encontrado: {ruta_csv}"
+    except UnicodeDecodeError:
+        logger.error(f"UnicodeDecodeError para el fichero {ruta_csv} con la codificación {encoding}.")
+        validators._anotar_error_codificacion(resultados, ruta_csv, encoding)
+    except Exception:
+        logger.critical("Ha ocurrido una excepción no controlada durante la validación vectorizada.", exc_info=True)
+        resultados['error_lectura'] = validators.MENSAJE_ERROR_CRITICO
+    validators._anotar_formato(resultados, ruta_csv, options, errores_decodificacion['errores'])
+
+    if options.get('check_duplicadas'):
+        candidatos = _agrupar_candidatos(acumulados['hashes_filas'], acumulados['lineas_filas'])
+        for fila, lineas in validators._confirmar_candidatos(ruta_csv, options, candidatos):
+            resultados['filas_duplicadas'][fila] = lineas
+
+    if unique_col_index != -1:
+        candidatos = _agrupar_candidatos(acumulados['hashes_unicos'], acumulados['lineas_unicos'])
+        ignore_case = options.get('ignore_case')
+        def valor_unico(fila):
+            valor = fila[unique_col_index].strip()
+            return valor.lower() if ignore_case else valor
+        for valor, lineas in validators._confirmar_candidatos(ruta_csv, options, candidatos, valor_unico):
+            resultados['errores_de_unicidad'][valor] = lineas
+
+    # Las claves se registran con resúmenes de pandas y se confirman igual que en el motor de Python
+    validators._consolidar_claves(resultados, options, acumulados['claves_unicas'])
+
+    logger.info("Validación vectorizada finalizada. Devolviendo resultados.")
+    return resultados
+
+def _procesar_lote(lote, linea_inicial, resultados, options, unique_col_index, cabecera_en_duplicados, acumulados):
+    """Aplica todas las comprobaciones a un lote de filas de forma vectorizada."""
+    if any('\x00' in ''.join(fila) for fila in lote):
+        raise _TextoConNulos()
+    num_columnas = resultados['num_columnas_esperadas']
+    longitudes = np.fromiter(map(len, lote), dtype=np.int64, count=len(lote))
+    lineas = np.arange(linea_inicial, linea_inicial + len(lote), dtype=np.int64)
+
+    invalidas = longitudes != num_columnas
+    limite = options.get('max_contenido_por_categoria')
+    filas_invalidas = resultados['filas_invalidas']
+    for i in np.flatnonzero(invalidas):
+        contenido = lote[i] if limite is None or len(filas_invalidas) < limite else None
+        filas_invalidas.append((int(lineas[i]), int(longitudes[i]), contenido))
+
+    posiciones_validas = np.flatnonzero(~invalidas)
+    if not len(posiciones_validas):
+        return
+    celdas = np.array([lote[i] for i in posiciones_validas], dtype=TIPO_TEXTO).reshape(len(posiciones_validas), num_columnas)
+    lineas = lineas[posiciones_validas]
+    recortadas = np.strings.strip(celdas)
+
+    es_cabecera = lineas == 1
+    comprobar = ~es_cabecera
+    if options.get('check_vacias'):
+        vacias = (np.strings.str_len(recortadas) == 0).all(axis=1) & comprobar
+        resultados['filas_vacias'].extend(lineas[vacias].tolist())
+        comprobar &= ~vacias
+
+    con_salto = (np.strings.find(celdas, '\n') >= 0) | (np.strings.find(celdas, '\r') >= 0)
+    con_salto &= comprobar[:, None]
+    celdas_con_saltos = resultados['celdas_con_saltos']
+    for fila, columna in zip(*np.nonzero(con_salto)):
+        contenido = str(celdas[fila, columna]) if limite is None or len(celdas_con_saltos) < limite else None
+        celdas_con_saltos.append((int(lineas[fila]), int(columna) + 1, contenido))
+
+    if acumulados['columnas_esquema']:
+        _comprobar_esquema(celdas[comprobar], lineas[comprobar], acumulados['columnas_esquema'], resultados, limite)
+
+    if options.get('ignore_case'):
+        recortadas = np.strings.lower(recortadas)
+
+    if unique_col_index != -1:
+        valores = recortadas[:, unique_col_index]
+        con_valor = comprobar & (np.strings.str_len(valores) > 0)
+        acumulados['hashes_unicos'].append(pd.util.hash_array(valores[con_valor].astype(object)))
+        acumulados['lineas_unicos'].append(lineas[con_valor])
+
+    for clave in acumulados['claves_unicas']:
+        valores = recortadas[:, list(clave.columnas)]
+        # Como en claves.extractor_de_clave, una clave con alguna celda vacía no se compara
+        con_valor = comprobar & (np.strings.str_len(valores) > 0).all(axis=1)
+        tabla = pd.DataFrame(valores[con_valor].astype(object))
+        clave.indice.registrar_resumenes(pd.util.hash_pandas_object(tabla, index=False).to_numpy(), lineas[con_valor])
+
+    if options.get('check_duplicadas'):
+        en_duplicados = comprobar | (es_cabecera & cabecera_en_duplicados)
+        tabla = pd.DataFrame(recortadas[en_duplicados].astype(object))
+        acumulados['hashes_filas'].append(pd.util.hash_pandas_object(tabla, index=False).to_numpy())
+        acumulados['lineas_filas'].append(lineas[en_duplicados])
+
+def _comprobar_esquema(celdas, lineas, columnas, resultados, limite):
+    """
+    Aplica el esquema a un lote columna a columna: _celdas_validas descarta en bloque las celdas
+    que seguro que son válidas y solo el resto pasa por la comprobación completa de su columna.
+    Los errores se añaden en el mismo orden que el motor de Python.
+    """
+    encontrados = []
+    for columna in columnas:
+        valores = celdas[:, columna.indice]
+        validas = _celdas_validas(columna.definicion, valores)
+        posiciones = range(len(valores)) if validas is None else np.flatnonzero(~validas)
+        for i in posiciones:
+            valor = str(valores[i])
+            motivo = columna.comprobar(valor)
+            if motivo is not None:
+                encontrados.append((int(lineas[i]), columna.indice, columna.nombre, valor, motivo))
+
+    errores = resultados['errores_de_esquema']
+    for linea, _, nombre, valor, motivo in sorted(encontrados, key=lambda error: error[:2]):
+        errores.append((linea, nombre, valor if limite is None or len(errores) < limite else None, motivo))
+
+def _celdas_validas(definicion, valores):
+    """
+    Marca con operaciones de cadena de NumPy las celdas de una columna que cumplen su definición,
+    o devuelve None si la columna tiene restricciones que solo se pueden comprobar una a una
+    (fechas y patrones). Una celda marcada como válida lo es seguro; las no marcadas pueden serlo
+    o no y se comprueban con la función completa. Los valores no pueden contener NUL, con el que
+    las operaciones de cadena de NumPy fallan (_procesar_lote ya desvía esos ficheros).
+    """
+    tipo = definicion.get('tipo', 'texto')
+    if tipo == 'fecha' or definicion.get('patron') is not None:
+        return None
+    recortados = np.strings.strip(valores)
+    longitudes = np.strings.str_len(recortados)
+    con_valor = longitudes > 0
+    validas = con_valor.copy()
+
+    if tipo in ('entero', 'decimal'):
+        separador = definicion.get('separador_decimal', '.')
+        con_signo = np.strings.startswith(recortados, '+') | np.strings.startswith(recortados, '-')
+        cuerpo = np.strings.lstrip(recortados, '+-')
+        # lstrip quitaría varios signos seguidos; solo se admite uno
+        validas &= np.strings.str_len(cuerpo) == longitudes - con_signo
+        if tipo == 'decimal':
+            validas &= np.strings.count(cuerpo, separador) <= 1
+            cuerpo = np.strings.replace(cuerpo, separador, '')
+        # Solo dígitos ASCII, como [0-9] en la expresión del tipo
+        validas &= (np.strings.str_len(cuerpo) > 0) & (np.strings.str_len(np.strings.lstrip(cuerpo, '0123456789')) == 0)
+        limites = esquema._limites(definicion)
+        if limites is not None and validas.any():
+            _, _, minimo, maximo = limites
+            numeros = recortados[validas]
+            try:
+                if tipo == 'entero':
+                    datos = numeros.astype(np.int64)
+                else:
+                    datos = np.strings.replace(numeros, separador, '.').astype(np.float64)
+            except OverflowError:
+                # Enteros de más de 64 bits: se comprueban uno a uno
+                datos = None
+            if datos is None:
+                validas[:] = False
+            else:
+                dentro = np.ones(len(datos), dtype=bool)
+                if minimo is not None:
+                    dentro &= datos >= minimo
+                if maximo is not None:
+                    dentro &= datos <= maximo
+                validas[validas] = dentro
+
+    if definicion.get('valores') is not None:
+        permitidos = {str(valor).strip() for valor in definicion['valores']}
+        validas &= pd.Series(recortados.astype(object)).isin(permitidos).to_numpy()
+    if definicion.get('longitud_min') is not None:
+        validas &= longitudes >= definicion['longitud_min']
+    if definicion.get('longitud_max') is not None:
+        validas &= longitudes <= definicion['longitud_max']
+
+    if not definicion.get('obligatorio'):
+        # Las celdas en blanco solo son un error en columnas obligatorias
+        validas |= ~con_valor
+    return validas
+
+def _agrupar_candidatos(hashes, lineas):
+    """Devuelve {hash: líneas} de los hashes que aparecen más de una vez."""
+    if not hashes:
+        return {}
+    hashes = np.concatenate(hashes)
+    lineas = np.concatenate(lineas)
+    repetidos = pd.Index(hashes).duplicated(keep=False)
+    candidatos = {}
+    for clave, num in zip(hashes[repetidos].tolist(), lineas[repetidos].tolist()):
+        candidatos.setdefault(clave, []).append(num)
+    return candidatos
@@ -0,0 +1,101 @@
+# parada.py
+
+# Hallazgos que se conocen fila a fila y cuentan para las políticas de parada. Los duplicados,
+# la unicidad y las claves únicas solo se resuelven al final de la lectura, así que no cuentan.
+CATEGORIAS_PARADA = ('filas_invalidas', 'filas_vacias', 'celdas_con_saltos', 'errores_de_esquema')
+
+# Filas leídas a partir de las cuales se aplica 'tasa_maxima' si no se indica 'filas_minimas'
+FILAS_MINIMAS = 1000
+
+def normalizar_parada(parada):
+    """
+    Valida options['parada'] y devuelve un diccionario con todas sus claves, o None si no pide
+    ninguna parada. Claves admitidas:
+    - 'primer_error': parar en el primer error (incluida una cabecera que no coincide);
+    - 'max_errores': parar al llegar a N errores en total;
+    - 'max_por_categoria': parar al llegar a N errores de una categoría (un número para todas o
+      un diccionario por categoría de CATEGORIAS_PARADA);
+    - 'cabecera': parar sin leer las filas si la cabecera no coincide con la esperada;
+    - 'tasa_maxima': parar si, tras leer 'filas_minimas' filas, los errores superan esa
+      proporción de las filas leídas (p. ej. 0.05);
+    - 'filas_minimas': filas que se leen antes de aplicar 'tasa_maxima' (al menos 1).
+    Lanza ValueError si alguna clave o valor no es válido.
+    """
+    if not parada:
+        return None
+    admitidas = {'primer_error', 'max_errores', 'max_por_categoria', 'cabecera', 'tasa_maxima', 'filas_minimas'}
+    desconocidas = set(parada) - admitidas
+    if desconocidas:
+        raise ValueError(f"Claves de parada desconocidas: {sorted(desconocidas)}")
+    normalizada = {
+        'primer_error': bool(parada.get('primer_error')),
+        'max_errores': parada.get('max_errores'),
+        'max_por_categoria': parada.get('max_por_categoria'),
+        'cabecera': bool(parada.get('cabecera')),
+        'tasa_maxima': parada.get('tasa_maxima'),
+        'filas_minimas': parada.get('filas_minimas', FILAS_MINIMAS),
+    }
+    if normalizada['max_errores'] is not None and normalizada['max_errores'] < 1:
+        raise ValueError("'max_errores' debe ser al menos 1")
+    por_categoria = normalizada['max_por_categoria']
+    if isinstance(por_categoria, dict):
+        ajenas = set(por_categoria) - set(CATEGORIAS_PARADA)
+        if ajenas:
+            raise ValueError(f"Categorías de parada desconocidas: {sorted(ajenas)}; se admiten {list(CATEGORIAS_PARADA)}")
+    elif por_categoria is not None:
+        normalizada['max_por_categoria'] = dict.fromkeys(CATEGORIAS_PARADA, por_categoria)
+    if normalizada['tasa_maxima'] is not None and not 0 <= normalizada['tasa_maxima'] < 1:
+        raise ValueError("'tasa_maxima' debe ser una proporción entre 0 y 1")
+    if normalizada['filas_minimas'] < 1:
+        raise ValueError("'filas_minimas' debe ser al menos 1")
+    return normalizada
+
+def crear_comprobador_parada(options, resultados):
+    """
+    Prepara las políticas de options['parada'] (ver normalizar_parada) sobre las listas de
+    'resultados', o devuelve None si no hay ninguna. La función devuelta recibe el nº de la
+    línea que se acaba de validar (1 para la cabecera) y devuelve None para seguir leyendo o
+    un diccionario {'regla', 'motivo', 'linea'} si hay que parar.
+    Solo recalcula las políticas cuando ha aparecido algún error, así que su coste por fila es
+    el de sumar la longitud de cuatro listas.
+    """
+    parada = normalizar_parada(options.get('parada'))
+    if parada is None:
+        return None
+    listas = [resultados[categoria] for categoria in CATEGORIAS_PARADA]
+    invalidas, vacias, saltos, esquema = listas
+    por_categoria = parada['max_por_categoria'] or {}
+    tasa_maxima = parada['tasa_maxima']
+    filas_minimas = parada['filas_minimas']
+    errores_vistos = 0
+
+    def motivo(linea, errores):
+        if linea == 1 and resultados['error_header'] and (parada['cabecera'] or parada['primer_error']):
+            return 'cabecera', "La cabecera no coincide con la esperada"
+        if parada['primer_error'] and errores:
+            return 'primer_error', f"Primer error encontrado en la línea {linea}"
+        if parada['max_errores'] is not None and errores >= parada['max_errores']:
+            return 'max_errores', f"Se han alcanzado {errores} errores (máximo {parada['max_errores']})"
+        for categoria, lista in zip(CATEGORIAS_PARADA, listas):
+            limite = por_categoria.get(categoria)
+            if limite is not None and len(lista) >= limite:
+                return 'max_por_categoria', f"Se han alcanzado {len(lista)} errores en '{categoria}' (máximo {limite})"
+        filas_leidas = linea - 1
+        if tasa_maxima is not None and filas_leidas >= filas_minimas and errores > tasa_maxima * filas_leidas:
+            return 'tasa_maxima', (f"{errores} errores en {filas_leidas} filas ({errores / filas_leidas:.2%}) "
+                                   f"superan la tasa máxima del {tasa_maxima:.2%}")
+        return None
+
+    def comprobar(linea):
+        nonlocal errores_vistos
+        errores = len(invalidas) + len(vacias) + len(saltos) + len(esquema)
+        # Sin errores nuevos solo puede cambiar algo al llegar a 'filas_minimas' con la tasa ya superada
+        if errores == errores_vistos and linea != 1 and (tasa_maxima is None or linea - 1 != filas_minimas):
+            return None
+        errores_vistos = errores
+        encontrado = motivo(linea, errores)
+        if encontrado is None:
+            return None
+        regla, descripcion = encontrado
+        return {'regla': regla, 'motivo': descripcion, 'linea': linea}
+    return comprobar
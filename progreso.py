@@ -0,0 +1,70 @@
+# progreso.py
+
+import threading
+import time
+
+# Cada cuántas filas el bucle principal consulta el progreso (debe ser potencia de 2 - 1 para usarse como máscara)
+MASCARA_FILAS = 4095
+
+class ValidacionCancelada(Exception):
+    """Se lanza dentro del bucle de lectura cuando se ha pedido cancelar la operación."""
+
+class TokenCancelacion:
+    """Señal de cancelación cooperativa que se puede activar desde otro hilo (p. ej. la interfaz)."""
+    def __init__(self):
+        self._evento = threading.Event()
+
+    def cancelar(self):
+        self._evento.set()
+
+    @property
+    def cancelado(self):
+        return self._evento.is_set()
+
+class ReportadorProgreso:
+    """
+    Calcula el progreso de una lectura (bytes, filas, velocidad y tiempo restante) y lo
+    entrega a 'callback' como mucho una vez cada 'intervalo' segundos. También comprueba
+    el token de cancelación. El bucle solo debe llamar a comprobar() cada MASCARA_FILAS + 1 filas.
+    """
+    def __init__(self, callback=None, cancelacion=None, bytes_totales=0, intervalo=0.25):
+        self.callback = callback
+        self.cancelacion = cancelacion
+        self.bytes_totales = bytes_totales
+        self.intervalo = intervalo
+        self.inicio = time.perf_counter()
+        self._ultimo_aviso = 0.0
+
+    def comprobar(self, filas, bytes_leidos):
+        """Lanza ValidacionCancelada si se ha cancelado y avisa del progreso si toca."""
+        if self.cancelacion is not None and self.cancelacion.cancelado:
+            raise ValidacionCancelada()
+        if self.callback is None:
+            return
+        ahora = time.perf_counter()
+        if ahora - self._ultimo_aviso >= self.intervalo:
+            self._ultimo_aviso = ahora
+            self.callback(self.estado(filas, bytes_leidos, ahora))
+
+    def finalizar(self, filas, bytes_leidos):
+        """Envía siempre un último aviso con el estado final."""
+        if self.callback is not None:
+            self.callback(self.estado(filas, bytes_leidos, time.perf_counter()))
+
+    def estado(self, filas, bytes_leidos, ahora):
+        transcurrido = max(ahora - self.inicio, 1e-9)
+        bytes_por_segundo = bytes_leidos / transcurrido
+        fraccion = min(1.0, bytes_leidos / self.bytes_totales) if self.bytes_totales else None
+        restante = None
+        if fraccion is not None and bytes_por_segundo > 0:
+            restante = max(0.0, (self.bytes_totales - bytes_leidos) / bytes_por_segundo)
+        return {
+            'filas': filas,
+            'bytes_leidos': bytes_leidos,
+            'bytes_totales': self.bytes_totales,
+            'fraccion': fraccion,
+            'transcurrido': transcurrido,
+            'filas_por_segundo': filas / transcurrido,
+            'mb_por_segundo': bytes_por_segundo / (1024 * 1024),
+            'segundos_restantes': restante,
+        }
@@ -0,0 +1,135 @@
+# reglas.py
+
+from collections import namedtuple
+
+# Lo que necesita una regla para prepararse: opciones, resultados donde anotar los hallazgos
+# (con 'cabecera' y 'num_columnas_esperadas' ya fijados), índices de duplicados y unicidad
+# y las claves únicas ya resueltas contra la cabecera (ver claves.py).
+ContextoReglas = namedtuple('ContextoReglas', ['options', 'resultados', 'seen_rows_and_lines', 'unique_col_index', 'unique_column_values',
+                                               'claves_unicas'],
+                            defaults=(None, -1, None, ()))
+
+# Una regla registrada. 'fabrica(contexto)' devuelve la función que valida una fila, o None
+# si con esas opciones la regla no está activa. Las reglas se aplican por 'orden' creciente.
+# Con 'en_cabecera' a False la regla no se aplica a la cabecera (línea 1).
+Regla = namedtuple('Regla', ['nombre', 'orden', 'fabrica', 'en_cabecera'], defaults=(True,))
+
+REGLAS = {}
+
+def registrar_regla(nombre, orden, en_cabecera=True):
+    """
+    Decorador para añadir una regla al pipeline sin tocar el bucle de validación.
+    La función que devuelve la fábrica recibe (fila, num_fila) y devuelve None para seguir
+    con la siguiente regla, o False para terminar con la fila y descartarla del CSV limpio.
+    """
+    def decorador(fabrica):
+        REGLAS[nombre] = Regla(nombre, orden, fabrica, en_cabecera)
+        return fabrica
+    return decorador
+
+class PipelineReglas:
+    """
+    Conjunto de reglas preparado una sola vez a partir de las opciones y la cabecera.
+    Cada regla activa se construye con sus opciones y listas de resultados ya resueltas, y
+    las desactivadas ni siquiera se incluyen, así que por fila no se consulta ninguna opción.
+    validar_fila(fila, num_fila) devuelve False si un CSV limpio debería descartar la fila
+    (inválida, vacía o duplicado posterior).
+    """
+    def __init__(self, contexto, instrumentacion=None, reglas=None):
+        self.nombres = []
+        funciones = []
+        for regla in sorted((REGLAS if reglas is None else reglas).values(), key=lambda r: r.orden):
+            funcion = regla.fabrica(contexto)
+            if funcion is None:
+                continue
+            if instrumentacion is not None:
+                funcion = instrumentacion.medir_regla(regla.nombre, funcion)
+            self.nombres.append(regla.nombre)
+            funciones.append(funcion)
+        self.validar_fila = self._compilar(tuple(funciones))
+
+    @staticmethod
+    def _compilar(funciones):
+        if len(funciones) == 1:
+            unica, = funciones
+            def validar_fila(fila, num_fila):
+                return unica(fila, num_fila) is None
+            return validar_fila
+
+        def validar_fila(fila, num_fila):
+            for regla in funciones:
+                if regla(fila, num_fila) is not None:
+                    return False
+            return True
+        return validar_fila
+
+@registrar_regla('columnas', 10)
+def _regla_columnas(contexto):
+    esperadas = contexto.resultados['num_columnas_esperadas']
+    filas_invalidas = contexto.resultados['filas_invalidas']
+    limite = contexto.options.get('max_contenido_por_categoria')
+    def regla(fila, num_fila):
+        if len(fila) != esperadas:
+            filas_invalidas.append((num_fila, len(fila), fila if limite is None or len(filas_invalidas) < limite else None))
+            return False
+    return regla
+
+@registrar_regla('fila_vacia', 20)
+def _regla_fila_vacia(contexto):
+    if not contexto.options.get('check_vacias'):
+        return None
+    filas_vacias = contexto.resultados['filas_vacias']
+    def regla(fila, num_fila):
+        # Todas las celdas son espacios si y solo si lo es su concatenación.
+        if not ''.join(fila).strip():
+            filas_vacias.append(num_fila)
+            return False
+    return regla
+
+@registrar_regla('saltos_de_linea', 30)
+def _regla_saltos_de_linea(contexto):
+    celdas_con_saltos = contexto.resultados['celdas_con_saltos']
+    limite = contexto.options.get('max_contenido_por_categoria')
+    def regla(fila, num_fila):
+        texto = ''.join(fila)
+        if '\n' in texto or '\r' in texto:
+            for j, campo in enumerate(fila, start=1):
+                if '\n' in campo or '\r' in campo:
+                    celdas_con_saltos.append((num_fila, j, campo if limite is None or len(celdas_con_saltos) < limite else None))
+    return regla
+
+@registrar_regla('unicidad', 40)
+def _regla_unicidad(contexto):
+    indice = contexto.unique_col_index
+    if indice == -1:
+        return None
+    registrar = contexto.unique_column_values.registrar
+    # Las filas llegan aquí con el nº de columnas de la cabecera, así que 'indice' siempre es válido.
+    if contexto.options.get('ignore_case'):
+        def regla(fila, num_fila):
+            valor_celda = fila[indice].strip().lower()
+            if valor_celda:
+                registrar(valor_celda, num_fila)
+    else:
+        def regla(fila, num_fila):
+            valor_celda = fila[indice].strip()
+            if valor_celda:
+                registrar(valor_celda, num_fila)
+    return regla
+
+@registrar_regla('duplicados', 100)
+def _regla_duplicados(contexto):
+    if not contexto.options.get('check_duplicadas'):
+        return None
+    registrar = contexto.seen_rows_and_lines.registrar
+    strip, lower = str.strip, str.lower
+    # Misma normalización que validators._normalizar_fila
+    if contexto.options.get('ignore_case'):
+        def regla(fila, num_fila):
+            if not registrar(tuple(map(lower, map(strip, fila))), num_fila):
+                return False
+    else:
+        def regla(fila, num_fila):
+            if not registrar(tuple(map(strip, fila)), num_fila):
+                return False
+    return regla
@@ -0,0 +1,43 @@
+# tests/test_indices.py
+
+import os
+
+from indices import IndiceEnDisco
+
+class _IndiceEspia(IndiceEnDisco):
+    """IndiceEnDisco que anota el tamaño de cada partición que se acaba cargando entera en memoria."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hojas = []
+
+    def _resolver_particion(self, ruta, nivel):
+        tam = os.path.getsize(ruta)
+        if not (tam * self.FACTOR_EXPANSION > self.memoria_max_bytes and nivel < self.MAX_NIVELES):
+            self.hojas.append(tam)
+        yield from super()._resolver_particion(ruta, nivel)
+
+def _filas_de_ancho_fijo(num_filas):
+    return [(f"{i:08d}", f"valor{i % 997:05d}", "x" * 20) for i in range(num_filas)]
+
+def test_subparticiones_reparten_claves_de_igual_longitud():
+    claves = _filas_de_ancho_fijo(5000)
+    num_particiones = 64
+    en_particion_0 = [clave for clave in claves if IndiceEnDisco._particion(clave, 0, num_particiones) == 0]
+    for nivel in range(1, IndiceEnDisco.MAX_NIVELES + 1):
+        destinos = {IndiceEnDisco._particion(clave, nivel, num_particiones) for clave in en_particion_0}
+        assert len(destinos) > num_particiones // 2
+
+def test_particiones_grandes_se_dividen_hasta_caber_en_el_presupuesto(tmp_path):
+    filas = _filas_de_ancho_fijo(200000)
+    presupuesto = 200 * 1024
+    indice = _IndiceEspia(presupuesto, directorio=str(tmp_path))
+    for num, fila in enumerate(filas, start=2):
+        indice.registrar(fila, num)
+    for num, fila in enumerate(filas[:1000], start=len(filas) + 2):
+        indice.registrar(fila, num)
+
+    repetidos = list(indice.repetidos())
+    assert indice.volcados > 0
+    assert len(repetidos) == 1000
+    assert all(lineas == [i + 2, i + len(filas) + 2] for i, (_, lineas) in enumerate(repetidos))
+    assert max(indice.hojas) * IndiceEnDisco.FACTOR_EXPANSION <= presupuesto
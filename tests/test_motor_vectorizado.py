@@ -0,0 +1,52 @@
+# tests/test_motor_vectorizado.py
+
+import csv
+import random
+
+import validators
+
+def _escribir_csv(ruta, filas):
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(filas)
+
+def _validar_con_ambos_motores(ruta, options):
+    return (validators.realizar_validacion_completa(str(ruta), dict(options, engine='python')),
+            validators.realizar_validacion_completa(str(ruta), dict(options, engine='pandas')))
+
+def test_nul_en_celdas_da_los_mismos_resultados_que_el_motor_de_python(tmp_path):
+    ruta = tmp_path / "nul.csv"
+    _escribir_csv(ruta, [
+        ['id', 'valor'],
+        ['  ', '\x00'],
+        ['1', '\x00'],
+        ['2', '\x00'],
+        ['  ', '  '],
+        ['3', ' a\x00 '],
+        ['3', ' a\x00 '],
+    ])
+    options = {'encoding': 'utf-8', 'check_vacias': True, 'check_duplicadas': True,
+               'check_uniqueness': True, 'unique_column_name': 'valor'}
+    python, pandas = _validar_con_ambos_motores(ruta, options)
+
+    assert python['filas_vacias'] == [5]
+    assert python['errores_de_unicidad'] == {'\x00': [2, 3, 4], 'a\x00': [6, 7]}
+    for clave in ('filas_vacias', 'errores_de_unicidad', 'filas_duplicadas', 'filas_invalidas', 'total_filas'):
+        assert pandas[clave] == python[clave], clave
+
+def test_esquema_con_nul_no_falla_y_coincide_con_el_motor_de_python(tmp_path):
+    esquema = {'columnas': {
+        'a': {'tipo': 'entero', 'minimo': 0},
+        'b': {'tipo': 'decimal'},
+        'c': {'valores': ['x', 'y'], 'obligatorio': True},
+        'd': {'longitud_max': 3},
+    }}
+    options = {'encoding': 'utf-8', 'esquema': esquema}
+    aleatorio = random.Random(21)
+    ruta = tmp_path / "esquema_nul.csv"
+    for _ in range(50):
+        filas = [[''.join(aleatorio.choice(' \x0012-.xy') for _ in range(aleatorio.randint(0, 8))) for _ in range(4)]
+                 for _ in range(aleatorio.randint(1, 40))]
+        _escribir_csv(ruta, [['a', 'b', 'c', 'd'], *filas])
+        python, pandas = _validar_con_ambos_motores(ruta, options)
+        assert pandas['error_lectura'] is None
+        assert pandas['errores_de_esquema'] == python['errores_de_esquema']
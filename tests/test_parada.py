@@ -0,0 +1,17 @@
+# tests/test_parada.py
+
+import pytest
+
+from parada import crear_comprobador_parada, normalizar_parada
+
+def test_filas_minimas_debe_ser_al_menos_1():
+    with pytest.raises(ValueError, match='filas_minimas'):
+        normalizar_parada({'tasa_maxima': 0.5, 'filas_minimas': 0})
+
+def test_tasa_maxima_con_una_fila_minima():
+    resultados = {'error_header': False, 'filas_invalidas': [], 'filas_vacias': [],
+                  'celdas_con_saltos': [], 'errores_de_esquema': []}
+    comprobar = crear_comprobador_parada({'parada': {'tasa_maxima': 0.5, 'filas_minimas': 1}}, resultados)
+    assert comprobar(1) is None
+    resultados['filas_invalidas'].append(2)
+    assert comprobar(2)['regla'] == 'tasa_maxima'
@@ -5,14 +5,24 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import threading
 import logging
+import os
 import webbrowser
 
 from .constants import *
 from .tooltip import ToolTip
-from validators import realizar_validacion_completa, crear_csv_limpio, leer_primeras_lineas
+from .tabla_virtual import TablaVirtual, ModeloResultados
+from validators import crear_csv_limpio, leer_primeras_lineas, tiene_errores
+from compresion import nombre_limpio
+from cache_resultados import validar_con_cache
+from esquema import cargar_esquema
+from indice_filas import IndiceFilas
+from progreso import TokenCancelacion, ValidacionCancelada
 
 logger = logging.getLogger(__name__)
 
+# Filas que se muestran antes y después de la línea a la que se salta en la previsualización
+FILAS_ALREDEDOR = 25
+
 class ValidadorCSVApp:
     def __init__(self, root):
         self.root = root
@@ -20,8 +30,20 @@ class ValidadorCSVApp:
         self.configurar_ventana()
 
         self.validation_thread = None
+        self.cleaning_thread = None
         self.resultados_validacion = None
+        self.resumen_limpieza = None
+        self.cancelacion = None
+        self.ultimo_progreso = None
         self.ruta_archivo_actual = None
+        self.esquema = None
+        self.preview_thread = None
+        self.preview_data = None
+        self.indice_filas = None
+        self.indice_thread = None
+        self.cancelacion_indice = None
+        self.salto_thread = None
+        self.filas_salto = None
         
         self._crear_menu()
         self._configure_treeview_style()
@@ -92,11 +114,11 @@ Bienvenido a la guía de usuario. Aquí encontrarás una explicación detallada
 
 El proceso para validar un archivo es simple:
 
-1.  **Seleccionar Archivo:** Usa el botón **"📂 Seleccionar Archivo"** para abrir un explorador y elegir tu fichero `.csv`. Al seleccionarlo, verás una previsualización de las primeras 50 filas en la pestaña **"📄 Previsualización del Archivo"**. Esto te permite confirmar que es el fichero correcto y que la codificación es la adecuada.
+1.  **Seleccionar Archivo:** Usa el botón **"📂 Seleccionar Archivo"** para abrir un explorador y elegir tu fichero `.csv`. Al seleccionarlo, verás una previsualización de las primeras 50 filas en la pestaña **"📄 Previsualización del Archivo"**. Esto te permite confirmar que es el fichero correcto y que la codificación es la adecuada. La lectura se hace en segundo plano, así que la ventana no se bloquea aunque el archivo sea enorme. Mientras tanto se indexa el archivo y, en **"Ir a la línea"**, puedes escribir cualquier número de línea (por ejemplo, 8000000) para ver al instante las filas que la rodean.
 
 2.  **Configurar Opciones:** Antes de validar, puedes ajustar las reglas en la sección de **"Opciones de Validación Avanzada"**.
 
-3.  **Iniciar Validación:** Pulsa el botón **"🚀 Iniciar Validación"**. La aplicación procesará el archivo completo en segundo plano. La barra de progreso se activará y los botones se deshabilitarán.
+3.  **Iniciar Validación:** Pulsa el botón **"🚀 Iniciar Validación"**. La aplicación procesará el archivo completo en segundo plano. La barra de progreso mostrará el porcentaje leído, las filas procesadas, la velocidad y el tiempo restante estimado. Si el archivo es muy grande, puedes detener el proceso con **"⛔ Cancelar"** y revisar los resultados parciales.
 
 4.  **Revisar Resultados:** Una vez finalizado, la aplicación cambiará automáticamente a la pestaña **"📊 Resultados de Validación"**, donde verás una tabla con todos los errores encontrados. La barra de estadísticas superior te dará un resumen rápido.
 
@@ -108,7 +130,13 @@ El proceso para validar un archivo es simple:
 
 #### **Codificación del archivo**
 - **Qué es:** Define el formato de caracteres de tu archivo.
-- **Cuándo usarlo:** Si al previsualizar o validar ves caracteres extraños (como `Ã³` en lugar de `ó`), es muy probable que la codificación sea incorrecta. El estándar es `utf-8`, pero archivos generados por programas más antiguos en Windows suelen usar `latin-1` o `cp1252`. Prueba con esas opciones.
+- **auto (por defecto):** Detecta la codificación al seleccionar el archivo analizando su inicio y varias muestras repartidas (marca BOM, UTF-8, UTF-16, `cp1252` o `latin-1`) y la muestra bajo la ruta del archivo. Si más adelante aparece algún byte que no encaja, la validación no se detiene: se informa del primero (posición en bytes y línea) como un error de **Codificación** en la tabla.
+- **Cuándo elegirla a mano:** Si al previsualizar o validar ves caracteres extraños (como `Ã³` en lugar de `ó`), es muy probable que la codificación sea incorrecta. El estándar es `utf-8`, pero archivos generados por programas más antiguos en Windows suelen usar `latin-1` o `cp1252`. Prueba con esas opciones.
+
+#### **Delimitador**
+- **Qué es:** El carácter que separa los campos de cada fila.
+- **auto (por defecto):** Analiza el inicio del archivo y elige el delimitador (`,` `;` Tab `|`) y el tipo de comillas con los que más filas tienen el mismo número de columnas. El resultado se muestra bajo la ruta del archivo y se mantiene al exportar el CSV limpio.
+- **Cuándo elegirlo a mano:** Si la previsualización muestra todas las columnas juntas en una sola, o si el archivo es tan irregular que la detección falla.
 
 #### **Detectar filas vacías**
 - **Activado (por defecto):** Reportará cualquier fila que no contenga ningún dato.
@@ -139,7 +167,11 @@ La tabla te muestra todos los errores de forma organizada.
 - **Descripción:** Un mensaje que explica el error.
 - **Contenido de la Fila:** La fila completa donde se encontró el error, para darte contexto.
 
-💡 **Consejo:** ¡Puedes hacer clic en las cabeceras de las columnas ("Línea", "Tipo de Error", etc.) para ordenar los resultados!
+💡 **Consejo:** ¡Puedes hacer clic en las cabeceras de las columnas ("Línea", "Tipo de Error", etc.) para ordenar los resultados! Un segundo clic invierte el orden.
+
+Encima de la tabla puedes mostrar solo un tipo de error o escribir un texto y pulsar Enter para ver únicamente los resultados que lo contienen. La tabla solo dibuja las filas visibles, así que se desplaza con fluidez aunque haya cientos de miles de errores.
+
+Haz **doble clic** en un resultado (o selecciónalo y pulsa Enter) para ver su zona del archivo en la pestaña de previsualización, con la fila afectada resaltada.
 
 ---
 
@@ -199,6 +231,8 @@ La tabla te muestra todos los errores de forma organizada.
         self.clean_export_button.pack(side="left", padx=5)
         self.export_informe_button = customtkinter.CTkButton(boton_frame, text="💾 Exportar Informe", command=self._exportar_informe, state="disabled")
         self.export_informe_button.pack(side="left", padx=5)
+        self.cancel_button = customtkinter.CTkButton(boton_frame, text="⛔ Cancelar", command=self._cancelar_operacion, state="disabled", fg_color="#b23b3b", hover_color="#8f2f2f")
+        self.cancel_button.pack(side="left", padx=5)
         customtkinter.CTkButton(boton_frame, text="🔄 Limpiar Todo", command=self._limpiar).pack(side="left", padx=5)
         
         options_frame = customtkinter.CTkFrame(top_frame)
@@ -209,7 +243,8 @@ La tabla te muestra todos los errores de forma organizada.
         self.var_check_header = customtkinter.BooleanVar(value=False)
         self.var_ignore_case = customtkinter.BooleanVar(value=False)
         self.var_check_uniqueness = customtkinter.BooleanVar(value=False)
-        self.encoding_var = customtkinter.StringVar(value='utf-8')
+        self.encoding_var = customtkinter.StringVar(value='auto')
+        self.delimitador_var = customtkinter.StringVar(value='auto')
         self.unique_column_var = customtkinter.StringVar(value="(Seleccione archivo)")
         
         customtkinter.CTkCheckBox(options_frame, text="Detectar filas vacías", variable=self.var_check_vacias).grid(row=0, column=0, sticky='w', padx=10, pady=5)
@@ -230,8 +265,11 @@ La tabla te muestra todos los errores de forma organizada.
         encoding_frame = customtkinter.CTkFrame(options_frame, fg_color="transparent")
         encoding_frame.grid(row=2, column=0, sticky='w', padx=5, pady=5)
         customtkinter.CTkLabel(encoding_frame, text="Codificación del archivo:").pack(side='left', padx=(5,0))
-        self.encoding_menu = customtkinter.CTkOptionMenu(encoding_frame, variable=self.encoding_var, values=['utf-8', 'latin-1', 'cp1252', 'iso-8859-1'])
+        self.encoding_menu = customtkinter.CTkOptionMenu(encoding_frame, variable=self.encoding_var, values=['auto', 'utf-8', 'latin-1', 'cp1252', 'iso-8859-1'])
         self.encoding_menu.pack(side='left', padx=5)
+        customtkinter.CTkLabel(encoding_frame, text="Delimitador:").pack(side='left', padx=(10,0))
+        self.delimitador_menu = customtkinter.CTkOptionMenu(encoding_frame, variable=self.delimitador_var, values=list(DELIMITADORES), width=80)
+        self.delimitador_menu.pack(side='left', padx=5)
         
         uniqueness_frame = customtkinter.CTkFrame(options_frame, fg_color="transparent")
         uniqueness_frame.grid(row=2, column=1, sticky='w', padx=10, pady=5)
@@ -240,11 +278,26 @@ La tabla te muestra todos los errores de forma organizada.
         self.unique_column_menu = customtkinter.CTkOptionMenu(uniqueness_frame, variable=self.unique_column_var, values=["(Seleccione archivo)"], state="disabled")
         self.unique_column_menu.pack(side='left', padx=5)
 
+        esquema_frame = customtkinter.CTkFrame(options_frame, fg_color="transparent")
+        esquema_frame.grid(row=3, column=0, columnspan=2, sticky='w', padx=5, pady=5)
+        boton_esquema = customtkinter.CTkButton(esquema_frame, text="📐 Esquema de columnas...", command=self._seleccionar_esquema, width=180)
+        boton_esquema.pack(side='left', padx=5)
+        self.esquema_label = customtkinter.CTkLabel(esquema_frame, text="(sin esquema)")
+        self.esquema_label.pack(side='left', padx=5)
+        customtkinter.CTkButton(esquema_frame, text="✖", command=self._quitar_esquema, width=30).pack(side='left', padx=5)
+
+        claves_frame = customtkinter.CTkFrame(options_frame, fg_color="transparent")
+        claves_frame.grid(row=4, column=0, columnspan=2, sticky='w', padx=5, pady=5)
+        customtkinter.CTkLabel(claves_frame, text="Claves únicas:").pack(side='left', padx=(5,0))
+        self.entry_claves = customtkinter.CTkEntry(claves_frame, width=400, placeholder_text="p. ej. pais+id; email")
+        self.entry_claves.pack(side='left', padx=5, fill='x', expand=True)
+
         self.ruta_label = customtkinter.CTkLabel(top_frame, text="📂 Archivo: (ninguno seleccionado)", font=("Segoe UI", 12), wraplength=850)
         self.ruta_label.pack(fill=customtkinter.X, pady=5, padx=10)
         
-        self.progressbar = customtkinter.CTkProgressBar(top_frame)
+        self.progressbar = customtkinter.CTkProgressBar(top_frame, mode="determinate")
         self.progressbar.set(0)
+        self.progreso_label = customtkinter.CTkLabel(top_frame, text="", font=("Segoe UI", 11))
 
         self.estadisticas_label = customtkinter.CTkLabel(top_frame, text="📊 Selecciona un archivo para ver las estadísticas", font=("Segoe UI", 12, "italic"))
         self.estadisticas_label.pack(fill=customtkinter.X, pady=5)
@@ -255,32 +308,30 @@ La tabla te muestra todos los errores de forma organizada.
         self.tab_results = self.tab_view.add("📊 Resultados de Validación")
         self.tab_view.set("📄 Previsualización del Archivo")
 
+        salto_frame = customtkinter.CTkFrame(self.tab_preview, fg_color="transparent")
+        salto_frame.pack(fill='x', pady=(0, 5))
+        customtkinter.CTkLabel(salto_frame, text="Ir a la línea:").pack(side='left', padx=(5, 0))
+        self.linea_entry = customtkinter.CTkEntry(salto_frame, width=120, placeholder_text="p. ej. 8000000")
+        self.linea_entry.pack(side='left', padx=5)
+        self.linea_entry.bind('<Return>', lambda _: self._ir_a_linea_introducida())
+        customtkinter.CTkButton(salto_frame, text="➡ Ir", command=self._ir_a_linea_introducida, width=60).pack(side='left', padx=5)
+        self.indice_label = customtkinter.CTkLabel(salto_frame, text="", font=("Segoe UI", 11))
+        self.indice_label.pack(side='right', padx=5)
+
         self.preview_tree = ttk.Treeview(self.tab_preview, style='Treeview', show='headings')
         self.preview_tree.pack(fill='both', expand=True, padx=2, pady=2)
 
-        results_tree_frame = customtkinter.CTkFrame(self.tab_results, fg_color="transparent")
-        results_tree_frame.pack(fill='both', expand=True, padx=2, pady=2)
-        columns = ('linea', 'tipo_error', 'descripcion', 'contenido')
-        self.results_tree = ttk.Treeview(results_tree_frame, columns=columns, show='headings', style='Treeview')
-        self.results_tree.heading('linea', text='Línea', command=lambda: self._sort_treeview_column('linea', False))
-        self.results_tree.heading('tipo_error', text='Tipo de Error', command=lambda: self._sort_treeview_column('tipo_error', False))
-        self.results_tree.heading('descripcion', text='Descripción', command=lambda: self._sort_treeview_column('descripcion', False))
-        self.results_tree.heading('contenido', text='Contenido de la Fila', command=lambda: self._sort_treeview_column('contenido', False))
-        self.results_tree.column('linea', width=80, stretch=tk.NO, anchor='center')
-        self.results_tree.column('tipo_error', width=180, stretch=tk.NO)
-        self.results_tree.column('descripcion', width=350)
-        self.results_tree.column('contenido', width=500)
-        vsb = customtkinter.CTkScrollbar(results_tree_frame, command=self.results_tree.yview)
-        hsb = customtkinter.CTkScrollbar(results_tree_frame, command=self.results_tree.xview, orientation="horizontal")
-        self.results_tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-        vsb.pack(side='right', fill='y')
-        hsb.pack(side='bottom', fill='x')
-        self.results_tree.pack(side='left', fill='both', expand=True)
+        self.results_table = TablaVirtual(self.tab_results, al_activar=self._ir_a_linea)
+        self.results_table.pack(fill='both', expand=True, padx=2, pady=2)
 
         # Creación de los Tooltips
         ToolTip(chk_ign_case, "Si se marca, no se distinguirá entre mayúsculas y minúsculas \nal detectar duplicados o validar la cabecera.")
-        ToolTip(self.encoding_menu, "Selecciona la codificación de caracteres de tu archivo.\nUsa 'latin-1' o 'cp1252' si tienes problemas con tildes o eñes.")
+        ToolTip(self.encoding_menu, "Selecciona la codificación de caracteres de tu archivo.\n'auto' la detecta analizando muestras del archivo.\nUsa 'latin-1' o 'cp1252' si tienes problemas con tildes o eñes.")
+        ToolTip(self.delimitador_menu, "Carácter que separa los campos de cada fila.\n'auto' lo detecta (junto con las comillas) analizando el inicio del archivo.")
+        ToolTip(self.linea_entry, "Muestra las filas alrededor de esa línea (la cabecera es la línea 1).\nTambién puedes hacer doble clic en un resultado de la validación para ver su zona del archivo.")
         ToolTip(chk_unicidad, "Activa esta opción para comprobar que todos los valores en la\ncolumna seleccionada a la derecha son únicos.")
+        ToolTip(self.entry_claves, "Combinaciones de columnas que no se pueden repetir, separadas por ';'.\nLas columnas de una clave compuesta se unen con '+' (p. ej. 'pais+id; email').")
+        ToolTip(boton_esquema, "Carga un fichero JSON con el tipo y las restricciones de cada columna\n(entero, decimal, fecha, patrón, valores permitidos, longitud, obligatoria).")
         ToolTip(self.clean_export_button, "Crea un nuevo archivo CSV corrigiendo errores automáticamente:\n- Elimina filas vacías.\n- Elimina filas con un número de columnas incorrecto.\n- Elimina duplicados (conservando la primera aparición).\n- Recorta espacios en blanco de todas las celdas.")
 
 
@@ -288,54 +339,53 @@ La tabla te muestra todos los errores de forma organizada.
         customtkinter.set_appearance_mode(new_appearance_mode)
         self._update_treeview_theme(new_appearance_mode)
         
-    def _sort_treeview_column(self, col, reverse):
-        try:
-            data_list = [(self.results_tree.set(k, col), k) for k in self.results_tree.get_children('')]
-            key_func = lambda t: t[0]
-            if col == 'linea':
-                try:
-                    key_func = lambda t: int(t[0].split(',')[0]) if t[0] != '-' else float('inf')
-                except (ValueError, TypeError, IndexError): pass
-            data_list.sort(key=key_func, reverse=reverse)
-            for index, (val, k) in enumerate(data_list):
-                self.results_tree.move(k, '', index)
-            self.results_tree.heading(col, command=lambda: self._sort_treeview_column(col, not reverse))
-        except Exception as e:
-            logger.error(f"Error al ordenar la columna {col}: {e}")
-
     def _toggle_header_entry(self):
         self.entry_header.configure(state='normal' if self.var_check_header.get() else 'disabled')
 
+    def _seleccionar_esquema(self):
+        ruta = filedialog.askopenfilename(title="Selecciona un esquema de columnas", filetypes=[("Esquemas JSON", "*.json"), ("Todos los archivos", "*.*")])
+        if not ruta: logger.warning("El usuario canceló la selección del esquema."); return
+        try:
+            self.esquema = cargar_esquema(ruta)
+        except (OSError, ValueError) as e:
+            logger.error(f"No se pudo cargar el esquema {ruta}: {e}")
+            messagebox.showerror("Esquema no válido", f"No se pudo cargar el esquema:\n{e}")
+            return
+        logger.info(f"Esquema cargado desde {ruta} ({len(self.esquema['columnas'])} columnas).")
+        self.esquema_label.configure(text=f"{os.path.basename(ruta)} ({len(self.esquema['columnas'])} columnas)")
+
+    def _quitar_esquema(self):
+        self.esquema = None
+        self.esquema_label.configure(text="(sin esquema)")
+
     def _seleccionar_archivo(self):
-        ruta = filedialog.askopenfilename(title="Selecciona un archivo CSV", filetypes=[("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*")])
+        ruta = filedialog.askopenfilename(title="Selecciona un archivo CSV", filetypes=[("Archivos CSV", "*.csv"), ("CSV comprimidos", "*.gz *.bz2 *.xz *.zip"), ("Todos los archivos", "*.*")])
         if not ruta: logger.warning("El usuario canceló la selección de archivo."); return
         
         self._limpiar()
         self.ruta_archivo_actual = ruta
         self.ruta_label.configure(text=f"📂 Archivo seleccionado:\n{self.ruta_archivo_actual}")
-        
-        preview_data = self._mostrar_previsualizacion(self.ruta_archivo_actual)
-
-        if preview_data.get('exito') and preview_data.get('header'):
-            self.unique_column_menu.configure(state="normal", values=preview_data['header'])
-            self.unique_column_var.set(preview_data['header'][0])
-            self.validate_button.configure(state="normal")
+        self._mostrar_previsualizacion(self.ruta_archivo_actual)
 
     def _iniciar_validacion(self):
         if not self.ruta_archivo_actual:
             messagebox.showwarning("Sin Archivo", "Por favor, selecciona primero un archivo.")
             return
 
-        expected_headers = [h.strip() for h in self.entry_header.get().split(',') if h]
+        expected_headers = [h for h in (h.strip() for h in self.entry_header.get().split(',')) if h]
+        claves_unicas = [[c.strip() for c in clave.split('+')] for clave in self.entry_claves.get().split(';') if clave.strip()]
         self.validation_options = {
             'encoding': self.encoding_var.get(),
+            'delimitador': DELIMITADORES[self.delimitador_var.get()],
             'check_vacias': self.var_check_vacias.get(),
             'check_duplicadas': self.var_check_duplicadas.get(),
             'check_header': self.var_check_header.get(),
             'ignore_case': self.var_ignore_case.get(),
             'check_uniqueness': self.var_check_uniqueness.get(),
             'unique_column_name': self.unique_column_var.get(),
-            'expected_headers': expected_headers
+            'expected_headers': expected_headers,
+            'esquema': self.esquema,
+            'claves_unicas': claves_unicas
         }
         
         logger.info(f"Opciones de validación seleccionadas: {self.validation_options}")
@@ -343,56 +393,215 @@ La tabla te muestra todos los errores de forma organizada.
         self.validate_button.configure(state="disabled")
         self.ruta_label.configure(text=f"📂 Validando archivo... (Previsualización disponible)")
         
-        self.progressbar.pack(fill='x', padx=20, pady=(10,5))
-        self.progressbar.start()
+        self._mostrar_progreso()
 
         logger.info("Iniciando hilo de validación...")
         self.validation_thread = threading.Thread(target=self._worker_validacion, args=(self.ruta_archivo_actual, self.validation_options))
         self.validation_thread.start()
         self.root.after(100, self._verificar_hilo)
 
+    def _mostrar_progreso(self):
+        """Prepara la barra de progreso y el botón de cancelar para una nueva operación."""
+        self.cancelacion = TokenCancelacion()
+        self.ultimo_progreso = None
+        self.progressbar.set(0)
+        self.progressbar.pack(fill='x', padx=20, pady=(10,0))
+        self.progreso_label.configure(text="Iniciando...")
+        self.progreso_label.pack(fill='x', padx=20, pady=(0,5))
+        self.cancel_button.configure(state="normal")
+
+    def _ocultar_progreso(self):
+        self.progressbar.pack_forget()
+        self.progreso_label.pack_forget()
+        self.cancel_button.configure(state="disabled")
+
+    def _recibir_progreso(self, estado):
+        # Se llama desde el hilo de trabajo: solo se guarda el estado y la interfaz lo lee en _actualizar_progreso.
+        self.ultimo_progreso = estado
+
+    def _actualizar_progreso(self):
+        estado = self.ultimo_progreso
+        if not estado:
+            return
+        if estado['fraccion'] is not None:
+            self.progressbar.set(estado['fraccion'])
+        texto = (f"{estado['filas']:,} filas · {estado['bytes_leidos'] / (1024 * 1024):,.1f} MB"
+                 f" · {estado['filas_por_segundo']:,.0f} filas/s · {estado['mb_por_segundo']:,.1f} MB/s")
+        if estado['segundos_restantes'] is not None:
+            texto += f" · quedan ~{estado['segundos_restantes']:,.0f} s"
+        self.progreso_label.configure(text=texto)
+
+    def _cancelar_operacion(self):
+        if self.cancelacion is not None:
+            logger.info("El usuario ha solicitado cancelar la operación en curso.")
+            self.cancelacion.cancelar()
+            self.cancel_button.configure(state="disabled")
+            self.progreso_label.configure(text="Cancelando...")
+
     def _mostrar_previsualizacion(self, ruta):
+        """Lee el inicio del archivo en un hilo aparte; la interfaz se rellena al terminar (ver _aplicar_previsualizacion)."""
         logger.info("Generando previsualización del archivo.")
         self.tab_view.set("📄 Previsualización del Archivo")
-        
         self.preview_tree.delete(*self.preview_tree.get_children())
         self.preview_tree['columns'] = ()
+        self.indice_label.configure(text="⏳ Leyendo el archivo...")
+
+        self.preview_data = None
+        opciones_csv = {'delimitador': DELIMITADORES[self.delimitador_var.get()]}
+        self.preview_thread = threading.Thread(target=self._worker_previsualizacion, args=(ruta, self.encoding_var.get(), opciones_csv), daemon=True)
+        self.preview_thread.start()
+        self.root.after(50, lambda hilo=self.preview_thread: self._verificar_hilo_previsualizacion(hilo, ruta))
+
+    def _worker_previsualizacion(self, ruta, encoding, opciones_csv):
+        preview_data = leer_primeras_lineas(ruta, 50, encoding, opciones_csv)
+        # Si entretanto se ha elegido otro archivo, este resultado ya no interesa
+        if threading.current_thread() is self.preview_thread:
+            self.preview_data = preview_data
+
+    def _verificar_hilo_previsualizacion(self, hilo, ruta):
+        if hilo is not self.preview_thread:
+            return
+        if hilo.is_alive():
+            self.root.after(50, lambda: self._verificar_hilo_previsualizacion(hilo, ruta))
+            return
+        self._aplicar_previsualizacion(ruta, self.preview_data or {'exito': False, 'error': "La lectura terminó sin devolver datos."})
 
-        preview_data = leer_primeras_lineas(ruta, 50, self.encoding_var.get())
-
+    def _aplicar_previsualizacion(self, ruta, preview_data):
+        self.indice_label.configure(text="")
         if not preview_data.get('exito'):
             messagebox.showerror("Error de Previsualización", f"No se pudo leer el archivo para previsualizar:\n{preview_data.get('error')}")
-            return preview_data
+            return
+
+        detectado = []
+        if self.encoding_var.get() == 'auto':
+            detectado.append(f"🔤 Codificación detectada: {preview_data.get('encoding')}")
+        if self.delimitador_var.get() == 'auto':
+            delimitador = preview_data['dialecto']['delimitador']
+            detectado.append(f"🔣 Delimitador detectado: {'Tab' if delimitador == chr(9) else delimitador}")
+        if detectado:
+            self.ruta_label.configure(text=f"📂 Archivo seleccionado:\n{ruta}\n" + "   ".join(detectado))
 
         header = preview_data.get('header', [])
         if not header:
             logger.warning("El archivo seleccionado para previsualizar no tiene cabecera o está vacío.")
-            return preview_data
+            return
 
-        self.preview_tree['columns'] = header
-        for col in header:
-            self.preview_tree.heading(col, text=col, anchor='w')
-            self.preview_tree.column(col, width=150, anchor='w')
-        
-        for i, row in enumerate(preview_data.get('rows', [])):
-            if len(row) < len(header): row.extend([''] * (len(header) - len(row)))
-            elif len(row) > len(header): row = row[:len(header)]
-            self.preview_tree.insert('', 'end', values=row, iid=f"preview_row_{i}")
-        
-        return preview_data
+        # Los identificadores de columna no usan los nombres de la cabecera, que pueden repetirse
+        columnas = ['linea'] + [f"col_{i}" for i in range(len(header))]
+        self.preview_tree['columns'] = columnas
+        self.preview_tree.heading('linea', text="Línea", anchor='center')
+        self.preview_tree.column('linea', width=80, anchor='center', stretch=tk.NO)
+        for columna, nombre in zip(columnas[1:], header):
+            self.preview_tree.heading(columna, text=nombre, anchor='w')
+            self.preview_tree.column(columna, width=150, anchor='w')
+        self._rellenar_previsualizacion(enumerate(preview_data.get('rows', []), start=2))
+
+        self.unique_column_menu.configure(state="normal", values=header)
+        self.unique_column_var.set(header[0])
+        self.validate_button.configure(state="normal")
+
+        dialecto = preview_data['dialecto']
+        opciones = {'encoding': preview_data['encoding'], 'delimitador': dialecto['delimitador'],
+                    'comilla': dialecto['comilla'], 'escape': dialecto['escape']}
+        self._iniciar_indice(ruta, opciones)
+
+    def _rellenar_previsualizacion(self, filas, linea_destacada=None):
+        """Muestra pares (nº de línea, fila) en la previsualización, ajustados al nº de columnas de la cabecera."""
+        self.preview_tree.delete(*self.preview_tree.get_children())
+        num_columnas = len(self.preview_tree['columns']) - 1
+        for linea, row in filas:
+            if len(row) < num_columnas: row = row + [''] * (num_columnas - len(row))
+            elif len(row) > num_columnas: row = row[:num_columnas]
+            self.preview_tree.insert('', 'end', values=[linea, *row], iid=f"preview_row_{linea}")
+        iid = f"preview_row_{linea_destacada}"
+        if linea_destacada is not None and self.preview_tree.exists(iid):
+            self.preview_tree.selection_set(iid)
+            self.preview_tree.see(iid)
+
+    def _iniciar_indice(self, ruta, opciones):
+        """Construye en segundo plano el índice de líneas que permite saltar a cualquier zona del archivo."""
+        self.cancelacion_indice = TokenCancelacion()
+        self.indice_filas = IndiceFilas(ruta, opciones)
+        self.indice_thread = threading.Thread(target=self._worker_indice, args=(self.indice_filas, self.cancelacion_indice), daemon=True)
+        self.indice_thread.start()
+        self.root.after(250, lambda indice=self.indice_filas: self._verificar_hilo_indice(indice))
+
+    def _worker_indice(self, indice, cancelacion):
+        try:
+            indice.construir(cancelacion=cancelacion)
+        except ValidacionCancelada:
+            logger.info(f"Se ha cancelado el índice de líneas de {indice.ruta_csv}.")
+        except Exception:
+            logger.error(f"No se pudo construir el índice de líneas de {indice.ruta_csv}.", exc_info=True)
+
+    def _verificar_hilo_indice(self, indice):
+        if indice is not self.indice_filas:
+            return
+        if indice.motivo_no_indexable is not None:
+            self.indice_label.configure(text=f"🗂️ {indice.motivo_no_indexable}: los saltos leen el archivo desde el principio")
+        elif indice.completo:
+            self.indice_label.configure(text=f"🗂️ {indice.total_lineas:,} líneas indexadas")
+        elif self.indice_thread.is_alive():
+            self.indice_label.configure(text=f"🗂️ Indexando... {indice.lineas_indexadas:,} líneas")
+        else:
+            self.indice_label.configure(text=f"🗂️ Índice incompleto ({indice.lineas_indexadas:,} líneas)")
+        if self.indice_thread.is_alive():
+            self.root.after(250, lambda: self._verificar_hilo_indice(indice))
+
+    def _ir_a_linea_introducida(self):
+        texto = self.linea_entry.get().strip().replace('.', '').replace(',', '')
+        if not texto.isdigit() or int(texto) < 1:
+            messagebox.showwarning("Línea no válida", "Introduce un número de línea (la cabecera es la línea 1).")
+            return
+        self._ir_a_linea(int(texto))
+
+    def _ir_a_linea(self, linea):
+        """Muestra en la previsualización las filas alrededor de 'linea', leídas en un hilo aparte desde el índice."""
+        if self.indice_filas is None:
+            return
+        logger.info(f"Saltando a la línea {linea} en la previsualización.")
+        self.tab_view.set("📄 Previsualización del Archivo")
+        # La cabecera ya está en los títulos de las columnas: se muestra desde la línea 2
+        inicio = max(2, linea - FILAS_ALREDEDOR)
+        self.filas_salto = None
+        self.salto_thread = threading.Thread(target=self._worker_salto, args=(self.indice_filas, inicio, linea + FILAS_ALREDEDOR + 1 - inicio), daemon=True)
+        self.salto_thread.start()
+        self.root.after(20, lambda hilo=self.salto_thread: self._verificar_hilo_salto(hilo, linea))
+
+    def _worker_salto(self, indice, inicio, num_filas):
+        try:
+            filas = indice.leer_filas(inicio, num_filas)
+        except Exception as e:
+            logger.error(f"No se pudieron leer las filas desde la línea {inicio}: {e}")
+            filas = None
+        if threading.current_thread() is self.salto_thread:
+            self.filas_salto = filas
+
+    def _verificar_hilo_salto(self, hilo, linea):
+        if hilo is not self.salto_thread:
+            return
+        if hilo.is_alive():
+            self.root.after(20, lambda: self._verificar_hilo_salto(hilo, linea))
+            return
+        if self.filas_salto is None:
+            messagebox.showerror("Error de Previsualización", f"No se pudieron leer las filas alrededor de la línea {linea:,}.")
+        elif not self.filas_salto:
+            messagebox.showinfo("Fuera del archivo", f"El archivo no llega a la línea {linea:,}.")
+        else:
+            self._rellenar_previsualizacion(self.filas_salto, linea)
 
     def _worker_validacion(self, ruta_csv, options):
         logger.info(f"El hilo de trabajo ha comenzado la validación para: {ruta_csv}")
-        self.resultados_validacion = realizar_validacion_completa(ruta_csv, options)
+        self.resultados_validacion = validar_con_cache(ruta_csv, options, progreso=self._recibir_progreso, cancelacion=self.cancelacion)
         logger.info(f"El hilo de trabajo ha finalizado la validación.")
 
     def _verificar_hilo(self):
         if self.validation_thread.is_alive():
+            self._actualizar_progreso()
             self.root.after(100, self._verificar_hilo)
         else:
             logger.info("El hilo de trabajo ha sido verificado como finalizado. Mostrando resultados.")
-            self.progressbar.stop()
-            self.progressbar.pack_forget()
+            self._ocultar_progreso()
             self.select_button.configure(state="normal")
             self.validate_button.configure(state="normal")
             if self.resultados_validacion:
@@ -401,12 +610,16 @@ La tabla te muestra todos los errores de forma organizada.
                 self.export_informe_button.configure(state="normal")
                 self._mostrar_resultados()
                 self.tab_view.set("📊 Resultados de Validación")
+                if self.resultados_validacion.get('cancelado'):
+                    # Un CSV limpio a partir de resultados parciales eliminaría solo parte de los errores.
+                    self.clean_export_button.configure(state="disabled")
+                    messagebox.showinfo("Validación cancelada", f"La validación se canceló tras {self.resultados_validacion.get('total_filas', 0):,} filas.\nSe muestran los resultados parciales.")
             else:
                 logger.error("El hilo de validación terminó pero no se encontraron resultados.")
                 messagebox.showerror("Error", "La validación terminó inesperadamente sin resultados.")
             
     def _limpiar_resultados(self):
-        self.results_tree.delete(*self.results_tree.get_children())
+        self.results_table.limpiar()
         self.estadisticas_label.configure(text="📊 Selecciona un archivo para ver las estadísticas")
     
     def _mostrar_resultados(self):
@@ -423,32 +636,19 @@ La tabla te muestra todos los errores de forma organizada.
 
         stats_text = (f"📊 Total filas: {res.get('total_filas', 0)} | "
                       f"❌ Columnas: {len(res.get('filas_invalidas', []))} | "
+                      f"❌ Esquema: {len(res.get('errores_de_esquema', []))} | "
                       f"❌ Unicidad: {len(res.get('errores_de_unicidad', {}))} | "
+                      f"❌ Claves: {len(res.get('claves_repetidas', []))} | "
                       f"❌ Duplicadas: {len(res.get('filas_duplicadas', {}))}")
+        if res.get('desde_cache'):
+            stats_text += " | ♻️ Resultados de una validación anterior (el archivo no ha cambiado)"
         self.estadisticas_label.configure(text=stats_text)
         
-        if res.get('error_header'):
-            self.results_tree.insert('', 'end', values=('-', 'Cabecera', res['error_header'], ''))
-        
-        for fila_num, num_cols, contenido in res.get('filas_invalidas', []):
-            desc = f"Se esperaban {res.get('num_columnas_esperadas')} columnas, pero tiene {num_cols}"
-            self.results_tree.insert('', 'end', values=(fila_num, 'Nº de Columnas', desc, str(contenido)))
-        
-        for valor_repetido, lineas in res.get('errores_de_unicidad', {}).items():
-            desc = f"El valor '{valor_repetido}' está repetido en {len(lineas)} filas."
-            line_str = ', '.join(map(str, lineas))
-            col_name = self.validation_options.get('unique_column_name', '')
-            self.results_tree.insert('', 'end', values=(line_str, 'Error de Unicidad', desc, f"Columna: '{col_name}'"))
-        
-        for row_tuple, line_numbers in res.get('filas_duplicadas', {}).items():
-            line_str = ', '.join(map(str, line_numbers))
-            desc = f"Aparece en las líneas: {line_str}"
-            self.results_tree.insert('', 'end', values=(line_numbers[0], 'Fila Duplicada', desc, str(list(row_tuple))))
+        self.results_table.mostrar(ModeloResultados(res, self.validation_options.get('unique_column_name', '')))
     
     def _exportar_informe(self):
         if not self.resultados_validacion: messagebox.showinfo("Información", "Primero debes seleccionar y validar un archivo."); return
-        has_errors = any([self.resultados_validacion.get(key) for key in ['filas_invalidas', 'celdas_con_saltos', 'error_lectura', 'filas_vacias', 'filas_duplicadas', 'error_header', 'errores_de_unicidad']])
-        if not has_errors: messagebox.showinfo("¡Todo correcto!", "El archivo está perfectamente validado. No hay errores que exportar."); return
+        if not tiene_errores(self.resultados_validacion): messagebox.showinfo("¡Todo correcto!", "El archivo está perfectamente validado. No hay errores que exportar."); return
         
         ruta_guardado = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Archivos de texto", "*.txt")], title="Guardar informe de errores")
         if not ruta_guardado: logger.warning("El usuario canceló la exportación del informe."); return
@@ -467,7 +667,12 @@ La tabla te muestra todos los errores de forma organizada.
                 if res.get('filas_invalidas'):
                     f.write("--- ERRORES DE NÚMERO DE COLUMNAS ---\n")
                     for fn, nc, co in res['filas_invalidas']:
-                        f.write(f"Línea {fn}: Esperadas {res.get('num_columnas_esperadas')} cols, encontradas {nc}. Contenido: {co}\n")
+                        f.write(f"Línea {fn}: Esperadas {res.get('num_columnas_esperadas')} cols, encontradas {nc}. Contenido: {co if co is not None else CONTENIDO_OMITIDO}\n")
+                    f.write("\n")
+                if res.get('errores_de_esquema'):
+                    f.write("--- ERRORES DE ESQUEMA ---\n")
+                    for fn, col, va, mo in res['errores_de_esquema']:
+                        f.write(f"Línea {fn}, Columna '{col}': {mo}. Valor: {va if va is not None else CONTENIDO_OMITIDO}\n")
                     f.write("\n")
                 if res.get('errores_de_unicidad'):
                     f.write("--- ERRORES DE UNICIDAD DE COLUMNA ---\n")
@@ -476,6 +681,11 @@ La tabla te muestra todos los errores de forma organizada.
                     for valor, lineas in res['errores_de_unicidad'].items():
                         f.write(f"  - El valor '{valor}' se repite en las líneas: {', '.join(map(str, lineas))}\n")
                     f.write("\n")
+                if res.get('claves_repetidas'):
+                    f.write("--- CLAVES ÚNICAS REPETIDAS ---\n")
+                    for nombre, valores, lineas in res['claves_repetidas']:
+                        f.write(f"  - La clave '{nombre}' = {list(valores)} se repite en las líneas: {', '.join(map(str, lineas))}\n")
+                    f.write("\n")
                 if res.get('filas_duplicadas'):
                     f.write("--- GRUPOS DE FILAS DUPLICADAS ---\n")
                     for rt, lns in res['filas_duplicadas'].items():
@@ -484,10 +694,13 @@ La tabla te muestra todos los errores de forma organizada.
                 if res.get('celdas_con_saltos'):
                     f.write("--- ERRORES DE SALTOS DE LÍNEA ---\n")
                     for fn, cn, co in res['celdas_con_saltos']:
-                        f.write(f"Línea {fn}, Columna {cn}: Contenido con salto: {co.replace(chr(10), '{LF}')}\n")
+                        f.write(f"Línea {fn}, Columna {cn}: Contenido con salto: {co.replace(chr(10), '{LF}') if co is not None else CONTENIDO_OMITIDO}\n")
                     f.write("\n")
                 if res.get('filas_vacias'):
                     f.write(f"--- FILAS VACÍAS ENCONTRADAS ---\nLíneas: {', '.join(map(str, res['filas_vacias']))}\n\n")
+                if res.get('error_codificacion'):
+                    ec = res['error_codificacion']
+                    f.write(f"--- ERROR DE CODIFICACIÓN ---\nPrimer byte no válido en '{ec['encoding']}': posición {ec['byte']}, línea {ec['linea']} (bytes {ec['bytes']}).\n\n")
             
             messagebox.showinfo("Exportado", f"Informe de errores guardado en:\n{ruta_guardado}")
             logger.info("Informe exportado con éxito.")
@@ -500,20 +713,35 @@ La tabla te muestra todos los errores de forma organizada.
         ruta_original = self.resultados_validacion.get('ruta_archivo')
         if not ruta_original: messagebox.showerror("Error", "No se encontró la ruta del archivo original."); return
         
-        import os
-        base, ext = os.path.splitext(os.path.basename(ruta_original))
-        default_filename = f"{base}_limpio.csv"
-        ruta_destino = filedialog.asksaveasfilename(title="Guardar CSV Limpio", initialfile=default_filename, defaultextension=".csv", filetypes=[("Archivos CSV", "*.csv")])
+        default_filename = nombre_limpio(ruta_original)
+        ruta_destino = filedialog.asksaveasfilename(title="Guardar CSV Limpio", initialfile=default_filename, defaultextension=".csv",
+                                                    filetypes=[("Archivos CSV", "*.csv"), ("CSV comprimidos", "*.gz *.bz2 *.xz *.zip")])
         if not ruta_destino: logger.warning("El usuario canceló la exportación del CSV limpio."); return
 
-        thread = threading.Thread(target=self._worker_limpieza, args=(ruta_original, ruta_destino, self.resultados_validacion, self.validation_options))
-        thread.start()
+        self.clean_export_button.configure(state="disabled")
+        self._mostrar_progreso()
+        self.resumen_limpieza = None
+        self.cleaning_thread = threading.Thread(target=self._worker_limpieza, args=(ruta_original, ruta_destino, self.resultados_validacion, self.validation_options))
+        self.cleaning_thread.start()
+        self.root.after(100, lambda: self._verificar_hilo_limpieza(ruta_destino))
 
     def _worker_limpieza(self, ruta_original, ruta_destino, resultados_validacion, options):
         logger.info("Iniciando el hilo de trabajo para la limpieza del CSV.")
-        resumen = crear_csv_limpio(ruta_original, ruta_destino, resultados_validacion, options)
-        
-        if resumen.get('exito'):
+        self.resumen_limpieza = crear_csv_limpio(ruta_original, ruta_destino, resultados_validacion, options, progreso=self._recibir_progreso, cancelacion=self.cancelacion)
+
+    def _verificar_hilo_limpieza(self, ruta_destino):
+        if self.cleaning_thread.is_alive():
+            self._actualizar_progreso()
+            self.root.after(100, lambda: self._verificar_hilo_limpieza(ruta_destino))
+            return
+
+        self._ocultar_progreso()
+        self.clean_export_button.configure(state="normal")
+        resumen = self.resumen_limpieza or {'exito': False, 'error': "La limpieza terminó sin devolver un resumen."}
+        if resumen.get('cancelado'):
+            messagebox.showinfo("Limpieza cancelada", "Se ha cancelado la limpieza y se ha eliminado el fichero incompleto.")
+            logger.info("El usuario canceló la limpieza del CSV.")
+        elif resumen.get('exito'):
             info_msg = (
                 f"¡Archivo CSV limpiado con éxito!\n\n"
                 f"Ruta: {ruta_destino}\n"
@@ -531,9 +759,17 @@ La tabla te muestra todos los errores de forma organizada.
 
     def _limpiar(self):
         logger.info("Limpiando la interfaz de usuario.")
+        if self.cancelacion_indice is not None:
+            self.cancelacion_indice.cancelar()
+        self.preview_thread = None
+        self.salto_thread = None
+        self.indice_filas = None
+        self.cancelacion_indice = None
+        self.indice_label.configure(text="")
+        self.linea_entry.delete(0, 'end')
         self.preview_tree.delete(*self.preview_tree.get_children())
         self.preview_tree['columns'] = ()
-        self.results_tree.delete(*self.results_tree.get_children())
+        self.results_table.limpiar()
         self.tab_view.set("📄 Previsualización del Archivo")
         self.ruta_label.configure(text="📂 Archivo: (ninguno seleccionado)")
         self.estadisticas_label.configure(text="📊 Selecciona un archivo para ver las estadísticas")
@@ -4,3 +4,8 @@
 COLOR_ERROR = "red"
 COLOR_SUCCESS = "green"
 
+# Texto que se muestra cuando la validación no guardó el contenido de una fila (límite por categoría)
+CONTENIDO_OMITIDO = "(contenido no guardado)"
+
+# Delimitadores del menú de opciones y el carácter que representan ('auto' lo detecta en cada archivo)
+DELIMITADORES = {'auto': 'auto', ',': ',', ';': ';', 'Tab': '\t', '|': '|'}
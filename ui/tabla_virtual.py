@@ -0,0 +1,342 @@
+# ui/tabla_virtual.py
+
+import bisect
+import logging
+import tkinter as tk
+from array import array
+from tkinter import ttk
+
+import customtkinter
+
+from .constants import CONTENIDO_OMITIDO
+
+logger = logging.getLogger(__name__)
+
+# (identificador, título, ancho, se estira)
+COLUMNAS_RESULTADOS = (
+    ('linea', 'Línea', 80, False),
+    ('tipo_error', 'Tipo de Error', 180, False),
+    ('descripcion', 'Descripción', 350, True),
+    ('contenido', 'Contenido de la Fila', 500, True),
+)
+TODOS_LOS_TIPOS = "Todos los tipos"
+
+class ModeloResultados:
+    """
+    Vista de solo lectura sobre un diccionario de resultados de validación.
+    No copia ni formatea los hallazgos por adelantado: cada categoría es un segmento que
+    apunta a la lista original, y el texto de una fila se genera solo cuando se pide.
+    La ordenación y el filtrado trabajan con arrays de posiciones, no con filas de la tabla;
+    el orden de cada columna se calcula una sola vez y se reutiliza (al revés si es descendente).
+    """
+    def __init__(self, resultados, columna_unicidad=''):
+        self.resultados = resultados
+        self.columna_unicidad = columna_unicidad
+        self.segmentos = []
+        if resultados.get('error_header'):
+            self._anadir_segmento('Cabecera', [resultados['error_header']], self._formatear_cabecera)
+        self._anadir_segmento('Nº de Columnas', resultados.get('filas_invalidas', []), self._formatear_columnas)
+        self._anadir_segmento('Esquema', resultados.get('errores_de_esquema', []), self._formatear_esquema)
+        self._anadir_segmento('Error de Unicidad', list(resultados.get('errores_de_unicidad', {}).items()), self._formatear_unicidad)
+        self._anadir_segmento('Clave Repetida', resultados.get('claves_repetidas', []), self._formatear_clave)
+        self._anadir_segmento('Fila Duplicada', list(resultados.get('filas_duplicadas', {}).items()), self._formatear_duplicada)
+        if resultados.get('error_codificacion'):
+            self._anadir_segmento('Codificación', [resultados['error_codificacion']], self._formatear_codificacion)
+
+        self.inicios = []
+        total = 0
+        for segmento in self.segmentos:
+            self.inicios.append(total)
+            total += len(segmento[1])
+        self.total = total
+
+        self._ordenes = {}
+        self.columna_orden = None
+        self.descendente = False
+        self.tipo_filtro = None
+        self.texto_filtro = ''
+        self.vista = None  # None equivale a todas las filas en su orden original
+
+    def _anadir_segmento(self, tipo, datos, formateador):
+        if datos:
+            self.segmentos.append((tipo, datos, formateador))
+
+    def __len__(self):
+        return self.total if self.vista is None else len(self.vista)
+
+    def tipos(self):
+        return [tipo for tipo, _, _ in self.segmentos]
+
+    def _localizar(self, indice):
+        num_segmento = bisect.bisect_right(self.inicios, indice) - 1
+        tipo, datos, formateador = self.segmentos[num_segmento]
+        return tipo, datos[indice - self.inicios[num_segmento]], formateador
+
+    def valores(self, indice):
+        """Devuelve los textos (línea, tipo, descripción, contenido) del hallazgo con ese índice global."""
+        tipo, dato, formateador = self._localizar(indice)
+        linea, descripcion, contenido = formateador(dato)
+        return linea, tipo, descripcion, contenido
+
+    def valores_visibles(self, posicion):
+        """Devuelve los textos de la fila que ocupa 'posicion' en la vista ordenada y filtrada."""
+        return self.valores(posicion if self.vista is None else self.vista[posicion])
+
+    def linea_visible(self, posicion):
+        """Primera línea del archivo afectada por el hallazgo que ocupa 'posicion' en la vista (1 para la cabecera)."""
+        linea = self._clave('linea')(posicion if self.vista is None else self.vista[posicion])
+        return 1 if linea == float('inf') else linea
+
+    def _formatear_cabecera(self, error):
+        return '-', error, ''
+
+    def _formatear_columnas(self, dato):
+        fila_num, num_cols, contenido = dato
+        desc = f"Se esperaban {self.resultados.get('num_columnas_esperadas')} columnas, pero tiene {num_cols}"
+        return fila_num, desc, str(contenido) if contenido is not None else CONTENIDO_OMITIDO
+
+    def _formatear_esquema(self, dato):
+        fila_num, nombre_columna, valor, motivo = dato
+        return fila_num, f"Columna '{nombre_columna}': {motivo}", valor if valor is not None else CONTENIDO_OMITIDO
+
+    def _formatear_unicidad(self, dato):
+        valor_repetido, lineas = dato
+        desc = f"El valor '{valor_repetido}' está repetido en {len(lineas)} filas."
+        return ', '.join(map(str, lineas)), desc, f"Columna: '{self.columna_unicidad}'"
+
+    def _formatear_clave(self, dato):
+        nombre, valores, lineas = dato
+        desc = f"La clave '{nombre}' = {list(valores)} está repetida en {len(lineas)} filas."
+        return ', '.join(map(str, lineas)), desc, str(list(valores))
+
+    def _formatear_duplicada(self, dato):
+        row_tuple, line_numbers = dato
+        desc = f"Aparece en las líneas: {', '.join(map(str, line_numbers))}"
+        return line_numbers[0], desc, str(list(row_tuple))
+
+    def _formatear_codificacion(self, ubicacion):
+        desc = f"Byte no válido en '{ubicacion['encoding']}' en la posición {ubicacion['byte']:,}"
+        return ubicacion['linea'], desc, f"Bytes: {ubicacion['bytes']}"
+
+    def _clave(self, columna):
+        """Función de ordenación de una columna sobre índices globales."""
+        if columna == 'linea':
+            def clave_linea(indice):
+                tipo, dato, _ = self._localizar(indice)
+                if tipo == 'Cabecera':
+                    return float('inf')
+                if tipo in ('Nº de Columnas', 'Esquema'):
+                    return dato[0]
+                if tipo == 'Codificación':
+                    return dato['linea']
+                if tipo == 'Clave Repetida':
+                    return dato[2][0]
+                return dato[1][0]
+            return clave_linea
+        if columna == 'tipo_error':
+            return lambda indice: self._localizar(indice)[0]
+        posicion = [c[0] for c in COLUMNAS_RESULTADOS].index(columna)
+        return lambda indice: self.valores(indice)[posicion]
+
+    def _orden(self, columna):
+        orden = self._ordenes.get(columna)
+        if orden is None:
+            orden = array('q', sorted(range(self.total), key=self._clave(columna)))
+            self._ordenes[columna] = orden
+        return orden
+
+    def ordenar(self, columna, descendente=False):
+        self.columna_orden = columna
+        self.descendente = descendente
+        self._recalcular_vista()
+
+    def filtrar(self, tipo=None, texto=''):
+        """Filtra por tipo de error y/o por texto (sin distinguir mayúsculas) en cualquier columna."""
+        self.tipo_filtro = tipo
+        self.texto_filtro = texto.strip().lower()
+        self._recalcular_vista()
+
+    def _recalcular_vista(self):
+        if self.columna_orden is None and self.tipo_filtro is None and not self.texto_filtro:
+            self.vista = None
+            return
+        indices = range(self.total) if self.columna_orden is None else self._orden(self.columna_orden)
+        if self.descendente:
+            indices = reversed(indices)
+
+        if self.tipo_filtro is not None:
+            num_segmento = self.tipos().index(self.tipo_filtro)
+            inicio = self.inicios[num_segmento]
+            fin = inicio + len(self.segmentos[num_segmento][1])
+            indices = (i for i in indices if inicio <= i < fin)
+        if self.texto_filtro:
+            texto = self.texto_filtro
+            indices = (i for i in indices if any(texto in str(v).lower() for v in self.valores(i)))
+        self.vista = array('q', indices)
+
+class TablaVirtual(customtkinter.CTkFrame):
+    """
+    Tabla de resultados virtualizada: el Treeview solo contiene las filas que caben en pantalla
+    y se rellenan desde un ModeloResultados al desplazarse, así que el coste de mostrar,
+    ordenar o filtrar no depende de cuántos hallazgos haya en la tabla visible.
+    """
+    def __init__(self, master, al_activar=None, **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.modelo = None
+        self.al_activar = al_activar
+        self.desplazamiento = 0
+        self.filas_visibles = 1
+        self.iids = []
+
+        filtros_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        filtros_frame.pack(fill='x', pady=(0, 5))
+        customtkinter.CTkLabel(filtros_frame, text="Mostrar:").pack(side='left', padx=(5, 0))
+        self.tipo_var = customtkinter.StringVar(value=TODOS_LOS_TIPOS)
+        self.tipo_menu = customtkinter.CTkOptionMenu(filtros_frame, variable=self.tipo_var, values=[TODOS_LOS_TIPOS], command=lambda _: self._aplicar_filtro(), width=180)
+        self.tipo_menu.pack(side='left', padx=5)
+        self.busqueda_entry = customtkinter.CTkEntry(filtros_frame, width=250, placeholder_text="Buscar texto (Enter)")
+        self.busqueda_entry.pack(side='left', padx=5)
+        self.busqueda_entry.bind('<Return>', lambda _: self._aplicar_filtro())
+        self.contador_label = customtkinter.CTkLabel(filtros_frame, text="", font=("Segoe UI", 11))
+        self.contador_label.pack(side='right', padx=5)
+
+        tabla_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        tabla_frame.pack(fill='both', expand=True)
+        self.tree = ttk.Treeview(tabla_frame, columns=[c[0] for c in COLUMNAS_RESULTADOS], show='headings', style='Treeview', selectmode='browse')
+        for columna, titulo, ancho, estirar in COLUMNAS_RESULTADOS:
+            self.tree.heading(columna, text=titulo, command=lambda c=columna: self._ordenar(c))
+            self.tree.column(columna, width=ancho, stretch=tk.YES if estirar else tk.NO, anchor='center' if columna == 'linea' else 'w')
+        self.vsb = customtkinter.CTkScrollbar(tabla_frame, command=self._yview)
+        hsb = customtkinter.CTkScrollbar(tabla_frame, command=self.tree.xview, orientation="horizontal")
+        self.tree.configure(xscrollcommand=hsb.set)
+        self.vsb.pack(side='right', fill='y')
+        hsb.pack(side='bottom', fill='x')
+        self.tree.pack(side='left', fill='both', expand=True)
+
+        self.tree.bind('<Configure>', self._al_redimensionar)
+        self.tree.bind('<MouseWheel>', self._rueda)
+        self.tree.bind('<Button-4>', lambda e: self._desplazar(-3))
+        self.tree.bind('<Button-5>', lambda e: self._desplazar(3))
+        self.tree.bind('<Prior>', lambda e: self._desplazar(-self.filas_visibles))
+        self.tree.bind('<Next>', lambda e: self._desplazar(self.filas_visibles))
+        self.tree.bind('<Home>', lambda e: self._desplazar(-len(self.modelo or ())))
+        self.tree.bind('<End>', lambda e: self._desplazar(len(self.modelo or ())))
+        self.tree.bind('<Double-1>', self._activar)
+        self.tree.bind('<Return>', self._activar)
+        self._actualizar_scrollbar()
+
+    def mostrar(self, modelo):
+        """Muestra un nuevo modelo de resultados desde el principio, sin filtros ni orden."""
+        self.modelo = modelo
+        self.desplazamiento = 0
+        self.tipo_var.set(TODOS_LOS_TIPOS)
+        self.tipo_menu.configure(values=[TODOS_LOS_TIPOS, *modelo.tipos()])
+        self.busqueda_entry.delete(0, 'end')
+        self._actualizar_cabeceras()
+        self._refrescar()
+
+    def limpiar(self):
+        self.modelo = None
+        self.desplazamiento = 0
+        self.tipo_var.set(TODOS_LOS_TIPOS)
+        self.tipo_menu.configure(values=[TODOS_LOS_TIPOS])
+        self.busqueda_entry.delete(0, 'end')
+        self._actualizar_cabeceras()
+        self._refrescar()
+
+    def _alto_fila(self):
+        try:
+            return int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        except (ValueError, tk.TclError):
+            return 20
+
+    def _al_redimensionar(self, event):
+        filas = max(1, event.height // self._alto_fila())
+        if filas != self.filas_visibles:
+            self.filas_visibles = filas
+            self._refrescar()
+
+    def _rueda(self, event):
+        if event.delta:
+            self._desplazar(-3 if event.delta > 0 else 3)
+        return 'break'
+
+    def _yview(self, accion, cantidad, unidad=None):
+        total = len(self.modelo or ())
+        if accion == 'moveto':
+            self.desplazamiento = int(float(cantidad) * total)
+            self._refrescar()
+        elif accion == 'scroll':
+            paso = self.filas_visibles if unidad == 'pages' else 1
+            self._desplazar(int(cantidad) * paso)
+
+    def _desplazar(self, filas):
+        self.desplazamiento += filas
+        self._refrescar()
+        return 'break'
+
+    def _refrescar(self):
+        """Vuelca en el Treeview solo la ventana de filas visible."""
+        total = len(self.modelo or ())
+        self.desplazamiento = max(0, min(self.desplazamiento, total - self.filas_visibles))
+        num_filas = min(self.filas_visibles, total - self.desplazamiento)
+
+        while len(self.iids) > num_filas:
+            self.tree.delete(self.iids.pop())
+        for i in range(num_filas):
+            valores = self.modelo.valores_visibles(self.desplazamiento + i)
+            if i < len(self.iids):
+                self.tree.item(self.iids[i], values=valores)
+            else:
+                self.iids.append(self.tree.insert('', 'end', values=valores))
+
+        self._actualizar_scrollbar()
+        if self.modelo is None:
+            self.contador_label.configure(text="")
+        elif len(self.modelo) == self.modelo.total:
+            self.contador_label.configure(text=f"{total:,} resultados")
+        else:
+            self.contador_label.configure(text=f"{total:,} de {self.modelo.total:,} resultados")
+
+    def _actualizar_scrollbar(self):
+        total = len(self.modelo or ())
+        if not total:
+            self.vsb.set(0.0, 1.0)
+            return
+        self.vsb.set(self.desplazamiento / total, min(1.0, (self.desplazamiento + self.filas_visibles) / total))
+
+    def _activar(self, event):
+        """Pasa a 'al_activar' la línea del hallazgo seleccionado (doble clic o Intro)."""
+        seleccion = self.tree.selection()
+        if self.al_activar is None or self.modelo is None or not seleccion or seleccion[0] not in self.iids:
+            return
+        linea = self.modelo.linea_visible(self.desplazamiento + self.iids.index(seleccion[0]))
+        if linea is not None:
+            self.al_activar(linea)
+
+    def _ordenar(self, columna):
+        if self.modelo is None:
+            return
+        descendente = self.modelo.columna_orden == columna and not self.modelo.descendente
+        try:
+            self.modelo.ordenar(columna, descendente)
+        except Exception as e:
+            logger.error(f"Error al ordenar la columna {columna}: {e}")
+            return
+        self.desplazamiento = 0
+        self._actualizar_cabeceras()
+        self._refrescar()
+
+    def _actualizar_cabeceras(self):
+        for columna, titulo, _, _ in COLUMNAS_RESULTADOS:
+            if self.modelo is not None and self.modelo.columna_orden == columna:
+                titulo += " ▼" if self.modelo.descendente else " ▲"
+            self.tree.heading(columna, text=titulo)
+
+    def _aplicar_filtro(self):
+        if self.modelo is None:
+            return
+        tipo = self.tipo_var.get()
+        self.modelo.filtrar(None if tipo == TODOS_LOS_TIPOS else tipo, self.busqueda_entry.get())
+        self.desplazamiento = 0
+        self._refrescar()
@@ -0,0 +1,293 @@
+# validacion_paralela.py
+
+import csv
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import validators
+from validators import realizar_validacion_completa, crear_resultados_vacios
+from claves import ClaveUnica, preparar_claves
+from compresion import detectar_compresion
+from deteccion import compatible_con_ascii, contar_errores_de_decodificacion, resolver_formato
+from indices import IndiceClaves
+from progreso import ValidacionCancelada
+from reglas import ContextoReglas, PipelineReglas
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de lectura al buscar los límites de los bloques
+TAM_LECTURA = 1024 * 1024
+# Por debajo de este tamaño por bloque no compensa repartir un fichero entre procesos
+TAM_BLOQUE_MINIMO = 8 * 1024 * 1024
+
+def validar_archivos_en_paralelo(rutas_csv, options, max_workers=None):
+    """
+    Valida varios ficheros CSV repartiéndolos entre procesos.
+    Es un generador: devuelve los resultados de cada fichero en cuanto termina,
+    por lo que el orden de salida no tiene por qué coincidir con el de entrada.
+    """
+    rutas_csv = list(rutas_csv)
+    if not rutas_csv:
+        return
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(rutas_csv)))
+
+    logger.info(f"Validando {len(rutas_csv)} ficheros en paralelo con {max_workers} procesos.")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {executor.submit(realizar_validacion_completa, ruta, options): ruta for ruta in rutas_csv}
+        for futuro in as_completed(futuros):
+            ruta = futuros[futuro]
+            try:
+                resultados = futuro.result()
+            except Exception:
+                logger.critical(f"El proceso que validaba {ruta} terminó de forma inesperada.", exc_info=True)
+                resultados = crear_resultados_vacios(ruta)
+                resultados['error_lectura'] = "Ha ocurrido un error crítico. Revisa 'validator.log' para detalles."
+            yield resultados
+
+def validar_lote(rutas_csv, options, max_workers=None):
+    """
+    Valida un lote de ficheros y agrega los resultados.
+    Devuelve un diccionario con los resultados por ruta (en el orden de entrada) y un resumen.
+    """
+    rutas_csv = list(rutas_csv)
+    por_ruta = {}
+    for resultados in validar_archivos_en_paralelo(rutas_csv, options, max_workers):
+        por_ruta[resultados['ruta_archivo']] = resultados
+
+    resultados_ordenados = [por_ruta[ruta] for ruta in rutas_csv if ruta in por_ruta]
+    resumen = {
+        'ficheros': len(resultados_ordenados),
+        'con_error_lectura': sum(1 for r in resultados_ordenados if r.get('error_lectura')),
+        'total_filas': sum(r.get('total_filas', 0) for r in resultados_ordenados),
+        'filas_invalidas': sum(len(r.get('filas_invalidas', [])) for r in resultados_ordenados),
+        'filas_vacias': sum(len(r.get('filas_vacias', [])) for r in resultados_ordenados),
+        'grupos_duplicados': sum(len(r.get('filas_duplicadas', {})) for r in resultados_ordenados),
+        'errores_de_unicidad': sum(len(r.get('errores_de_unicidad', {})) for r in resultados_ordenados),
+        'claves_repetidas': sum(len(r.get('claves_repetidas', [])) for r in resultados_ordenados),
+    }
+    return {'resultados': resultados_ordenados, 'resumen': resumen}
+
+def buscar_limites_de_registro(ruta_csv, inicio, tam_objetivo, comilla=b'"', max_bloques=None):
+    """
+    Divide un fichero en bloques de aproximadamente 'tam_objetivo' bytes a partir de 'inicio'.
+    Cada límite cae justo después de un salto de línea que queda fuera de comillas,
+    de modo que ningún registro con saltos de línea internos se parte en dos.
+    Devuelve la lista de offsets, incluyendo 'inicio' y el tamaño del fichero.
+    Con 'max_bloques' deja de leer al encontrar ese número de bloques y el último offset es
+    el final del último bloque, no el del fichero.
+    """
+    tam_fichero = os.path.getsize(ruta_csv)
+    limites = [inicio]
+    siguiente_objetivo = inicio + tam_objetivo
+    paridad = 0
+    buscando = False
+    pos = inicio
+
+    with open(ruta_csv, 'rb') as f:
+        f.seek(inicio)
+        while True:
+            bloque = f.read(TAM_LECTURA)
+            if not bloque:
+                break
+            i, n = 0, len(bloque)
+            while i < n:
+                if not buscando:
+                    objetivo_local = siguiente_objetivo - pos
+                    if objetivo_local >= n:
+                        paridad ^= bloque.count(comilla, i) & 1
+                        break
+                    objetivo_local = max(i, objetivo_local)
+                    paridad ^= bloque.count(comilla, i, objetivo_local) & 1
+                    i = objetivo_local
+                    buscando = True
+
+                j = bloque.find(b'\n', i)
+                if j == -1:
+                    paridad ^= bloque.count(comilla, i) & 1
+                    break
+                paridad ^= bloque.count(comilla, i, j) & 1
+                i = j + 1
+                if paridad == 0:
+                    limite = pos + i
+                    if limite < tam_fichero:
+                        limites.append(limite)
+                    if max_bloques is not None and len(limites) > max_bloques:
+                        return limites
+                    siguiente_objetivo = limite + tam_objetivo
+                    buscando = False
+            pos += n
+
+    if limites[-1] != tam_fichero:
+        limites.append(tam_fichero)
+    return limites
+
+def motivo_sin_paridad_de_comillas(ruta_csv, options):
+    """
+    Devuelve por qué los registros del fichero no se pueden localizar por offset con la paridad
+    de comillas (ver buscar_limites_de_registro), o None si se puede. Cada motor que lee por
+    rangos de bytes añade a esto sus propias condiciones.
+    """
+    if detectar_compresion(ruta_csv):
+        return "El fichero está comprimido y no admite acceso aleatorio"
+    formato = validators._formato_csv(options)
+    if formato['escapechar'] or not formato['doublequote']:
+        return "El dialecto usa un carácter de escape"
+    if not formato['quotechar'].isascii():
+        return "La comilla no es un carácter ASCII"
+    if not compatible_con_ascii(options.get('encoding', 'utf-8')):
+        return f"La codificación {options.get('encoding')} no es compatible con ASCII"
+    return None
+
+def _leer_cabecera(ruta_csv, options, comilla=b'"'):
+    """Lee el primer registro del fichero y devuelve (fila, offset en bytes donde termina)."""
+    limites = buscar_limites_de_registro(ruta_csv, 0, 1, comilla, max_bloques=1)
+    fin_cabecera = limites[1]
+    with open(ruta_csv, 'rb') as f:
+        datos = f.read(fin_cabecera)
+    texto = datos.decode(options.get('encoding', 'utf-8'), options.get('errores_codificacion', 'strict'))
+    lector = csv.reader(io.StringIO(texto, newline=''), **validators._formato_csv(options))
+    return next(lector, None), fin_cabecera
+
+def _validar_bloque(ruta_csv, inicio, fin, options, cabecera, unique_col_index, columnas_claves=()):
+    """
+    Valida un bloque del fichero en un proceso independiente.
+    Los números de fila son locales al bloque (empiezan en 1); el proceso principal los desplaza.
+    'columnas_claves' son pares (nombre, columnas) de las claves únicas: el bloque crea sus
+    propios índices vacíos y los devuelve para que el proceso principal los fusione.
+    También devuelve cuántos bytes no decodificables se sustituyeron (solo en modo 'auto').
+    """
+    with open(ruta_csv, 'rb') as f:
+        f.seek(inicio)
+        datos = f.read(fin - inicio)
+    with contar_errores_de_decodificacion() as errores_decodificacion:
+        texto = datos.decode(options.get('encoding', 'utf-8'), options.get('errores_codificacion', 'strict'))
+
+    resultados = crear_resultados_vacios(ruta_csv)
+    resultados['cabecera'] = cabecera
+    resultados['num_columnas_esperadas'] = len(cabecera)
+    seen_rows_and_lines, unique_column_values = validators._crear_indices(options)
+    claves_unicas = [ClaveUnica(nombre, columnas, IndiceClaves()) for nombre, columnas in columnas_claves]
+
+    contexto = ContextoReglas(options, resultados, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas)
+    validar_fila = PipelineReglas(contexto).validar_fila
+    num_filas = 0
+    for num_filas, fila in enumerate(csv.reader(io.StringIO(texto, newline=''), **validators._formato_csv(options)), start=1):
+        validar_fila(fila, num_filas)
+
+    return resultados, num_filas, seen_rows_and_lines, unique_column_values, errores_decodificacion['errores'], claves_unicas
+
+def _fusionar_bloque(resultados, parcial, desplazamiento, seen_rows_and_lines, unique_column_values, claves_unicas):
+    """Añade los resultados de un bloque a los globales, traduciendo sus números de fila."""
+    resultado_bloque, _, seen_bloque, unicos_bloque, _, claves_bloque = parcial
+    resultados['filas_invalidas'].extend(
+        (num + desplazamiento, num_cols, fila) for num, num_cols, fila in resultado_bloque['filas_invalidas'])
+    resultados['celdas_con_saltos'].extend(
+        (num + desplazamiento, col, campo) for num, col, campo in resultado_bloque['celdas_con_saltos'])
+    resultados['filas_vacias'].extend(num + desplazamiento for num in resultado_bloque['filas_vacias'])
+    resultados['errores_de_esquema'].extend(
+        (num + desplazamiento, columna, valor, motivo) for num, columna, valor, motivo in resultado_bloque['errores_de_esquema'])
+
+    seen_rows_and_lines.fusionar(seen_bloque, desplazamiento)
+    unique_column_values.fusionar(unicos_bloque, desplazamiento)
+    for clave, clave_bloque in zip(claves_unicas, claves_bloque):
+        clave.indice.fusionar(clave_bloque.indice, desplazamiento)
+
+def validar_archivo_por_bloques(ruta_csv, options, max_workers=None, tam_bloque_minimo=TAM_BLOQUE_MINIMO,
+                                progreso=None, cancelacion=None):
+    """
+    Valida un único fichero grande repartiendo bloques de registros entre procesos.
+    Devuelve los mismos 'resultados' que realizar_validacion_completa, con los números de fila globales.
+    Los límites se calculan por paridad de comillas, así que se asume que las comillas
+    solo se usan para delimitar campos (como en RFC 4180) y que la codificación es compatible con ASCII.
+    Con un carácter de escape en el dialecto la paridad de comillas no basta para encontrar
+    los límites, así que esos ficheros se validan de forma secuencial.
+    El progreso se notifica cada vez que termina un bloque.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    options = resolver_formato(ruta_csv, options)
+    encoding = options.get('encoding', 'utf-8')
+    formato = validators._formato_csv(options)
+
+    try:
+        tam_fichero = os.path.getsize(ruta_csv)
+    except OSError:
+        return realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+
+    if max_workers < 2 or tam_fichero < 2 * tam_bloque_minimo:
+        logger.info(f"El fichero {ruta_csv} es pequeño o solo hay un proceso disponible; se valida de forma secuencial.")
+        return realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+    motivo = motivo_sin_paridad_de_comillas(ruta_csv, options)
+    if motivo is not None:
+        logger.info(f"{motivo}; {ruta_csv} se valida de forma secuencial.")
+        return realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+    if options.get('parada'):
+        logger.info(f"Las políticas de parada necesitan leer {ruta_csv} en orden; se valida de forma secuencial.")
+        return realizar_validacion_completa(ruta_csv, options, progreso, cancelacion)
+    comilla = formato['quotechar'].encode(encoding)
+
+    logger.info(f"Iniciando validación por bloques para el fichero: {ruta_csv}")
+    resultados = crear_resultados_vacios(ruta_csv)
+    seen_rows_and_lines, unique_column_values = validators._crear_indices(options)
+    unique_col_index = -1
+    claves_unicas = []
+    bytes_sustituidos = 0
+
+    try:
+        primera_fila, fin_cabecera = _leer_cabecera(ruta_csv, options, comilla)
+        if primera_fila is None:
+            logger.warning(f"El fichero {ruta_csv} está vacío o no tiene contenido.")
+            return resultados
+
+        unique_col_index = validators._procesar_cabecera(primera_fila, resultados, options, seen_rows_and_lines)
+        claves_unicas = preparar_claves(primera_fila, options, IndiceClaves)
+
+        tam_objetivo = max(tam_bloque_minimo, (tam_fichero - fin_cabecera) // (max_workers * 4) + 1)
+        limites = buscar_limites_de_registro(ruta_csv, fin_cabecera, tam_objetivo, comilla)
+        bloques = list(zip(limites, limites[1:]))
+        logger.info(f"Fichero dividido en {len(bloques)} bloques para {max_workers} procesos.")
+
+        # Los procesos solo reciben las columnas de cada clave: los índices se fusionan aquí
+        columnas_claves = [(clave.nombre, clave.columnas) for clave in claves_unicas]
+        reportador = validators._crear_reportador(ruta_csv, progreso, cancelacion)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                parciales = executor.map(
+                    _validar_bloque,
+                    *zip(*[(ruta_csv, inicio, fin, options, primera_fila, unique_col_index, columnas_claves) for inicio, fin in bloques])
+                )
+                try:
+                    for (_, fin), parcial in zip(bloques, parciales):
+                        _fusionar_bloque(resultados, parcial, resultados['total_filas'], seen_rows_and_lines, unique_column_values, claves_unicas)
+                        resultados['total_filas'] += parcial[1]
+                        bytes_sustituidos += parcial[4]
+                        if reportador is not None:
+                            reportador.comprobar(resultados['total_filas'], fin)
+                except ValidacionCancelada:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+            if reportador is not None:
+                reportador.finalizar(resultados['total_filas'], tam_fichero)
+        except ValidacionCancelada:
+            # Como en el motor secuencial, los duplicados de los bloques ya fusionados se siguen consolidando
+            logger.warning(f"Validación por bloques de {ruta_csv} cancelada por el usuario.")
+            resultados['cancelado'] = True
+        validators._consolidar_indices(resultados, options, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas)
+
+    except FileNotFoundError:
+        logger.error(f"Error: Fichero no encontrado en la ruta {ruta_csv}")
+        resultados['error_lectura'] = f"Fichero no encontrado: {ruta_csv}"
+    except UnicodeDecodeError:
+        logger.error(f"UnicodeDecodeError para el fichero {ruta_csv} con la codificación {encoding}.")
+        validators._anotar_error_codificacion(resultados, ruta_csv, encoding)
+    except Exception:
+        logger.critical("Ha ocurrido una excepción no controlada durante la validación por bloques.", exc_info=True)
+        resultados['error_lectura'] = validators.MENSAJE_ERROR_CRITICO
+    validators._anotar_formato(resultados, ruta_csv, options, bytes_sustituidos)
+    validators._aplicar_limite_contenido(resultados, options)
+    logger.info("Validación por bloques finalizada. Devolviendo resultados.")
+    return resultados
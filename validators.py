@@ -1,154 +1,527 @@
 # validators.py
 
 import csv
+import os
 import re
 import logging
+from collections import namedtuple
+
+from compresion import abrir_destino, abrir_texto, posicion_en_origen
+from deteccion import contar_errores_de_decodificacion, localizar_error_codificacion, resolver_formato
+from claves import extractor_de_clave, preparar_claves
+from esquema import columnas_ausentes
+from indices import IndiceClaves, crear_indice
+from instrumentacion import Instrumentacion
+from parada import crear_comprobador_parada, normalizar_parada
+from reglas import ContextoReglas, PipelineReglas, REGLAS
+from progreso import ReportadorProgreso, ValidacionCancelada, MASCARA_FILAS
 
 logger = logging.getLogger(__name__)
 
-def leer_primeras_lineas(ruta_csv, num_lineas, encoding):
+MENSAJE_ERROR_CRITICO = "Ha ocurrido un error crítico. Revisa 'validator.log' para detalles."
+
+# Claves de 'resultados' que indican un problema en el fichero validado.
+CLAVES_DE_ERROR = [
+    'filas_invalidas', 'celdas_con_saltos', 'error_lectura', 'filas_vacias',
+    'filas_duplicadas', 'error_header', 'errores_de_unicidad', 'error_codificacion', 'errores_de_esquema',
+    'claves_repetidas'
+]
+
+# Tipos de hallazgo que emite iterar_hallazgos
+HALLAZGO_CABECERA = 'cabecera'
+HALLAZGO_COLUMNAS = 'columnas'
+HALLAZGO_VACIA = 'fila_vacia'
+HALLAZGO_SALTO = 'salto_de_linea'
+HALLAZGO_DUPLICADA = 'fila_duplicada'
+HALLAZGO_UNICIDAD = 'unicidad'
+HALLAZGO_LECTURA = 'error_lectura'
+HALLAZGO_CODIFICACION = 'error_codificacion'
+HALLAZGO_ESQUEMA = 'esquema'
+HALLAZGO_CLAVE = 'clave_repetida'
+
+# Un problema concreto detectado durante la validación.
+# 'contenido' puede ser None si se ha superado el límite de contenido guardado por categoría.
+Hallazgo = namedtuple('Hallazgo', ['tipo', 'linea', 'columna', 'valor', 'contenido', 'lineas'],
+                      defaults=(None, None, None, None, ()))
+
+def leer_primeras_lineas(ruta_csv, num_lineas, encoding, opciones_csv=None):
     """
     Lee las primeras N líneas de un archivo CSV para previsualización.
-    Devuelve la cabecera y una lista de filas.
+    Devuelve la cabecera, una lista de filas, la codificación y el dialecto usados.
+    Con encoding 'auto' se detecta la codificación y los bytes no válidos se sustituyen.
+    'opciones_csv' admite las mismas claves de dialecto que la validación ('delimitador',
+    'comilla', 'escape'...); con 'delimitador' a 'auto' el dialecto se detecta.
     """
     logger.info(f"Leyendo primeras {num_lineas} líneas de {ruta_csv} con codificación {encoding}")
     header = []
     preview_rows = []
     try:
-        with open(ruta_csv, 'r', newline='', encoding=encoding) as f:
-            lector = csv.reader(f)
+        opciones = resolver_formato(ruta_csv, dict(opciones_csv or {}, encoding=encoding))
+        with _abrir_csv(ruta_csv, opciones) as f:
+            lector = csv.reader(f, **_formato_csv(opciones))
             header = next(lector, [])
             for i, row in enumerate(lector):
                 if i >= num_lineas - 1:
                     break
                 preview_rows.append(row)
-        return {'exito': True, 'header': header, 'rows': preview_rows}
+        return {'exito': True, 'header': header, 'rows': preview_rows, 'encoding': opciones['encoding'],
+                'dialecto': describir_dialecto(opciones)}
     except Exception as e:
         logger.error(f"Error al previsualizar el archivo {ruta_csv}: {e}")
         return {'exito': False, 'error': str(e)}
 
-def realizar_validacion_completa(ruta_csv, options):
-    """
-    Lógica de validación pura que ahora incluye la comprobación de unicidad de columna.
-    """
-    logger.info(f"Iniciando validación para el fichero: {ruta_csv}")
-    
-    resultados = {
+def crear_resultados_vacios(ruta_csv):
+    """Devuelve la estructura de resultados de una validación todavía sin datos."""
+    return {
         'ruta_archivo': ruta_csv, 'total_filas': 0, 'num_columnas_esperadas': None,
         'cabecera': [], 'filas_invalidas': [], 'celdas_con_saltos': [], 
         'error_lectura': None, 'filas_vacias': [], 'filas_duplicadas': {}, 
-        'error_header': None, 'errores_de_unicidad': {}
+        'error_header': None, 'errores_de_unicidad': {}, 'error_codificacion': None,
+        'errores_de_esquema': [], 'claves_repetidas': [], 'cancelado': False,
+        'parada_anticipada': None
     }
-    seen_rows_and_lines = {}
+
+def realizar_validacion_completa(ruta_csv, options, progreso=None, cancelacion=None):
+    """
+    Lógica de validación pura que ahora incluye la comprobación de unicidad de columna.
+    Con options['engine'] = 'pandas' se usa el motor vectorizado de motor_vectorizado.py y con
+    'bytes' el análisis de bytes de escaneo_bytes.py (solo comprobaciones estructurales).
+    Con options['max_contenido_por_categoria'] = N, solo las N primeras filas inválidas y celdas
+    con saltos de línea guardan su contenido; el resto se registran con contenido None.
+    'progreso' es un callback que recibe periódicamente un diccionario con el avance
+    (ver progreso.ReportadorProgreso) y 'cancelacion' un progreso.TokenCancelacion; si se
+    cancela, se devuelven los resultados parciales con 'cancelado' a True.
+    Con options['instrumentar'] = True, el motor de Python añade 'instrumentacion' a los
+    resultados (tiempo por regla, lectura frente a comprobaciones, bytes leídos y tamaño
+    máximo de los índices) y lo escribe en el log.
+    Con options['encoding'] = 'auto' la codificación se detecta antes de leer (ver deteccion.py)
+    y los bytes no decodificables no interrumpen la validación: se sustituyen y se informa del
+    primero en 'error_codificacion' (offset en bytes y línea). Con una codificación explícita,
+    un byte no válido detiene la lectura, pero 'error_codificacion' también indica dónde está.
+    El dialecto se toma de options['delimitador'], 'comilla', 'escape', 'doble_comilla' y
+    'terminador_linea' (por defecto, el de Excel: coma y comilla doble). Con 'delimitador' a
+    'auto' se detecta sobre el inicio del fichero y se añade 'dialecto_detectado' a los resultados.
+    Los ficheros comprimidos (gzip, bzip2, xz o zip) se validan descomprimiéndolos sobre la marcha;
+    el progreso se mide entonces en bytes comprimidos.
+    Con options['esquema'] (ver esquema.py) se comprueban además el tipo y las restricciones de
+    cada columna, y los fallos se añaden a 'errores_de_esquema' como (línea, columna, valor, motivo).
+    Con options['claves_unicas'] (lista de claves, cada una una lista de columnas) se comprueba
+    que no se repita ninguna de ellas, con un índice compacto (ver claves.py e
+    indices.IndiceClaves). Cada clave repetida se añade a 'claves_repetidas' como
+    (nombre de la clave, valores, líneas).
+    Con options['parada'] (ver parada.normalizar_parada) la lectura se detiene en cuanto se
+    cumple alguna de las políticas indicadas (primer error, N errores en total o por categoría,
+    cabecera incorrecta o tasa de errores) y 'parada_anticipada' indica la regla, el motivo, la
+    línea y los bytes leídos. Los resultados son entonces los de las filas leídas hasta ahí.
+    Solo el motor de Python aplica estas políticas, así que con ellas se usa siempre. Lanza
+    ValueError si options['parada'] no es válido.
+    """
+    options = resolver_formato(ruta_csv, options)
+    motor = options.get('engine', 'python')
+    if normalizar_parada(options.get('parada')) is not None and motor != 'python':
+        logger.info(f"Las políticas de parada solo las aplica el motor de Python; {ruta_csv} se valida con él.")
+        motor = 'python'
+    if motor == 'pandas':
+        from motor_vectorizado import validar_vectorizado
+        return validar_vectorizado(ruta_csv, options, progreso, cancelacion)
+    if motor == 'bytes':
+        from escaneo_bytes import validar_por_bytes
+        return validar_por_bytes(ruta_csv, options, progreso, cancelacion)
+    return _validar_secuencial(ruta_csv, options, progreso, cancelacion)
+
+def _validar_secuencial(ruta_csv, options, progreso=None, cancelacion=None, al_conservar_fila=None):
+    """
+    Recorrido fila a fila del motor de Python. Si se indica 'al_conservar_fila', se llama con
+    cada fila que un CSV limpio conservaría (ni inválida, ni vacía, ni duplicado posterior);
+    como esa decisión no se puede corregir después, el índice de duplicados es entonces exacto.
+    """
+    logger.info(f"Iniciando validación para el fichero: {ruta_csv}")
     
-    unique_column_values = {}
+    resultados = crear_resultados_vacios(ruta_csv)
+    seen_rows_and_lines, unique_column_values = _crear_indices(options, duplicados_exactos=al_conservar_fila is not None)
     unique_col_index = -1
+    claves_unicas = []
+    instrumentacion = Instrumentacion() if options.get('instrumentar') else None
+    errores_decodificacion = {'errores': 0}
 
     encoding = options.get('encoding', 'utf-8')
     logger.info(f"Intentando leer el fichero con la codificación: {encoding}")
 
     try:
-        with open(ruta_csv, 'r', newline='', encoding=encoding) as f:
-            lector = csv.reader(f)
+        reportador = _crear_reportador(ruta_csv, progreso, cancelacion)
+        with contar_errores_de_decodificacion() as errores_decodificacion, _abrir_csv(ruta_csv, options) as f:
+            lector = csv.reader(f, **_formato_csv(options))
             
             try:
                 primera_fila = next(lector)
-                resultados['total_filas'] = 1
-                resultados['cabecera'] = primera_fila
-                
-                header_to_validate = primera_fila
-                expected_headers = options.get('expected_headers', [])
-                if options.get('check_header') and expected_headers:
-                    if options.get('ignore_case'):
-                        header_to_validate = [h.lower().strip() for h in header_to_validate]
-                        expected_headers = [h.lower().strip() for h in expected_headers]
-                    
-                    if header_to_validate != expected_headers:
-                        resultados['error_header'] = f"La cabecera no coincide.\nSe esperaba: {options['expected_headers']}\nSe encontró: {primera_fila}"
-                
-                if options.get('check_uniqueness') and options.get('unique_column_name'):
-                    try:
-                        unique_col_index = primera_fila.index(options['unique_column_name'])
-                        logger.info(f"Se comprobará la unicidad de la columna '{options['unique_column_name']}' en el índice {unique_col_index}.")
-                    except ValueError:
-                        logger.warning(f"La columna de unicidad '{options['unique_column_name']}' no se encontró en la cabecera.")
-                
-                resultados['num_columnas_esperadas'] = len(primera_fila)
-                _validar_fila_interna(primera_fila, 1, resultados, options, seen_rows_and_lines, unique_col_index, unique_column_values)
-
             except StopIteration:
                 logger.warning(f"El fichero {ruta_csv} está vacío o no tiene contenido.")
                 return resultados
 
-            for i, fila in enumerate(lector, start=2):
+            unique_col_index = _procesar_cabecera(primera_fila, resultados, options, seen_rows_and_lines)
+            claves_unicas = preparar_claves(primera_fila, options, IndiceClaves)
+            if al_conservar_fila is not None and not resultados['filas_vacias']:
+                al_conservar_fila(primera_fila)
+            if instrumentacion is not None:
+                lector = instrumentacion.medir_lectura(lector)
+            contexto = ContextoReglas(options, resultados, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas)
+            validar_fila = PipelineReglas(contexto, instrumentacion).validar_fila
+            comprobar_parada = crear_comprobador_parada(options, resultados)
+            parada = comprobar_parada(1) if comprobar_parada is not None else None
+
+            for i, fila in enumerate(lector if parada is None else (), start=2):
                 resultados['total_filas'] += 1
-                _validar_fila_interna(fila, i, resultados, options, seen_rows_and_lines, unique_col_index, unique_column_values)
+                conservar = validar_fila(fila, i)
+                if conservar and al_conservar_fila is not None:
+                    al_conservar_fila(fila)
+                if comprobar_parada is not None:
+                    parada = comprobar_parada(i)
+                    if parada is not None:
+                        break
+                if not i & MASCARA_FILAS:
+                    if reportador is not None:
+                        reportador.comprobar(i, posicion_en_origen(f))
+                    if instrumentacion is not None:
+                        instrumentacion.muestrear_indices(seen_rows_and_lines, unique_column_values)
+                        instrumentacion.bytes_leidos = posicion_en_origen(f)
+
+            if reportador is not None:
+                reportador.finalizar(resultados['total_filas'], posicion_en_origen(f))
+            if instrumentacion is not None:
+                instrumentacion.bytes_leidos = posicion_en_origen(f)
+            if parada is not None:
+                _anotar_parada(resultados, parada, ruta_csv, posicion_en_origen(f))
 
+    except ValidacionCancelada:
+        logger.warning(f"Validación de {ruta_csv} cancelada por el usuario en la fila {resultados['total_filas']}.")
+        resultados['cancelado'] = True
     except FileNotFoundError:
         logger.error(f"Error: Fichero no encontrado en la ruta {ruta_csv}")
         resultados['error_lectura'] = f"Fichero no encontrado: {ruta_csv}"
     except UnicodeDecodeError:
-        error_msg = f"Error de codificación. No se pudo leer el archivo con el formato '{encoding}'.\n\nPrueba a seleccionar otra codificación como 'latin-1' o 'cp1252'."
         logger.error(f"UnicodeDecodeError para el fichero {ruta_csv} con la codificación {encoding}.")
-        resultados['error_lectura'] = error_msg
+        _anotar_error_codificacion(resultados, ruta_csv, encoding)
     except Exception:
         logger.critical("Ha ocurrido una excepción no controlada durante la validación del CSV.", exc_info=True)
-        resultados['error_lectura'] = "Ha ocurrido un error crítico. Revisa 'validator.log' para detalles."
+        resultados['error_lectura'] = MENSAJE_ERROR_CRITICO
+    _anotar_formato(resultados, ruta_csv, options, errores_decodificacion['errores'])
     
-    if options.get('check_duplicadas'):
-        for row, lines in seen_rows_and_lines.items():
-            if len(lines) > 1:
-                resultados['filas_duplicadas'][row] = sorted(lines)
-    
-    if unique_col_index != -1:
-        for value, lines in unique_column_values.items():
-            if len(lines) > 1:
-                resultados['errores_de_unicidad'][value] = sorted(lines)
+    if instrumentacion is None:
+        _consolidar_indices(resultados, options, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas)
+    else:
+        instrumentacion.muestrear_indices(seen_rows_and_lines, unique_column_values)
+        with instrumentacion.medir_fase('consolidacion_indices'):
+            _consolidar_indices(resultados, options, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas)
+        resultados['instrumentacion'] = instrumentacion.resumen()
+        instrumentacion.registrar_en_log(logger, ruta_csv, resultados['instrumentacion'])
             
     logger.info("Validación finalizada. Devolviendo resultados.")
     return resultados
 
-def _validar_fila_interna(fila, num_fila, resultados, options, seen_rows_and_lines, unique_col_index, unique_column_values):
-    """Valida una única fila aplicando las reglas activas."""
-    
-    if len(fila) != resultados['num_columnas_esperadas']:
-        resultados['filas_invalidas'].append((num_fila, len(fila), fila))
+def iterar_hallazgos(ruta_csv, options, max_contenido_por_categoria=None):
+    """
+    Versión incremental de realizar_validacion_completa: es un generador que emite cada
+    Hallazgo en cuanto se detecta (cabecera, nº de columnas, filas vacías, saltos de línea y esquema),
+    y los duplicados, errores de unicidad y claves repetidas al terminar la lectura.
+    Con 'max_contenido_por_categoria', a partir de ese número de hallazgos de un mismo tipo
+    ya no se incluye el contenido de la fila o celda, solo su posición.
+    """
+    logger.info(f"Iniciando validación incremental para el fichero: {ruta_csv}")
+    options = resolver_formato(ruta_csv, options)
+    # Las listas de 'parcial' se vacían tras cada fila, así que nunca acumulan más de una fila de hallazgos.
+    parcial = crear_resultados_vacios(ruta_csv)
+    opciones_fila = {k: v for k, v in options.items() if k != 'max_contenido_por_categoria'}
+    seen_rows_and_lines, unique_column_values = _crear_indices(options)
+    unique_col_index = -1
+    claves_unicas = []
+    contadores = {HALLAZGO_COLUMNAS: 0, HALLAZGO_SALTO: 0, HALLAZGO_ESQUEMA: 0}
+    encoding = options.get('encoding', 'utf-8')
+    errores_decodificacion = {'errores': 0}
+
+    try:
+        with contar_errores_de_decodificacion() as errores_decodificacion, _abrir_csv(ruta_csv, options) as f:
+            lector = csv.reader(f, **_formato_csv(options))
+            primera_fila = next(lector, None)
+            if primera_fila is None:
+                logger.warning(f"El fichero {ruta_csv} está vacío o no tiene contenido.")
+                return
+
+            unique_col_index = _procesar_cabecera(primera_fila, parcial, opciones_fila, seen_rows_and_lines)
+            claves_unicas = preparar_claves(primera_fila, options, IndiceClaves)
+            if parcial['error_header']:
+                yield Hallazgo(HALLAZGO_CABECERA, 1, valor=parcial['error_header'], contenido=primera_fila)
+            yield from _vaciar_hallazgos(parcial, contadores, max_contenido_por_categoria)
+
+            contexto = ContextoReglas(opciones_fila, parcial, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas)
+            validar_fila = PipelineReglas(contexto).validar_fila
+            for i, fila in enumerate(lector, start=2):
+                validar_fila(fila, i)
+                if parcial['filas_invalidas'] or parcial['filas_vacias'] or parcial['celdas_con_saltos'] or parcial['errores_de_esquema']:
+                    yield from _vaciar_hallazgos(parcial, contadores, max_contenido_por_categoria)
+
+    except FileNotFoundError:
+        logger.error(f"Error: Fichero no encontrado en la ruta {ruta_csv}")
+        yield Hallazgo(HALLAZGO_LECTURA, valor=f"Fichero no encontrado: {ruta_csv}")
+    except UnicodeDecodeError:
+        logger.error(f"UnicodeDecodeError para el fichero {ruta_csv} con la codificación {encoding}.")
+        ubicacion = localizar_error_codificacion(ruta_csv, encoding)
+        yield Hallazgo(HALLAZGO_LECTURA, valor=_mensaje_error_codificacion(encoding, ubicacion))
+    except Exception:
+        logger.critical("Ha ocurrido una excepción no controlada durante la validación incremental.", exc_info=True)
+        yield Hallazgo(HALLAZGO_LECTURA, valor=MENSAJE_ERROR_CRITICO)
+
+    if errores_decodificacion['errores']:
+        ubicacion = localizar_error_codificacion(ruta_csv, encoding)
+        if ubicacion:
+            yield Hallazgo(HALLAZGO_CODIFICACION, ubicacion['linea'], valor=ubicacion['byte'], contenido=ubicacion['bytes'])
+
+    _consolidar_indices(parcial, options, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas)
+    for fila, lineas in parcial['filas_duplicadas'].items():
+        yield Hallazgo(HALLAZGO_DUPLICADA, lineas[0], contenido=fila, lineas=tuple(lineas))
+    for valor, lineas in parcial['errores_de_unicidad'].items():
+        yield Hallazgo(HALLAZGO_UNICIDAD, lineas[0], columna=unique_col_index + 1, valor=valor, lineas=tuple(lineas))
+    for nombre, valores, lineas in parcial['claves_repetidas']:
+        yield Hallazgo(HALLAZGO_CLAVE, lineas[0], columna=nombre, contenido=valores, lineas=tuple(lineas))
+    logger.info("Validación incremental finalizada.")
+
+def _vaciar_hallazgos(parcial, contadores, limite):
+    """Convierte en Hallazgos lo acumulado en 'parcial' por la última fila y vacía sus listas."""
+    for num_fila, num_cols, fila in parcial['filas_invalidas']:
+        contadores[HALLAZGO_COLUMNAS] += 1
+        contenido = fila if limite is None or contadores[HALLAZGO_COLUMNAS] <= limite else None
+        yield Hallazgo(HALLAZGO_COLUMNAS, num_fila, valor=num_cols, contenido=contenido)
+    for num_fila in parcial['filas_vacias']:
+        yield Hallazgo(HALLAZGO_VACIA, num_fila)
+    for num_fila, num_col, campo in parcial['celdas_con_saltos']:
+        contadores[HALLAZGO_SALTO] += 1
+        contenido = campo if limite is None or contadores[HALLAZGO_SALTO] <= limite else None
+        yield Hallazgo(HALLAZGO_SALTO, num_fila, columna=num_col, contenido=contenido)
+    for num_fila, columna, valor_celda, motivo in parcial['errores_de_esquema']:
+        contadores[HALLAZGO_ESQUEMA] += 1
+        contenido = valor_celda if limite is None or contadores[HALLAZGO_ESQUEMA] <= limite else None
+        yield Hallazgo(HALLAZGO_ESQUEMA, num_fila, columna=columna, valor=motivo, contenido=contenido)
+    parcial['filas_invalidas'].clear()
+    parcial['filas_vacias'].clear()
+    parcial['celdas_con_saltos'].clear()
+    parcial['errores_de_esquema'].clear()
+
+def _anotar_parada(resultados, parada, ruta_csv, bytes_leidos):
+    """Guarda en 'resultados' por qué y dónde se detuvo la lectura por una política de parada."""
+    bytes_totales = os.path.getsize(ruta_csv)
+    resultados['parada_anticipada'] = dict(parada, bytes_leidos=bytes_leidos, bytes_totales=bytes_totales,
+                                           fraccion_leida=bytes_leidos / bytes_totales if bytes_totales else 1.0)
+    logger.info(f"Validación de {ruta_csv} detenida en la línea {parada['linea']} ({bytes_leidos:,} de "
+                f"{bytes_totales:,} bytes): {parada['motivo']}.")
+
+def _aplicar_limite_contenido(resultados, options):
+    """Elimina el contenido de los hallazgos que superan 'max_contenido_por_categoria' (tras fusionar bloques)."""
+    limite = options.get('max_contenido_por_categoria')
+    if limite is None:
         return
+    for clave in ('filas_invalidas', 'celdas_con_saltos', 'errores_de_esquema'):
+        lista = resultados[clave]
+        for i in range(limite, len(lista)):
+            if lista[i][2] is not None:
+                lista[i] = (lista[i][0], lista[i][1], None, *lista[i][3:])
+
+def _crear_reportador(ruta_csv, progreso, cancelacion):
+    """Crea el ReportadorProgreso de una lectura, o None si no se ha pedido progreso ni cancelación."""
+    if progreso is None and cancelacion is None:
+        return None
+    return ReportadorProgreso(progreso, cancelacion, os.path.getsize(ruta_csv))
+
+def _mensaje_error_codificacion(encoding, ubicacion=None):
+    mensaje = f"Error de codificación. No se pudo leer el archivo con el formato '{encoding}'."
+    if ubicacion:
+        mensaje += f"\nEl primer byte no válido ({ubicacion['bytes']}) está en la posición {ubicacion['byte']:,} (línea {ubicacion['linea']:,})."
+    return mensaje + "\n\nPrueba a seleccionar otra codificación como 'latin-1' o 'cp1252', o 'auto' para detectarla."
+
+def _anotar_error_codificacion(resultados, ruta_csv, encoding):
+    """Tras un UnicodeDecodeError, localiza el primer byte no válido y prepara el mensaje de error."""
+    try:
+        resultados['error_codificacion'] = localizar_error_codificacion(ruta_csv, encoding)
+    except OSError:
+        pass
+    resultados['error_lectura'] = _mensaje_error_codificacion(encoding, resultados['error_codificacion'])
 
-    if options.get('check_vacias') and not any(field.strip() for field in fila):
-        resultados['filas_vacias'].append(num_fila)
+def _anotar_formato(resultados, ruta_csv, options, bytes_sustituidos):
+    """
+    Añade a los resultados la codificación y el dialecto detectados en modo 'auto' y, si hubo
+    que sustituir bytes no decodificables, la posición del primero.
+    """
+    for clave in ('encoding_detectado', 'dialecto_detectado'):
+        if options.get(clave):
+            resultados[clave] = options[clave]
+    if not bytes_sustituidos:
         return
-    
-    for j, campo in enumerate(fila, start=1):
-        if '\n' in campo or '\r' in campo:
-            resultados['celdas_con_saltos'].append((num_fila, j, campo))
-    
-    if num_fila > 1 and unique_col_index != -1 and unique_col_index < len(fila):
-        valor_celda = fila[unique_col_index].strip()
+    ubicacion = localizar_error_codificacion(ruta_csv, options['encoding'])
+    if ubicacion:
+        ubicacion['bytes_sustituidos'] = bytes_sustituidos
+        resultados['error_codificacion'] = ubicacion
+        logger.warning(f"{ruta_csv} tiene {bytes_sustituidos} secuencias no válidas en {options['encoding']}; "
+                       f"la primera en el byte {ubicacion['byte']} (línea {ubicacion['linea']}).")
+
+def _abrir_csv(ruta_csv, options):
+    """
+    Abre el CSV en modo texto con la codificación y el tratamiento de errores de las opciones.
+    Los ficheros gzip, bzip2, xz y zip se descomprimen sobre la marcha (ver compresion.py).
+    """
+    return abrir_texto(ruta_csv, options.get('encoding', 'utf-8'), options.get('errores_codificacion', 'strict'))
+
+def _formato_csv(options):
+    """Argumentos de csv.reader y csv.writer para el dialecto de las opciones (por defecto, el de Excel)."""
+    return {
+        'delimiter': options.get('delimitador') or ',',
+        'quotechar': options.get('comilla') or '"',
+        'escapechar': options.get('escape') or None,
+        'doublequote': options.get('doble_comilla', True),
+    }
+
+def _crear_escritor(f_out, options):
+    """csv.writer con el mismo dialecto que el fichero de origen, para que el CSV limpio lo conserve."""
+    return csv.writer(f_out, lineterminator=options.get('terminador_linea') or '\r\n', **_formato_csv(options))
+
+def describir_dialecto(options):
+    """Devuelve el dialecto efectivo de unas opciones ya resueltas como diccionario."""
+    formato = _formato_csv(options)
+    return {
+        'delimitador': formato['delimiter'],
+        'comilla': formato['quotechar'],
+        'escape': formato['escapechar'],
+        'terminador_linea': options.get('terminador_linea') or '\r\n',
+    }
+
+def _abrir_destino(ruta_destino, options):
+    """
+    Abre el CSV limpio para escritura, comprimido si la extensión de 'ruta_destino' lo indica
+    (.gz, .bz2, .xz o .zip). En modo 'auto' sustituye lo que no exista en la codificación.
+    """
+    return abrir_destino(ruta_destino, options.get('encoding', 'utf-8'),
+                         'replace' if options.get('errores_codificacion') else 'strict')
+
+def validar_cabecera(primera_fila, options):
+    """Compara la cabecera con options['expected_headers'] y devuelve el mensaje de error, o None si coincide."""
+    header_to_validate = primera_fila
+    expected_headers = options.get('expected_headers', [])
+    if options.get('check_header') and expected_headers:
         if options.get('ignore_case'):
-            valor_celda = valor_celda.lower()
+            header_to_validate = [h.lower().strip() for h in header_to_validate]
+            expected_headers = [h.lower().strip() for h in expected_headers]
         
-        if valor_celda:
-            if valor_celda not in unique_column_values:
-                unique_column_values[valor_celda] = []
-            unique_column_values[valor_celda].append(num_fila)
+        if header_to_validate != expected_headers:
+            return f"La cabecera no coincide.\nSe esperaba: {options['expected_headers']}\nSe encontró: {primera_fila}"
+    return None
+
+def _procesar_cabecera(primera_fila, resultados, options, seen_rows_and_lines):
+    """
+    Registra y valida la cabecera (línea 1).
+    Devuelve el índice de la columna de unicidad o -1 si no se comprueba.
+    """
+    resultados['total_filas'] = 1
+    resultados['cabecera'] = primera_fila
+    resultados['error_header'] = validar_cabecera(primera_fila, options)
+    
+    unique_col_index = -1
+    if options.get('check_uniqueness') and options.get('unique_column_name'):
+        try:
+            unique_col_index = primera_fila.index(options['unique_column_name'])
+            logger.info(f"Se comprobará la unicidad de la columna '{options['unique_column_name']}' en el índice {unique_col_index}.")
+        except ValueError:
+            logger.warning(f"La columna de unicidad '{options['unique_column_name']}' no se encontró en la cabecera.")
+    
+    resultados['num_columnas_esperadas'] = len(primera_fila)
+    if options.get('esquema'):
+        resultados['errores_de_esquema'].extend(columnas_ausentes(options['esquema'], primera_fila))
+    # La cabecera nunca participa en la comprobación de unicidad ni en las reglas marcadas como solo de datos.
+    reglas_cabecera = {nombre: regla for nombre, regla in REGLAS.items() if regla.en_cabecera}
+    PipelineReglas(ContextoReglas(options, resultados, seen_rows_and_lines), reglas=reglas_cabecera).validar_fila(primera_fila, 1)
+    return unique_col_index
 
+def _crear_indices(options, duplicados_exactos=False):
+    """
+    Crea los índices de duplicados y de unicidad según las opciones.
+    Con 'duplicados_exactos' el de duplicados es siempre IndiceExacto en memoria: es el único que
+    sabe en el momento, sin confirmación posterior, si una fila ya había aparecido.
+    """
+    memoria_max_mb = options.get('memoria_max_mb')
+    directorio = options.get('directorio_temporal')
+    if duplicados_exactos:
+        indice_duplicados = crear_indice('exacto')
+    else:
+        indice_duplicados = crear_indice(options.get('indice_duplicados'), memoria_max_mb, directorio)
+    return indice_duplicados, crear_indice('exacto', memoria_max_mb, directorio)
+
+def _normalizar_fila(fila, ignore_case):
+    """Normaliza una fila para compararla con otras: sin espacios y, si se pide, en minúsculas."""
+    if ignore_case:
+        return tuple(map(str.lower, map(str.strip, fila)))
+    return tuple(map(str.strip, fila))
+
+def _consolidar_indices(resultados, options, seen_rows_and_lines, unique_col_index, unique_column_values, claves_unicas=()):
+    """Traslada a 'resultados' las filas, valores y claves que aparecen más de una vez."""
     if options.get('check_duplicadas'):
-        normalized_fila = [field.strip() for field in fila]
-        if options.get('ignore_case'):
-            normalized_fila = [field.lower() for field in normalized_fila]
-        
-        row_tuple = tuple(normalized_fila)
-        
-        if row_tuple not in seen_rows_and_lines:
-            seen_rows_and_lines[row_tuple] = []
-        seen_rows_and_lines[row_tuple].append(num_fila)
+        repetidos = seen_rows_and_lines.repetidos()
+        if seen_rows_and_lines.requiere_confirmacion:
+            repetidos = _confirmar_candidatos(resultados['ruta_archivo'], options, dict(repetidos))
+        for row, lines in repetidos:
+            resultados['filas_duplicadas'][row] = lines
+    
+    if unique_col_index != -1:
+        for value, lines in unique_column_values.repetidos():
+            resultados['errores_de_unicidad'][value] = lines
+    _consolidar_claves(resultados, options, claves_unicas)
 
-def crear_csv_limpio(ruta_original, ruta_destino, resultados_validacion, options):
+def _consolidar_claves(resultados, options, claves_unicas):
+    """Traslada a 'resultados' las claves únicas repetidas, confirmando las de los índices por resumen."""
+    for clave in claves_unicas:
+        repetidas = list(clave.indice.repetidos())
+        if clave.indice.requiere_confirmacion:
+            clave_de_fila = extractor_de_clave(clave.columnas, options.get('ignore_case'))
+            repetidas += _confirmar_candidatos(resultados['ruta_archivo'], options, clave.indice.candidatos(), clave_de_fila)
+        for valores, lineas in sorted(repetidas, key=lambda repetida: repetida[1][0]):
+            resultados['claves_repetidas'].append((clave.nombre, valores, lineas))
+
+def _confirmar_candidatos(ruta_csv, options, candidatos, clave_de_fila=None):
+    """
+    Segunda pasada de los índices por resumen: relee solo las líneas de los grupos candidatos
+    y las agrupa por su clave real, descartando colisiones de resumen.
+    Por defecto la clave es la fila normalizada; 'clave_de_fila' permite usar otra (p. ej. una celda).
+    Devuelve (clave, líneas) de los repetidos confirmados.
+    """
+    if not candidatos:
+        return []
+    logger.info(f"Confirmando {len(candidatos)} grupos candidatos a repetidos en {ruta_csv}.")
+
+    lineas_candidatas = set()
+    for lineas in candidatos.values():
+        lineas_candidatas.update(int(num) for num in lineas)
+    ultima_linea = max(lineas_candidatas)
+    if clave_de_fila is None:
+        ignore_case = options.get('ignore_case')
+        clave_de_fila = lambda fila: _normalizar_fila(fila, ignore_case)
+
+    grupos = {}
+    try:
+        with _abrir_csv(ruta_csv, options) as f:
+            for i, fila in enumerate(csv.reader(f, **_formato_csv(options)), start=1):
+                if i in lineas_candidatas:
+                    grupos.setdefault(clave_de_fila(fila), []).append(i)
+                if i >= ultima_linea:
+                    break
+    except UnicodeDecodeError:
+        logger.warning(f"La confirmación de repetidos de {ruta_csv} se detuvo por un error de codificación.")
+
+    return [(clave, lineas) for clave, lineas in grupos.items() if len(lineas) > 1]
+
+def crear_csv_limpio(ruta_original, ruta_destino, resultados_validacion, options, progreso=None, cancelacion=None):
     """
     Crea un nuevo archivo CSV limpio.
+    Acepta los mismos 'progreso' y 'cancelacion' que realizar_validacion_completa;
+    si se cancela, se borra el fichero a medio escribir. El original puede estar comprimido,
+    y si 'ruta_destino' termina en .gz, .bz2, .xz o .zip el CSV limpio se escribe comprimido.
     """
     logger.info(f"Iniciando proceso de limpieza. Origen: {ruta_original}, Destino: {ruta_destino}")
+    options = resolver_formato(ruta_original, options)
     
     lineas_a_omitir = set()
     
@@ -166,21 +539,27 @@ def crear_csv_limpio(ruta_original, ruta_destino, resultados_validacion, options
             lineas_a_omitir.update(lines[1:])
             duplicados_eliminados += len(lines) - 1
             
-    encoding = options.get('encoding', 'utf-8')
     filas_escritas = 0
     
     try:
-        with open(ruta_original, 'r', newline='', encoding=encoding) as f_in, \
-             open(ruta_destino, 'w', newline='', encoding=encoding) as f_out:
+        reportador = _crear_reportador(ruta_original, progreso, cancelacion)
+        with _abrir_csv(ruta_original, options) as f_in, \
+             _abrir_destino(ruta_destino, options) as f_out:
             
-            lector = csv.reader(f_in)
-            escritor = csv.writer(f_out)
+            lector = csv.reader(f_in, **_formato_csv(options))
+            escritor = _crear_escritor(f_out, options)
             
+            i = 0
             for i, fila in enumerate(lector, start=1):
                 if i not in lineas_a_omitir:
                     fila_limpia = [celda.strip() for celda in fila]
                     escritor.writerow(fila_limpia)
                     filas_escritas += 1
+                if not i & MASCARA_FILAS and reportador is not None:
+                    reportador.comprobar(i, posicion_en_origen(f_in))
+
+            if reportador is not None:
+                reportador.finalizar(i, posicion_en_origen(f_in))
         
         resumen_limpieza = {
             'exito': True,
@@ -192,6 +571,96 @@ def crear_csv_limpio(ruta_original, ruta_destino, resultados_validacion, options
         logger.info(f"Proceso de limpieza finalizado con éxito: {resumen_limpieza}")
         return resumen_limpieza
 
+    except ValidacionCancelada:
+        logger.warning("Limpieza cancelada por el usuario; se elimina el fichero incompleto.")
+        if os.path.exists(ruta_destino):
+            os.remove(ruta_destino)
+        return {'exito': False, 'cancelado': True, 'error': "Limpieza cancelada por el usuario."}
     except Exception as e:
         logger.error("Error durante el proceso de creación del CSV limpio.", exc_info=True)
-        return {'exito': False, 'error': str(e)}
\ No newline at end of file
+        return {'exito': False, 'error': str(e)}
+
+def validar_y_limpiar(ruta_csv, ruta_destino, options, progreso=None, cancelacion=None):
+    """
+    Valida el fichero y escribe el CSV limpio en la misma lectura, sin releer el original.
+    Descarta sobre la marcha las filas con nº de columnas incorrecto, las vacías y las
+    apariciones posteriores de filas duplicadas, y recorta los espacios de todas las celdas,
+    igual que crear_csv_limpio. Devuelve (resultados, resumen_limpieza).
+    Como hay que saber en cada fila si ya se vio antes y la fila ya no se puede recuperar una
+    vez descartada, el índice de duplicados es siempre exacto y en memoria: 'indice_duplicados'
+    y 'memoria_max_mb' no se le aplican (este último sí al índice de unicidad).
+    La única relectura que queda es la de las claves únicas (options['claves_unicas']), cuyos
+    grupos candidatos se confirman leyendo solo esas líneas del original; no afecta al CSV limpio.
+    """
+    logger.info(f"Iniciando validación y limpieza en una pasada. Origen: {ruta_csv}, Destino: {ruta_destino}")
+    if options.get('check_duplicadas') and (options.get('memoria_max_mb') or options.get('indice_duplicados') == 'hash'):
+        logger.info("La limpieza en una pasada usa el índice de duplicados exacto en memoria; 'memoria_max_mb' e "
+                    "'indice_duplicados' no se aplican a los duplicados.")
+    options = resolver_formato(ruta_csv, options)
+
+    filas_escritas = 0
+    try:
+        with _abrir_destino(ruta_destino, options) as f_out:
+            escritor = _crear_escritor(f_out, options)
+
+            def escribir_fila(fila):
+                nonlocal filas_escritas
+                escritor.writerow([celda.strip() for celda in fila])
+                filas_escritas += 1
+
+            resultados = _validar_secuencial(ruta_csv, options, progreso, cancelacion, al_conservar_fila=escribir_fila)
+    except Exception as e:
+        logger.error("Error durante la validación y limpieza en una pasada.", exc_info=True)
+        resultados = crear_resultados_vacios(ruta_csv)
+        resultados['error_lectura'] = MENSAJE_ERROR_CRITICO
+        return resultados, {'exito': False, 'error': str(e)}
+
+    if resultados.get('cancelado') or resultados.get('error_lectura'):
+        if os.path.exists(ruta_destino):
+            os.remove(ruta_destino)
+        if resultados.get('cancelado'):
+            return resultados, {'exito': False, 'cancelado': True, 'error': "Limpieza cancelada por el usuario."}
+        return resultados, {'exito': False, 'error': resultados['error_lectura']}
+
+    resumen_limpieza = {
+        'exito': True,
+        'vacias_eliminadas': len(resultados['filas_vacias']),
+        'duplicados_eliminados': sum(len(lineas) - 1 for lineas in resultados['filas_duplicadas'].values()),
+        'formato_incorrecto_eliminadas': len(resultados['filas_invalidas']),
+        'filas_escritas': filas_escritas
+    }
+    logger.info(f"Validación y limpieza en una pasada finalizada: {resumen_limpieza}")
+    return resultados, resumen_limpieza
+
+def tiene_errores(resultados):
+    """Indica si unos resultados de validación contienen algún error."""
+    return any(resultados.get(clave) for clave in CLAVES_DE_ERROR)
+
+def validar_archivos(rutas_csv, options):
+    """
+    Valida varios ficheros CSV uno tras otro con las mismas opciones.
+    Es un generador: devuelve los resultados de cada fichero en cuanto terminan.
+    """
+    for ruta_csv in rutas_csv:
+        yield realizar_validacion_completa(ruta_csv, options)
+
+def hallazgo_a_dict(hallazgo):
+    """Convierte un Hallazgo en un diccionario serializable en JSON."""
+    datos = hallazgo._asdict()
+    if isinstance(datos['contenido'], tuple):
+        datos['contenido'] = list(datos['contenido'])
+    datos['lineas'] = list(datos['lineas'])
+    return datos
+
+def serializar_resultados(resultados):
+    """
+    Convierte unos resultados de validación a una estructura serializable en JSON.
+    Las claves de 'filas_duplicadas' son tuplas, así que se transforman en una lista de grupos.
+    """
+    serializable = dict(resultados)
+    serializable['filas_duplicadas'] = [
+        {'contenido': list(fila), 'lineas': lineas}
+        for fila, lineas in resultados.get('filas_duplicadas', {}).items()
+    ]
+    serializable['tiene_errores'] = tiene_errores(resultados)
+    return serializable
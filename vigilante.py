@@ -0,0 +1,270 @@
+# vigilante.py
+
+import json
+import logging
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from validators import realizar_validacion_completa, validar_y_limpiar, serializar_resultados, crear_resultados_vacios, MENSAJE_ERROR_CRITICO
+from compresion import EXTENSIONES, nombre_limpio
+
+logger = logging.getLogger(__name__)
+
+# Fichero de resultados que se escribe junto a cada CSV validado
+SUFIJO_RESULTADO = '.validacion.json'
+EXTENSIONES_CSV = ('.csv', '.tsv', '.txt')
+# Segundos sin cambios de tamaño ni de fecha para dar un fichero por terminado de escribir
+ESPERA_ESTABLE = 2.0
+TAM_COLA = 100
+
+def es_csv_vigilado(ruta):
+    """Indica si 'ruta' es un CSV (también comprimido) y no uno de los ficheros que escribe el vigilante."""
+    nombre = os.path.basename(ruta).lower()
+    for extension in EXTENSIONES:
+        if nombre.endswith(extension):
+            nombre = nombre[:-len(extension)]
+            break
+    if nombre.startswith('.') or '_limpio.' in nombre:
+        return False
+    return nombre.endswith(EXTENSIONES_CSV)
+
+def _firma(ruta):
+    """(tamaño, fecha de modificación) de un fichero, o None si ya no existe."""
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        return None
+    return estado.st_size, estado.st_mtime_ns
+
+def _ignorar_interrupciones():
+    """Inicializador de los procesos de validación: Ctrl+C lo atiende solo el proceso principal, que cierra el pool."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _escribir_json(ruta, datos):
+    """Escribe el JSON en un temporal y lo renombra, para que nadie lea un resultado a medias."""
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta) or '.', prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.remove(temporal)
+        raise
+
+def procesar_fichero(ruta_csv, options, directorio_limpios=None):
+    """
+    Valida un fichero (y escribe su CSV limpio en 'directorio_limpios', si se indica) y guarda
+    los resultados serializados en '<ruta_csv>.validacion.json'. Devuelve esos resultados.
+    Se ejecuta en los procesos del vigilante, así que no debe depender de estado compartido.
+    """
+    inicio = time.perf_counter()
+    try:
+        if directorio_limpios:
+            os.makedirs(directorio_limpios, exist_ok=True)
+            ruta_destino = os.path.join(directorio_limpios, nombre_limpio(ruta_csv))
+            resultados, resumen_limpieza = validar_y_limpiar(ruta_csv, ruta_destino, options)
+            resumen_limpieza['ruta_destino'] = ruta_destino
+            resultados['limpieza'] = resumen_limpieza
+        else:
+            resultados = realizar_validacion_completa(ruta_csv, options)
+    except Exception:
+        logger.critical(f"Error inesperado al procesar {ruta_csv} desde el vigilante.", exc_info=True)
+        resultados = crear_resultados_vacios(ruta_csv)
+        resultados['error_lectura'] = MENSAJE_ERROR_CRITICO
+
+    serializable = serializar_resultados(resultados)
+    serializable['segundos'] = round(time.perf_counter() - inicio, 3)
+    serializable['ruta_resultado'] = ruta_csv + SUFIJO_RESULTADO
+    try:
+        _escribir_json(serializable['ruta_resultado'], serializable)
+    except OSError:
+        logger.error(f"No se pudo escribir {serializable['ruta_resultado']}.", exc_info=True)
+        serializable['ruta_resultado'] = None
+    return serializable
+
+class _ManejadorEventos(FileSystemEventHandler):
+    """Traslada al vigilante los ficheros creados, modificados o renombrados."""
+    def __init__(self, vigilante):
+        self.vigilante = vigilante
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.vigilante.notificar(event.dest_path)
+
+class Vigilante:
+    """
+    Servicio que vigila uno o varios directorios y valida cada CSV nuevo o modificado.
+    - Un fichero solo se encola cuando lleva 'espera' segundos sin cambiar de tamaño ni de
+      fecha, para no validar ficheros que aún se están copiando. Los eventos repetidos de un
+      mismo fichero se agrupan en uno.
+    - La cola tiene como mucho 'tam_cola' ficheros: si se llena, los nuevos esperan en la lista
+      de pendientes (uno por ruta) en lugar de acumular trabajo, y como mucho hay 'workers'
+      validaciones a la vez, cada una en su propio proceso.
+    - Cada resultado se escribe en '<fichero>.validacion.json' (ver procesar_fichero) y, si se
+      indica, se llama a 'al_procesar' con él desde el hilo que lo ha validado.
+    Un fichero se vuelve a validar solo si cambia su tamaño o su fecha de modificación.
+    """
+    def __init__(self, directorios, options, workers=1, tam_cola=TAM_COLA, espera=ESPERA_ESTABLE,
+                 directorio_limpios=None, recursivo=False, procesar_existentes=True, al_procesar=None):
+        self.directorios = [os.path.abspath(directorio) for directorio in directorios]
+        self.options = options
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.espera = espera
+        self.directorio_limpios = directorio_limpios
+        self.recursivo = recursivo
+        self.procesar_existentes = procesar_existentes
+        self.al_procesar = al_procesar
+
+        self.cola = queue.Queue(maxsize=tam_cola)
+        self._pendientes = {}
+        self._procesados = {}
+        self._cerrojo = threading.Lock()
+        self._detenido = threading.Event()
+        self._hilos = []
+        self._observador = None
+        self._ejecutor = None
+
+    def notificar(self, ruta):
+        """Registra un cambio en 'ruta'. Se puede llamar desde cualquier hilo."""
+        if not es_csv_vigilado(ruta):
+            return
+        with self._cerrojo:
+            self._pendientes[os.path.abspath(ruta)] = (time.monotonic(), _firma(ruta))
+
+    def _buscar_existentes(self):
+        """Encola los CSV ya presentes cuyo resultado falta o es anterior al propio fichero."""
+        for directorio in self.directorios:
+            for raiz, subdirectorios, nombres in os.walk(directorio):
+                if not self.recursivo:
+                    subdirectorios.clear()
+                for nombre in nombres:
+                    ruta = os.path.join(raiz, nombre)
+                    if not es_csv_vigilado(ruta):
+                        continue
+                    try:
+                        if os.path.getmtime(ruta + SUFIJO_RESULTADO) >= os.path.getmtime(ruta):
+                            continue
+                    except OSError:
+                        pass
+                    self.notificar(ruta)
+
+    def _planificar(self):
+        """Hilo que pasa a la cola los ficheros que ya han dejado de cambiar."""
+        intervalo = max(0.05, min(self.espera / 4, 1.0))
+        while not self._detenido.wait(intervalo):
+            ahora = time.monotonic()
+            with self._cerrojo:
+                candidatos = [(ruta, firma) for ruta, (instante, firma) in self._pendientes.items()
+                              if ahora - instante >= self.espera]
+            for ruta, firma in candidatos:
+                firma_actual = _firma(ruta)
+                with self._cerrojo:
+                    if self._pendientes.get(ruta, (None, None))[1] != firma:
+                        # Ha llegado otro evento mientras tanto
+                        continue
+                    if firma_actual is None:
+                        del self._pendientes[ruta]
+                        continue
+                    if firma_actual != firma:
+                        self._pendientes[ruta] = (time.monotonic(), firma_actual)
+                        continue
+                    if self._procesados.get(ruta) == firma_actual:
+                        del self._pendientes[ruta]
+                        continue
+                # Con la cola llena se espera aquí: los eventos siguen agrupándose en _pendientes
+                while not self._detenido.is_set():
+                    try:
+                        self.cola.put((ruta, firma_actual), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                else:
+                    return
+                with self._cerrojo:
+                    if self._pendientes.get(ruta, (None, None))[1] == firma:
+                        del self._pendientes[ruta]
+                    self._procesados[ruta] = firma_actual
+
+    def _trabajar(self):
+        """Hilo que valida los ficheros de la cola en el grupo de procesos, de uno en uno."""
+        while True:
+            elemento = self.cola.get()
+            if elemento is None:
+                return
+            ruta, firma = elemento
+            logger.info(f"Validando {ruta} (en cola: {self.cola.qsize()}).")
+            try:
+                resultado = self._ejecutor.submit(procesar_fichero, ruta, self.options, self.directorio_limpios).result()
+            except Exception:
+                logger.critical(f"El proceso que validaba {ruta} terminó de forma inesperada.", exc_info=True)
+                with self._cerrojo:
+                    self._procesados.pop(ruta, None)
+                continue
+            if _firma(ruta) != firma:
+                # Ha cambiado durante la validación: se volverá a validar cuando se estabilice
+                self.notificar(ruta)
+            if self.al_procesar is not None:
+                try:
+                    self.al_procesar(resultado)
+                except Exception:
+                    logger.error("Error en el callback al_procesar del vigilante.", exc_info=True)
+
+    def iniciar(self):
+        """Arranca la vigilancia, el planificador y los workers. Vuelve inmediatamente."""
+        self._ejecutor = ProcessPoolExecutor(max_workers=self.workers, initializer=_ignorar_interrupciones)
+        manejador = _ManejadorEventos(self)
+        self._observador = Observer()
+        for directorio in self.directorios:
+            self._observador.schedule(manejador, directorio, recursive=self.recursivo)
+        self._observador.start()
+        if self.procesar_existentes:
+            self._buscar_existentes()
+
+        self._hilos = [threading.Thread(target=self._planificar, name="vigilante-planificador", daemon=True)]
+        self._hilos += [threading.Thread(target=self._trabajar, name=f"vigilante-worker-{i}", daemon=True)
+                        for i in range(self.workers)]
+        for hilo in self._hilos:
+            hilo.start()
+        logger.info(f"Vigilando {', '.join(self.directorios)} con {self.workers} workers y cola de {self.cola.maxsize}.")
+
+    def detener(self):
+        """Deja de vigilar, descarta lo que quede en cola y espera a que terminen las validaciones en curso."""
+        self._detenido.set()
+        if self._observador is not None:
+            self._observador.stop()
+            self._observador.join()
+        if self._hilos:
+            # El planificador sale en cuanto ve la señal, y ya no encolará nada más
+            self._hilos[0].join()
+        while True:
+            try:
+                self.cola.get_nowait()
+            except queue.Empty:
+                break
+        for _ in range(self.workers):
+            self.cola.put(None)
+        for hilo in self._hilos[1:]:
+            hilo.join()
+        if self._ejecutor is not None:
+            self._ejecutor.shutdown()
+        logger.info("Vigilancia detenida.")
+
+    def esperar(self, timeout=None):
+        """Bloquea hasta que se llame a detener() (o pase 'timeout'). Devuelve True si se ha detenido."""
+        return self._detenido.wait(timeout)